@@ -1,8 +1,17 @@
 import os
-from typing import Iterator, Dict, Optional
-from openai import OpenAI, APIError
+import sys
+from pathlib import Path
+from typing import Iterator, Optional
+from openai import APIError
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # 直接运行脚本时也能导入 evalai
+from evalai.events import StreamEvent, REASONING, TEXT, USAGE, iter_chat_events
+from evalai.limits import OutputLimits, Truncated, limit_events
+from evalai.metrics import StreamMetrics, format_metrics
+from evalai.estimate import estimate_prompt_tokens
+from evalai.transport import registry
+
 load_dotenv()
 
 # --- 配置参数 ---
@@ -32,7 +41,7 @@ class DeepSeekReasonerStream:
         if not self.api_key:
             raise DeepSeekReasonerError("缺少 DEEPSEEK_API_KEY")
         
-        self.client = OpenAI(api_key=self.api_key, base_url=base_url or "https://api.deepseek.com")
+        self.client = registry.openai_client(self.api_key, base_url or "https://api.deepseek.com")
         self.model = model or model_name
         self.system = system or system_message
 
@@ -44,9 +53,10 @@ class DeepSeekReasonerStream:
         self,
         prompt: str,
         max_tokens: Optional[int] = None,
+        limits: Optional[OutputLimits] = None,
         **extra,
-    ) -> Iterator[Dict]:
-        """流式输出推理过程和最终答案"""
+    ) -> Iterator[StreamEvent]:
+        """流式输出推理过程（REASONING）和最终答案（TEXT）；最后 yield 一个带时延指标的 USAGE 事件"""
         if max_tokens is not None:
             prompt = self._build_prompt_with_token_limit(prompt, max_tokens)
         
@@ -55,45 +65,73 @@ class DeepSeekReasonerStream:
             {"role": "user", "content": prompt},
         ]
         
+        metrics = StreamMetrics()
+        # 提示词里的 token 要求只是软约束；limits 会同时设置 max_tokens 并在客户端强制截断
+        params = {**limits.request_params(), **extra} if limits is not None else extra
         try:
             resp = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 stream=True,
-                **extra,
+                stream_options={"include_usage": True},
+                **params,
             )
             
-            for chunk in resp:
-                delta = chunk.choices[0].delta
-                result = {}
-                
-                if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
-                    result['reasoning'] = delta.reasoning_content
-                
-                if hasattr(delta, 'content') and delta.content:
-                    result['content'] = delta.content
-                
-                if result:
-                    yield result
+            events = iter_chat_events(resp, metrics)
+            if limits is not None:
+                events = limit_events(events, limits, metrics, estimate_prompt_tokens(messages, "deepseek-reasoner"), "deepseek-reasoner")
+            yield from events
                     
         except APIError as e:
             raise DeepSeekReasonerError(f"API请求失败: {e}")
 
-    def chat_stream(self, prompt: str, max_tokens: Optional[int] = None, **extra):
+    def consistency(self, prompt: str, k: int = 5, concurrency: Optional[int] = None, **extra):
+        """
+        一致性测试：同一个 prompt 并发采样 k 次
+
+        Args:
+            prompt: 用户提示词
+            k: 采样次数
+            concurrency: 同时进行的请求数，默认 k
+            **extra: 传给 stream() 的额外参数（例如 temperature）
+
+        Returns:
+            evalai.consistency.ConsistencyReport
+        """
+        from evalai.consistency import sample_stream  # 依赖 numpy，只在用到时导入
+
+        return sample_stream(self, prompt, k, concurrency, provider="deepseek-reasoner", **extra)
+
+    def chat_stream(
+        self, prompt: str, max_tokens: Optional[int] = None, limits: Optional[OutputLimits] = None, **extra
+    ):
         """发送流式聊天请求并显示输出"""
         print("正在向DeepSeek Reasoner发送请求并等待流式响应...")
         print("模型输出: ", end="", flush=True)
         
+        usage, metrics = None, None
         try:
-            for segment in self.stream(prompt, max_tokens=max_tokens, **extra):
-                if 'reasoning' in segment:
-                    print(f"\033[1;32m{segment['reasoning']}\033[0m", end="", flush=True)
+            for event in self.stream(prompt, max_tokens=max_tokens, limits=limits, **extra):
+                if event.kind == REASONING:
+                    print(f"\033[1;32m{event.text}\033[0m", end="", flush=True)
                 
-                if 'content' in segment:
-                    print(f"{segment['content']}", end="", flush=True)
+                elif event.kind == TEXT:
+                    print(event.text, end="", flush=True)
+
+                elif event.kind == USAGE:
+                    usage, metrics = event.usage, event.metrics
+                    if isinstance(event.data, Truncated):
+                        print(f"\n[输出已截断：超过 {event.data.reason}={event.data.limit}]", end="")
             
             print("\n" + "=" * 50)
             print("请求完成 ✓")
+            if usage:
+                print("Token 使用情况:")
+                print(f"  - 输入 Tokens: {usage['prompt_tokens']}")
+                print(f"  - 输出 Tokens: {usage['completion_tokens']}（其中推理 {usage.get('reasoning_tokens', 0)}）")
+                print(f"  - 总 Tokens: {usage['total_tokens']}")
+            print(format_metrics(metrics))
+            return usage
             
         except Exception as e:
             print(f"\n发生错误: {e}")
@@ -0,0 +1,6 @@
+"""
+evalai 共享组件
+
+各厂商脚本（qwen/、kimi/、deepseek/、gpt/ 等）之外的公共能力都放在这里，
+例如多模型并发对比引擎。模块按需单独导入，包本身不做任何预加载。
+"""
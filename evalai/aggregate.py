@@ -0,0 +1,418 @@
+"""
+请求日志的列式聚合（系统设计.md 中按日 / 周 / 月、按模型 / 用户的用量和费用趋势）
+
+把 api_requests 读成 NumPy 列数组：数值列统一存为 float64（token 数在 2^53 以内是精确的，求和时不必再转换类型），
+模型、用户、状态等分类列在读取时编码成整数。
+分组统计只做几次整列运算：多个分组维度按混合进制合成一个组号，求和与计数用 np.bincount，
+响应时间分位数把 (组号, 响应时间) 合成一个 int64 后整体排序一次再按组定位，不按行循环。
+千万级请求的一次分组汇总在一秒以内；从 SQLite 读取本身较慢，可以用 save() / load() 缓存成 .npz。
+
+需要安装 NumPy（pip install numpy）。
+
+用法：
+    table = RequestTable.from_sqlite("requests.sqlite3")
+    table.apply_prices()
+    for row in table.rollup(by=("model",), period="day").rows():
+        ...
+
+    python -m evalai.aggregate requests.sqlite3 --by model --period week
+"""
+import argparse
+import sqlite3
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("evalai.aggregate 需要安装 NumPy（pip install numpy）") from e
+
+from evalai.estimate import PRICES, ModelPrice
+
+CATEGORICAL = ("api_name", "model", "user_id", "prompt_category", "status")
+NUMERIC = (
+    "input_tokens", "thinking_tokens", "output_tokens", "total_tokens", "response_time",
+    "input_cost", "thinking_cost", "output_cost", "total_cost", "created_at",
+)
+TOKENS = ("input_tokens", "thinking_tokens", "output_tokens", "total_tokens")
+PERIODS = ("day", "week", "month")
+SUMMED = ("input_tokens", "thinking_tokens", "output_tokens", "total_tokens",
+          "input_cost", "thinking_cost", "output_cost", "total_cost")
+_DENSE_LIMIT = 1 << 22  # 组合数超过该值且远大于行数时改用 np.unique 分组
+
+
+class RequestTable:
+    """
+    列式存储的请求日志
+
+    Attributes:
+        columns: 列名 -> 数组；分类列是编码后的 int32
+        categories: 分类列名 -> 编码对应的原始值列表
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], categories: Dict[str, List[Any]]):
+        self.columns = columns
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.columns["created_at"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    # ------------- 读取 -------------
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[Any]], chunk_size: int = 200_000) -> "RequestTable":
+        """
+        由按 CATEGORICAL + NUMERIC 顺序排列的行构建
+
+        Args:
+            rows: 行迭代器（如 SQLite 游标）
+            chunk_size: 每次转换的行数；数值列按块整体转换为数组
+
+        Returns:
+            RequestTable
+        """
+        names = CATEGORICAL + NUMERIC
+        codebooks: List[Dict[Any, int]] = [{} for _ in CATEGORICAL]
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+        rows = iter(rows)
+        while True:
+            chunk = [row for _, row in zip(range(chunk_size), rows)]
+            if not chunk:
+                break
+            values = list(zip(*chunk))
+            for i, name in enumerate(CATEGORICAL):
+                codebook = codebooks[i]
+                setdefault = codebook.setdefault
+                parts[name].append(np.fromiter(
+                    (setdefault(v, len(codebook)) for v in values[i]), dtype=np.int32, count=len(chunk)
+                ))
+            for i, name in enumerate(NUMERIC, len(CATEGORICAL)):
+                parts[name].append(np.array(values[i], dtype=np.float64))
+            if len(chunk) < chunk_size:
+                break
+        columns = {}
+        for name in names:
+            dtype = np.int32 if name in CATEGORICAL else np.float64
+            columns[name] = np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+        categories = {name: list(codebook) for name, codebook in zip(CATEGORICAL, codebooks)}
+        return cls(columns, categories)
+
+    @classmethod
+    def from_sqlite(
+        cls,
+        path: Union[str, Path],
+        where: Optional[str] = None,
+        params: Sequence[Any] = (),
+        chunk_size: int = 200_000,
+    ) -> "RequestTable":
+        """
+        读取 RequestLogWriter 写入的 api_requests 表
+
+        Args:
+            path: SQLite 文件路径
+            where: 可选的 WHERE 条件，例如 "created_at >= ?"
+            params: where 中的参数
+            chunk_size: 每次读取的行数
+
+        Returns:
+            RequestTable
+        """
+        sql = f"SELECT {', '.join(CATEGORICAL + NUMERIC)} FROM api_requests"
+        if where:
+            sql += f" WHERE {where}"
+        conn = sqlite3.connect(str(path))
+        try:
+            cursor = conn.execute(sql, tuple(params))
+            cursor.arraysize = chunk_size
+
+            def rows():
+                while True:
+                    batch = cursor.fetchmany()
+                    if not batch:
+                        return
+                    yield from batch
+
+            return cls.from_rows(rows(), chunk_size)
+        finally:
+            conn.close()
+
+    @classmethod
+    def from_records(cls, records: Iterable[Any]) -> "RequestTable":
+        """由 RequestRecord 列表构建（主要用于还没落盘的记录）"""
+        names = CATEGORICAL + NUMERIC
+        return cls.from_rows(tuple(getattr(record, name) for name in names) for record in records)
+
+    def save(self, path: Union[str, Path]):
+        """保存为 .npz，之后用 load() 读取，比重新查询 SQLite 快得多"""
+        arrays = dict(self.columns)
+        for name, values in self.categories.items():
+            arrays[f"categories.{name}"] = np.array(values, dtype=object)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "RequestTable":
+        """读取 save() 保存的 .npz"""
+        with np.load(path, allow_pickle=True) as data:
+            columns = {name: data[name] for name in data.files if not name.startswith("categories.")}
+            categories = {name: data[f"categories.{name}"].tolist() for name in CATEGORICAL}
+        return cls(columns, categories)
+
+    # ------------- 变换 -------------
+    def filter(self, mask: np.ndarray) -> "RequestTable":
+        """
+        按布尔掩码筛选行
+
+        Args:
+            mask: 与表等长的布尔数组，例如 table["created_at"] >= since
+
+        Returns:
+            新的 RequestTable（分类编码表共用）
+        """
+        return RequestTable({name: column[mask] for name, column in self.columns.items()}, self.categories)
+
+    def code_of(self, name: str, value: Any) -> int:
+        """分类列中某个值的编码，不存在时返回 -1"""
+        try:
+            return self.categories[name].index(value)
+        except ValueError:
+            return -1
+
+    def apply_prices(self, prices: Optional[Dict[str, ModelPrice]] = None):
+        """
+        按单价表重新计算各项费用（元）；不在单价表中的模型保留原有费用
+
+        思考 token 按输出单价计费。
+
+        Args:
+            prices: 模型名 -> ModelPrice，默认使用 evalai.estimate.PRICES
+        """
+        if not len(self):
+            return
+        prices = PRICES if prices is None else prices
+        models = self.categories["model"]
+        # 单价按模型编码查表，整列一次完成
+        known = np.array([model in prices for model in models], dtype=bool)
+        input_price = np.array([prices[m].input if m in prices else 0.0 for m in models]) / 1e6
+        output_price = np.array([prices[m].output if m in prices else 0.0 for m in models]) / 1e6
+        code = self.columns["model"]
+        priced = known[code]
+        columns = self.columns
+        for cost_name, tokens_name, price in (
+            ("input_cost", "input_tokens", input_price),
+            ("thinking_cost", "thinking_tokens", output_price),
+            ("output_cost", "output_tokens", output_price),
+        ):
+            columns[cost_name] = np.where(priced, columns[tokens_name] * price[code], columns[cost_name])
+        columns["total_cost"] = columns["input_cost"] + columns["thinking_cost"] + columns["output_cost"]
+
+    # ------------- 汇总 -------------
+    def _period_codes(self, period: str, utc_offset: int) -> Tuple[np.ndarray, List[str]]:
+        # 整数运算比浮点和 datetime64 转换快得多；周、月由「日 -> 周期」查找表映射
+        days = (self.columns["created_at"].astype(np.int64) + utc_offset) // 86400
+        if not len(days):
+            return days, []
+        first_day = int(days.min())
+        days -= first_day
+        epoch = date(1970, 1, 1)
+        calendar = [epoch + timedelta(days=d) for d in range(first_day, first_day + int(days.max()) + 1)]
+        if period == "day":
+            return days, [d.isoformat() for d in calendar]
+        if period == "week":
+            starts = [d - timedelta(days=d.weekday()) for d in calendar]
+        else:
+            starts = [d.replace(day=1) for d in calendar]
+        labels: List[str] = []
+        lookup = np.empty(len(calendar), dtype=np.int64)
+        for i, start in enumerate(starts):
+            if not labels or labels[-1] != start:
+                labels.append(start)
+            lookup[i] = len(labels) - 1
+        fmt = date.isoformat if period == "week" else (lambda d: d.strftime("%Y-%m"))
+        return lookup[days], [fmt(d) for d in labels]
+
+    def rollup(
+        self,
+        by: Sequence[str] = ("model",),
+        period: Optional[str] = None,
+        percentiles: Sequence[float] = (50, 95, 99),
+        utc_offset: Optional[int] = None,
+    ) -> "Rollup":
+        """
+        分组汇总
+
+        Args:
+            by: 分组的分类列，取自 CATEGORICAL
+            period: 时间粒度 "day" / "week" / "month"，None 表示不按时间分组
+            percentiles: 要计算的响应时间分位（只统计成功的请求）
+            utc_offset: 划分日期时使用的 UTC 偏移（秒），None 时使用本机时区
+
+        Returns:
+            Rollup
+        """
+        for name in by:
+            if name not in CATEGORICAL:
+                raise ValueError(f"不支持按 {name} 分组，可选: {', '.join(CATEGORICAL)}")
+        if period is not None and period not in PERIODS:
+            raise ValueError(f"period 必须是 {', '.join(PERIODS)} 之一")
+        if utc_offset is None:
+            utc_offset = time.localtime().tm_gmtoff
+
+        dims: List[Tuple[str, np.ndarray, List[Any]]] = [
+            (name, self.columns[name], self.categories[name]) for name in by
+        ]
+        if period is not None:
+            codes, labels = self._period_codes(period, utc_offset)
+            dims.append((period, codes, labels))
+
+        n = len(self)
+        key = None
+        size = 1
+        for _, codes, labels in dims:
+            key = codes.astype(np.int64) if key is None else key * len(labels) + codes
+            size *= max(len(labels), 1)
+        if key is None:
+            key = np.zeros(n, dtype=np.int64)
+        columns = self.columns
+        status = columns["status"]
+        statuses = max(len(self.categories["status"]), 1)
+        if size <= max(_DENSE_LIMIT, 4 * n):
+            # 组合数不大时直接以组合编号为下标计数，不排序也不重新编号，最后只取出现过的组
+            group, slots = key, size
+            by_status = np.bincount(key * statuses + status, minlength=size * statuses).reshape(size, statuses)
+            present = np.flatnonzero(by_status.any(axis=1))
+            by_status = by_status[present]
+            take: Optional[np.ndarray] = present
+        else:
+            present, group = np.unique(key, return_inverse=True)
+            slots = len(present)
+            by_status = np.bincount(group * statuses + status, minlength=slots * statuses).reshape(slots, statuses)
+            take = None
+        groups = len(present)
+
+        def total(weights: np.ndarray) -> np.ndarray:
+            summed = np.bincount(group, weights=weights, minlength=slots)
+            return summed if take is None else summed[take]
+
+        # 把组号还原成各维度的编码
+        keys: Dict[str, List[Any]] = {}
+        rest = present
+        for name, _, labels in reversed(dims):
+            rest, code = np.divmod(rest, len(labels))
+            keys[name] = [labels[c] for c in code.tolist()]
+        keys = {name: keys[name] for name, _, _ in dims}
+
+        # 请求数和各状态的计数来自同一次 (组, 状态) 计数
+        metrics: Dict[str, np.ndarray] = {"requests": by_status.sum(axis=1)}
+        for value in ("success", "failed", "timeout"):
+            code = self.code_of("status", value)
+            metrics[value] = by_status[:, code] if code >= 0 else np.zeros(groups, dtype=np.int64)
+        for name in SUMMED:
+            summed = total(columns[name])
+            metrics[name] = summed.astype(np.int64) if name in TOKENS else summed
+        with np.errstate(divide="ignore", invalid="ignore"):
+            metrics["cost_per_1k_tokens"] = metrics["total_cost"] / metrics["total_tokens"] * 1000
+            metrics["avg_response_time"] = total(columns["response_time"]) / metrics["requests"]
+
+        if percentiles:
+            success = self.code_of("status", "success")
+            mask = status == success
+            latency = np.clip(columns["response_time"][mask], 0, 0x7FFFFFFF).astype(np.int64)
+            # (组号, 响应时间) 合成一个整数，一次排序后每组的响应时间连续且有序
+            ordered = np.sort((group[mask] << 32) | latency)
+            owner = ordered >> 32
+            values = (ordered & 0xFFFFFFFF).astype(np.float64)
+            ids = present if take is not None else np.arange(groups)
+            starts = np.searchsorted(owner, ids, "left")
+            counts = np.searchsorted(owner, ids, "right") - starts
+            has = counts > 0
+            # 与 evalai.metrics.percentile 相同的线性插值；没有成功请求的组记为 NaN
+            last = np.maximum(starts + counts - 1, 0)
+            for q in percentiles:
+                pos = np.maximum(counts - 1, 0) * (q / 100)
+                lo = starts + pos.astype(np.int64)
+                if len(values):
+                    lo = np.minimum(lo, last)
+                    hi = np.minimum(lo + 1, last)
+                    result = values[lo] + (values[hi] - values[lo]) * (pos - np.floor(pos))
+                else:
+                    result = np.zeros(groups)
+                metrics[f"p{q:g}_response_time"] = np.where(has, result, np.nan)
+
+        return Rollup(keys, metrics)
+
+
+class Rollup:
+    """
+    分组汇总结果：keys 中是各组的分组值，metrics 中是与之对齐的指标数组
+    """
+
+    def __init__(self, keys: Dict[str, List[Any]], metrics: Dict[str, np.ndarray]):
+        self.keys = keys
+        self.metrics = metrics
+
+    def __len__(self):
+        return len(self.metrics["requests"])
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """转换为字典列表（指标转为 Python 数值，NaN 转为 None）"""
+        columns = {name: values for name, values in self.keys.items()}
+        for name, values in self.metrics.items():
+            columns[name] = [None if v != v else v for v in values.tolist()]
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*(columns[name] for name in names))]
+
+    def format(self) -> str:
+        """格式化为表格"""
+        headers = list(self.keys) + ["请求数", "失败", "总 tokens", "费用(元)", "元/千tokens", "平均(ms)"]
+        latency = [name for name in self.metrics if name.startswith("p") and name.endswith("_response_time")]
+        headers += [f"{name.split('_')[0]}(ms)" for name in latency]
+        lines = ["\t".join(headers)]
+        for row in self.rows():
+            cells = [str(row[name]) for name in self.keys]
+            cells += [
+                str(row["requests"]),
+                str(row["failed"] + row["timeout"]),
+                str(row["total_tokens"]),
+                f"{row['total_cost']:.4f}",
+                f"{row['cost_per_1k_tokens']:.5f}" if row["cost_per_1k_tokens"] is not None else "-",
+                f"{row['avg_response_time']:.0f}",
+            ]
+            cells += [f"{row[name]:.0f}" if row[name] is not None else "-" for name in latency]
+            lines.append("\t".join(cells))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="api_requests 用量与费用汇总")
+    parser.add_argument("source", help="SQLite 日志库，或 --save 保存的 .npz")
+    parser.add_argument("--by", nargs="*", default=["model"], choices=CATEGORICAL, help="分组列")
+    parser.add_argument("--period", choices=PERIODS, default=None, help="按日 / 周 / 月分组")
+    parser.add_argument("--since", default=None, help="起始日期（YYYY-MM-DD）")
+    parser.add_argument("--reprice", action="store_true", help="按 evalai.estimate.PRICES 重新计算费用")
+    parser.add_argument("--save", metavar="NPZ", default=None, help="把读取的列数据保存为 .npz")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.source.endswith(".npz"):
+        table = RequestTable.load(args.source)
+    else:
+        table = RequestTable.from_sqlite(args.source)
+    loaded = time.perf_counter()
+    if args.save:
+        table.save(args.save)
+    if args.since:
+        since = time.mktime(time.strptime(args.since, "%Y-%m-%d"))
+        table = table.filter(table["created_at"] >= since)
+    if args.reprice:
+        table.apply_prices()
+    result = table.rollup(by=args.by, period=args.period)
+    print(result.format())
+    print(f"\n{len(table)} 条请求，读取 {loaded - started:.2f}s，汇总 {time.perf_counter() - loaded:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,550 @@
+"""
+Assistants API 编排（qwen/assis-api、gpt/assis-api）
+
+原来的脚本每次运行都新建 assistant 和 thread，然后在 Runs.wait 上阻塞一个线程直到完成。这里改为：
+    - assistant 按配置（模型、指令、工具）和 API 密钥的哈希缓存 ID，并持久化到本地 JSON，
+      配置不变就一直复用；缓存的 ID 在厂商侧已被删除时自动重建一次
+    - OpenAI 使用 create_and_run 流式运行：建 thread、发消息、运行合并为一个请求，文本边生成边返回
+    - DashScope 的 SDK 是同步的且没有异步流式运行，所有进行中的 run 由同一个轮询协程按各自的退避间隔查询状态，
+      不再为每个 run 占用一个阻塞线程
+    - 传入 thread_id 时在已有 thread 上继续对话（多轮评测复用同一个 thread）
+
+用法：
+    config = AssistantConfig(model="qwen-max", instructions="You are a helpful assistant.")
+    async with AssistantRunner(DashScopeAssistants()) as runner:
+        results = await runner.run_many(config, prompts)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from evalai.events import ERROR, TEXT, USAGE, StreamEvent
+from evalai.metrics import StreamMetrics
+from evalai.transport import registry
+
+DEFAULT_STORE = Path.home() / ".evalai" / "assistants.json"
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+
+class AssistantError(Exception):
+    """Assistants API 调用失败"""
+    pass
+
+
+class AssistantNotFound(AssistantError):
+    """缓存的 assistant 在厂商侧已不存在"""
+    pass
+
+
+@dataclass(frozen=True)
+class AssistantConfig:
+    """
+    assistant 配置，决定缓存键
+
+    Attributes:
+        model: 模型名称
+        instructions: 系统指令
+        name: 名称
+        description: 描述
+        tools: 工具定义列表
+    """
+    model: str
+    instructions: str = "You are a helpful assistant."
+    name: str = "evalai assistant"
+    description: Optional[str] = None
+    tools: Tuple[Dict[str, Any], ...] = ()
+
+    def key(self, backend: str, api_key: str) -> str:
+        """缓存键：厂商、密钥摘要和配置内容的哈希"""
+        payload = json.dumps({"backend": backend, **asdict(self)}, sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+        return f"{backend}:{digest}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]}"
+
+
+class AssistantStore:
+    """
+    assistant ID 的本地持久化缓存（JSON 文件，原子替换写入）
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = DEFAULT_STORE):
+        """
+        Args:
+            path: JSON 文件路径，None 表示只在内存中缓存
+        """
+        self.path = Path(path).expanduser() if path is not None else None
+        self._ids: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            try:
+                self._ids = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._ids = {}  # 文件损坏时当作空缓存，之后会被覆盖
+
+    def get(self, key: str) -> Optional[str]:
+        return self._ids.get(key)
+
+    def put(self, key: str, assistant_id: str):
+        with self._lock:
+            self._ids[key] = assistant_id
+            self._save()
+
+    def discard(self, key: str):
+        with self._lock:
+            if self._ids.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self._ids, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+@dataclass
+class AssistantRun:
+    """USAGE 事件的 data：本次运行所在的 thread 和 run"""
+    thread_id: Optional[str] = None
+    run_id: Optional[str] = None
+    status: Optional[str] = None
+
+
+@dataclass
+class AssistantResult:
+    """
+    单次 assistant 运行的结果
+    """
+    prompt: str
+    text: str = ""
+    usage: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+    status: Optional[str] = None
+    thread_id: Optional[str] = None
+    run_id: Optional[str] = None
+    metrics: StreamMetrics = field(default_factory=StreamMetrics)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _get(obj: Any, name: str, default: Any = None) -> Any:
+    # DashScope 返回的对象有时是 dict，有时是属性对象
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _usage(usage: Any) -> Optional[Dict[str, int]]:
+    if not usage:
+        return None
+    prompt = _get(usage, "prompt_tokens", _get(usage, "input_tokens", 0)) or 0
+    completion = _get(usage, "completion_tokens", _get(usage, "output_tokens", 0)) or 0
+    total = _get(usage, "total_tokens") or prompt + completion
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": total}
+
+
+class RunPoller:
+    """
+    用一个协程轮询所有进行中的 run
+
+    每个 run 有自己的查询间隔：状态没有变化时按 factor 逐步放大到 max_interval，状态变化后回到 min_interval。
+    同一时刻到期的 run 并发查询，数量受 concurrency 限制。
+    """
+
+    def __init__(
+        self,
+        retrieve: Callable[[str, str], Awaitable[Any]],
+        min_interval: float = 0.25,
+        max_interval: float = 5.0,
+        factor: float = 1.5,
+        concurrency: int = 16,
+        max_errors: int = 5,
+    ):
+        """
+        Args:
+            retrieve: retrieve(thread_id, run_id) -> run 对象（需要有 status 属性）
+            min_interval: 最短查询间隔（秒）
+            max_interval: 最长查询间隔（秒）
+            factor: 状态不变时间隔的放大倍数
+            concurrency: 同时进行的查询数上限
+            max_errors: 同一个 run 连续查询失败多少次后放弃
+        """
+        self.retrieve = retrieve
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.max_errors = max_errors
+        self.polls = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: Dict[Tuple[str, str], List[Any]] = {}  # (thread_id, run_id) -> [future, 间隔, 下次查询时间, 状态, 失败次数]
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def wait(self, thread_id: str, run_id: str) -> Any:
+        """
+        等待 run 进入终止状态
+
+        Returns:
+            最后一次查询到的 run 对象
+        """
+        key = (thread_id, run_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            future = asyncio.get_running_loop().create_future()
+            entry = self._pending[key] = [future, self.min_interval, time.monotonic() + self.min_interval, None, 0]
+            self._wakeup.set()
+            if self._task is None or self._task.done():
+                self._task = asyncio.ensure_future(self._loop())
+        return await asyncio.shield(entry[0])
+
+    async def _poll(self, key: Tuple[str, str], entry: List[Any]):
+        future = entry[0]
+        async with self._semaphore:
+            self.polls += 1
+            try:
+                run = await self.retrieve(*key)
+            except Exception as e:
+                entry[4] += 1
+                if entry[4] >= self.max_errors:
+                    self._pending.pop(key, None)
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+                status, run = entry[3], None
+            else:
+                entry[4] = 0
+                status = _get(run, "status")
+        if status in TERMINAL_STATUSES:
+            self._pending.pop(key, None)
+            if not future.done():
+                future.set_result(run)
+            return
+        if status != entry[3]:
+            entry[1] = self.min_interval
+        else:
+            entry[1] = min(entry[1] * self.factor, self.max_interval)
+        entry[3] = status
+        entry[2] = time.monotonic() + entry[1]
+
+    async def _loop(self):
+        while self._pending:
+            now = time.monotonic()
+            due = [(key, entry) for key, entry in self._pending.items() if entry[2] <= now]
+            if due:
+                await asyncio.gather(*(self._poll(key, entry) for key, entry in due))
+                continue
+            self._wakeup.clear()
+            delay = min(entry[2] for entry in self._pending.values()) - now
+            try:
+                # 新的 run 加入时提前醒来
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+class OpenAIAssistants:
+    """
+    OpenAI Assistants API（异步客户端，流式运行）
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, proxy: Optional[str] = None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise AssistantError("缺少 OPENAI_API_KEY")
+        self.client = registry.async_openai_client(self.api_key, base_url, proxy=proxy or os.getenv("OPENAI_PROXY"))
+
+    async def create_assistant(self, config: AssistantConfig) -> str:
+        assistant = await self.client.beta.assistants.create(
+            model=config.model,
+            name=config.name,
+            description=config.description,
+            instructions=config.instructions,
+            tools=list(config.tools),
+        )
+        return assistant.id
+
+    async def _assistant_exists(self, assistant_id: str) -> bool:
+        from openai import NotFoundError
+
+        try:
+            await self.client.beta.assistants.retrieve(assistant_id)
+        except NotFoundError:
+            return False
+        return True
+
+    async def stream(
+        self, assistant_id: str, prompt: str, thread_id: Optional[str], metrics: StreamMetrics, params: Dict
+    ) -> AsyncIterator[StreamEvent]:
+        from openai import NotFoundError
+
+        message = {"role": "user", "content": prompt}
+        metrics.mark_sent()
+        try:
+            if thread_id is None:
+                resp = await self.client.beta.threads.create_and_run(
+                    assistant_id=assistant_id, thread={"messages": [message]}, stream=True, **params
+                )
+            else:
+                resp = await self.client.beta.threads.runs.create(
+                    thread_id, assistant_id=assistant_id, additional_messages=[message], stream=True, **params
+                )
+        except NotFoundError as e:
+            # 已有 thread 上的 404 可能是 thread 不存在，也可能是 assistant 被删除；只有后者需要重建
+            if thread_id is None or not await self._assistant_exists(assistant_id):
+                raise AssistantNotFound(str(e)) from e
+            raise
+
+        run = AssistantRun(thread_id)
+        usage = None
+        try:
+            async for event in resp:
+                kind = event.event
+                if kind == "thread.message.delta":
+                    for block in event.data.delta.content or ():
+                        text = getattr(getattr(block, "text", None), "value", None)
+                        if text:
+                            yield StreamEvent(TEXT, text, metrics.mark_answer())
+                elif kind == "thread.created":
+                    run.thread_id = event.data.id
+                elif kind == "thread.run.created":
+                    run.run_id = event.data.id
+                elif kind.startswith("thread.run.") and event.data.status in TERMINAL_STATUSES:
+                    run.status = event.data.status
+                    usage = _usage(event.data.usage)
+                    if run.status != "completed":
+                        error = event.data.last_error
+                        yield StreamEvent(ERROR, f"run {run.status}: {error.message if error else ''}".strip(), time.perf_counter())
+                elif kind == "error":
+                    yield StreamEvent(ERROR, str(event.data), time.perf_counter())
+        finally:
+            await resp.close()
+        metrics.finish(usage["completion_tokens"] if usage else None)
+        yield StreamEvent(USAGE, ts=metrics.finished_at, usage=usage, metrics=metrics, data=run)
+
+
+class DashScopeAssistants:
+    """
+    阿里云百炼 Assistants API（同步 SDK，调用放到线程池执行，完成状态由 RunPoller 统一轮询）
+    """
+
+    name = "dashscope"
+
+    def __init__(self, api_key: Optional[str] = None, poller: Optional[RunPoller] = None):
+        self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+        if not self.api_key:
+            raise AssistantError("缺少 DASHSCOPE_API_KEY")
+        self._poller = poller
+
+    @property
+    def poller(self) -> RunPoller:
+        # 需要在事件循环中创建
+        if self._poller is None:
+            self._poller = RunPoller(self._retrieve)
+        return self._poller
+
+    async def _call(self, func: Callable, *args, **kwargs) -> Any:
+        result = await asyncio.to_thread(func, *args, api_key=self.api_key, **kwargs)
+        status_code = _get(result, "status_code")
+        if status_code is not None and status_code != 200:
+            message = f"{status_code} {_get(result, 'code', '')} {_get(result, 'message', '')}".strip()
+            if status_code == 404:
+                raise AssistantNotFound(message)
+            raise AssistantError(message)
+        return result
+
+    async def _retrieve(self, thread_id: str, run_id: str) -> Any:
+        from dashscope import Runs
+
+        return await self._call(Runs.retrieve, run_id, thread_id=thread_id)
+
+    async def create_assistant(self, config: AssistantConfig) -> str:
+        from dashscope import Assistants
+
+        kwargs = {"description": config.description} if config.description else {}
+        assistant = await self._call(
+            Assistants.create, model=config.model, name=config.name, instructions=config.instructions,
+            tools=list(config.tools), **kwargs,
+        )
+        return assistant.id
+
+    async def stream(
+        self, assistant_id: str, prompt: str, thread_id: Optional[str], metrics: StreamMetrics, params: Dict
+    ) -> AsyncIterator[StreamEvent]:
+        from dashscope import Assistants, Messages, Runs, Threads
+
+        message = {"role": "user", "content": prompt}
+        metrics.mark_sent()
+        if thread_id is None:
+            thread = await self._call(Threads.create, messages=[message])
+            thread_id = thread.id
+        else:
+            # 先确认 assistant 还在（不在时抛出 AssistantNotFound 由调用方重建），
+            # 否则消息已经发到 thread 上，重建后重试会把同一条用户消息再发一遍
+            await self._call(Assistants.retrieve, assistant_id)
+            await self._call(Messages.create, thread_id, content=prompt, role="user")
+        run = await self._call(Runs.create, thread_id, assistant_id=assistant_id, **params)
+        info = AssistantRun(thread_id, run.id)
+        finished = await self.poller.wait(thread_id, run.id)
+        info.status = _get(finished, "status")
+        if info.status == "completed":
+            messages = await self._call(Messages.list, thread_id, limit=20, order="desc")
+            for item in _get(messages, "data") or ():
+                if _get(item, "role") == "assistant" and _get(item, "run_id", run.id) == run.id:
+                    text = "".join(
+                        _get(_get(block, "text"), "value", "") or "" for block in _get(item, "content") or ()
+                    )
+                    if text:
+                        yield StreamEvent(TEXT, text, metrics.mark_answer())
+                    break
+        else:
+            error = _get(finished, "last_error")
+            yield StreamEvent(ERROR, f"run {info.status}: {_get(error, 'message', '') if error else ''}".strip(),
+                              time.perf_counter())
+        usage = _usage(_get(finished, "usage"))
+        metrics.finish(usage["completion_tokens"] if usage else None)
+        yield StreamEvent(USAGE, ts=metrics.finished_at, usage=usage, metrics=metrics, data=info)
+
+
+class AssistantRunner:
+    """
+    复用 assistant、并发执行大量 run 的编排器
+    """
+
+    def __init__(self, backend, store: Optional[AssistantStore] = None, concurrency: int = 32):
+        """
+        Args:
+            backend: OpenAIAssistants 或 DashScopeAssistants
+            store: assistant ID 缓存，None 时使用默认路径 ~/.evalai/assistants.json
+            concurrency: 同时进行的 run 数上限
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency 必须大于 0")
+        self.backend = backend
+        self.store = store if store is not None else AssistantStore()
+        self.concurrency = concurrency
+        self.created = 0
+        self._creating: Dict[str, "asyncio.Future[str]"] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await registry.aclose()
+
+    def _key(self, config: AssistantConfig) -> str:
+        return config.key(self.backend.name, self.backend.api_key)
+
+    async def assistant_id(self, config: AssistantConfig) -> str:
+        """
+        配置对应的 assistant ID，没有缓存时创建；同一配置的并发调用只会创建一次
+
+        Args:
+            config: assistant 配置
+
+        Returns:
+            assistant ID
+        """
+        key = self._key(config)
+        cached = self.store.get(key)
+        if cached is not None:
+            return cached
+        future = self._creating.get(key)
+        if future is None:
+            future = self._creating[key] = asyncio.ensure_future(self.backend.create_assistant(config))
+            try:
+                assistant_id = await future
+            finally:
+                del self._creating[key]
+            self.created += 1
+            self.store.put(key, assistant_id)
+            return assistant_id
+        return await future
+
+    async def stream(
+        self,
+        config: AssistantConfig,
+        prompt: str,
+        thread_id: Optional[str] = None,
+        metrics: Optional[StreamMetrics] = None,
+        **params,
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        运行一次并流式返回事件；最后一个事件为 USAGE，其 data 是 AssistantRun
+
+        Args:
+            config: assistant 配置
+            prompt: 用户消息
+            thread_id: 已有 thread，None 时新建
+            metrics: 时延记录，None 时新建
+            **params: 额外的 run 参数（如 max_completion_tokens）
+        """
+        metrics = metrics if metrics is not None else StreamMetrics()
+        for attempt in range(2):
+            assistant_id = await self.assistant_id(config)
+            started = False
+            try:
+                async for event in self.backend.stream(assistant_id, prompt, thread_id, metrics, params):
+                    started = True
+                    yield event
+                return
+            except AssistantNotFound:
+                # 缓存的 assistant 已在控制台被删除：清掉缓存重建一次
+                if started or attempt:
+                    raise
+                self.store.discard(self._key(config))
+
+    async def run(self, config: AssistantConfig, prompt: str, thread_id: Optional[str] = None, **params) -> AssistantResult:
+        """
+        运行一次并收集完整结果；失败记录在 error 中，不抛出异常
+
+        Args:
+            config: assistant 配置
+            prompt: 用户消息
+            thread_id: 已有 thread，None 时新建
+            **params: 额外的 run 参数
+
+        Returns:
+            AssistantResult
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        result = AssistantResult(prompt, thread_id=thread_id)
+        parts = []
+        async with self._semaphore:
+            try:
+                async for event in self.stream(config, prompt, thread_id, result.metrics, **params):
+                    if event.kind == TEXT:
+                        parts.append(event.text)
+                    elif event.kind == ERROR:
+                        result.error = event.text
+                    elif event.kind == USAGE:
+                        result.usage = event.usage
+                        run = event.data
+                        result.thread_id, result.run_id, result.status = run.thread_id, run.run_id, run.status
+            except Exception as e:
+                result.error = f"API 请求失败: {e}"
+            finally:
+                result.text = "".join(parts)
+                if result.metrics.finished_at is None:
+                    result.metrics.finish()
+        return result
+
+    async def run_many(self, config: AssistantConfig, prompts: Sequence[str], **params) -> List[AssistantResult]:
+        """
+        并发运行多个 prompt（每个 prompt 一个新 thread）
+
+        Returns:
+            与 prompts 顺序一致的 AssistantResult 列表
+        """
+        return list(await asyncio.gather(*(self.run(config, prompt, **params) for prompt in prompts)))
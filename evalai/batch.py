@@ -0,0 +1,404 @@
+"""
+Prompt 库批量运行器
+
+读取 JSONL/YAML 格式的 prompt 集合，对 prompt × 模型 的全部组合做有界并发调用，
+每完成一个请求就追加写入结果 JSONL。结果文件本身就是断点：重新运行时会跳过已经成功的组合，
+中途崩溃的大批量任务不必为已完成的调用重复付费。运行过程中定期打印吞吐量。
+
+prompt 文件格式：
+    JSONL：每行一个字符串，或 {"id": ..., "prompt": ..., "category": ..., "system": ...}
+    YAML：上述对象的列表，或 {分类: [prompt, ...]} 形式的分类库（需要安装 PyYAML）
+
+用法：
+    python -m evalai.batch prompts.jsonl -m qwen kimi deepseek-chat -o results.jsonl -c 8
+    python -m evalai.batch prompts.jsonl -m qwen kimi --dry-run   # 只预估 token 数和费用，不发请求
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from dotenv import load_dotenv
+
+from evalai.estimate import CostEstimate, format_projection, project
+from evalai.fanout import FanOutEngine
+from evalai.hedge import HedgePolicy
+from evalai.providers import ProviderSpec, get_provider
+from evalai.ratelimit import RateLimiter
+from evalai.requestlog import RequestLogWriter, RequestRecord
+from evalai.transport import registry
+
+
+class BatchError(Exception):
+    """批量运行相关异常"""
+    pass
+
+
+@dataclass(frozen=True)
+class PromptItem:
+    """prompt 库中的一条"""
+    id: str
+    prompt: str
+    category: Optional[str] = None
+    system: Optional[str] = None
+
+
+def _prompt_id(prompt: str) -> str:
+    # 没有显式 id 时按内容生成，prompt 文件调整顺序后断点依然有效
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def _to_item(raw: Union[str, Dict], category: Optional[str] = None) -> PromptItem:
+    if isinstance(raw, str):
+        return PromptItem(_prompt_id(raw), raw, category)
+    if not isinstance(raw, dict) or not raw.get("prompt"):
+        raise BatchError(f"无法识别的 prompt 条目: {raw!r}")
+    prompt = raw["prompt"]
+    return PromptItem(
+        str(raw.get("id") or _prompt_id(prompt)),
+        prompt,
+        raw.get("category", category),
+        raw.get("system"),
+    )
+
+
+def load_prompts(path: Union[str, Path]) -> List[PromptItem]:
+    """
+    读取 prompt 集合
+
+    Args:
+        path: .jsonl / .yaml / .yml 文件路径
+
+    Returns:
+        PromptItem 列表
+    """
+    path = Path(path)
+    if path.suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise BatchError("读取 YAML 需要安装 PyYAML（pip install pyyaml）") from e
+        data = yaml.safe_load(path.read_text(encoding="utf-8")) or []
+        if isinstance(data, dict):
+            return [_to_item(raw, category) for category, items in data.items() for raw in items or []]
+        return [_to_item(raw) for raw in data]
+
+    items = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                items.append(_to_item(json.loads(line)))
+    return items
+
+
+def load_checkpoint(path: Union[str, Path]) -> Set[Tuple[str, str]]:
+    """
+    从已有结果文件中读取已成功的 (prompt_id, 厂商:模型) 组合
+
+    崩溃时最后一行可能只写了一半，解析失败的行直接忽略。
+
+    Args:
+        path: 结果 JSONL 路径
+
+    Returns:
+        已完成组合的集合
+    """
+    done = set()
+    path = Path(path)
+    if not path.exists():
+        return done
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not record.get("error"):
+                done.add((record["prompt_id"], f"{record['provider']}:{record['model']}"))
+    return done
+
+
+def trim_torn_tail(path: Union[str, Path], block: int = 65536) -> int:
+    """
+    截掉崩溃时只写了一半的最后一行
+
+    续跑以追加方式打开结果文件，不截掉的话下一条记录会直接接在残行后面，两条一起无法解析，
+    之后每次续跑都会被重新请求（并重复计费）。
+
+    Args:
+        path: 结果 JSONL 路径
+        block: 从文件末尾向前查找换行符时每次读取的字节数
+
+    Returns:
+        截掉的字节数
+    """
+    path = Path(path)
+    if not path.exists():
+        return 0
+    with path.open("rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        keep, pos = 0, end
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            index = f.read(step).rfind(b"\n")
+            if index != -1:
+                keep = pos + index + 1
+                break
+        if keep < end:
+            f.truncate(keep)
+    return end - keep
+
+
+class Progress:
+    """批量运行的进度与吞吐统计"""
+
+    def __init__(self, total: int, skipped: int, interval: float = 5.0):
+        self.total = total
+        self.skipped = skipped
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.output_tokens = 0
+        self.started_at = time.perf_counter()
+        self._last_report = self.started_at
+
+    def record(self, record: Dict):
+        self.done += 1
+        if record.get("error"):
+            self.failed += 1
+        usage = record.get("usage")
+        if usage:
+            self.output_tokens += usage.get("completion_tokens") or 0
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            print(self.format(), flush=True)
+
+    def format(self) -> str:
+        elapsed = time.perf_counter() - self.started_at
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.done
+        eta = remaining / rate if rate > 0 else float("inf")
+        return (
+            f"[{self.done}/{self.total}] {rate:.2f} 请求/s, {self.output_tokens / elapsed if elapsed > 0 else 0:.0f} tokens/s, "
+            f"失败 {self.failed}, 已跳过 {self.skipped}, 预计剩余 {eta:.0f}s"
+        )
+
+
+class BatchRunner:
+    """
+    prompt × 模型 全组合的有界并发运行器
+    """
+
+    def __init__(
+        self,
+        providers: Iterable[Union[str, ProviderSpec]],
+        output: Union[str, Path],
+        concurrency: int = 8,
+        timeout: Optional[float] = None,
+        report_interval: float = 5.0,
+        request_log: Optional[RequestLogWriter] = None,
+        limiter: Optional[RateLimiter] = None,
+        hedge: Optional[HedgePolicy] = None,
+    ):
+        """
+        初始化批量运行器
+
+        Args:
+            providers: 厂商名称（支持 "厂商:模型"）或 ProviderSpec 列表
+            output: 结果 JSONL 路径，同时作为断点文件
+            concurrency: 同时进行的请求数上限
+            timeout: 单个请求的超时时间（秒）
+            report_interval: 打印进度的间隔（秒）
+            request_log: api_requests 日志器，每个请求结束后写入一条带分类的记录
+            limiter: 速率限制器，并发数较高时用它避免触发厂商限流
+            hedge: 对冲策略，用少量额外请求压低首 token 时间的长尾
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency 必须大于 0")
+        self.specs = [p if isinstance(p, ProviderSpec) else get_provider(p) for p in providers]
+        self.output = Path(output)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.report_interval = report_interval
+        self.request_log = request_log
+        self.limiter = limiter
+        self.hedge = hedge
+
+    def _jobs(self, prompts: List[PromptItem], done: Set[Tuple[str, str]]) -> List[Tuple[PromptItem, ProviderSpec]]:
+        return [
+            (item, spec)
+            for item in prompts
+            for spec in self.specs
+            if (item.id, f"{spec.name}:{spec.model}") not in done
+        ]
+
+    def project(self, prompts: List[PromptItem], **extra) -> List[CostEstimate]:
+        """
+        预估未完成组合的 token 数和费用（不发请求）
+
+        Args:
+            prompts: prompt 列表
+            **extra: 额外请求参数，其中的 max_tokens 作为每个请求的预估输出
+
+        Returns:
+            每个模型一行 CostEstimate
+        """
+        jobs = self._jobs(prompts, load_checkpoint(self.output))
+        max_output = extra.get("max_tokens", extra.get("max_output_tokens"))
+        return [
+            project(spec, [item for item, job_spec in jobs if job_spec is spec], max_output)
+            for spec in self.specs
+        ]
+
+    async def run(self, prompts: List[PromptItem], dry_run: bool = False, **extra) -> Progress:
+        """
+        运行全部未完成的组合
+
+        Args:
+            prompts: prompt 列表
+            dry_run: 只打印费用预估，不发请求
+            **extra: 额外请求参数
+
+        Returns:
+            最终的 Progress
+        """
+        done = load_checkpoint(self.output)
+        jobs = self._jobs(prompts, done)
+        skipped = len(prompts) * len(self.specs) - len(jobs)
+        progress = Progress(len(jobs), skipped, self.report_interval)
+        print(f"共 {len(prompts)} 个 prompt × {len(self.specs)} 个模型，待运行 {len(jobs)}，已完成跳过 {skipped}", flush=True)
+        if not jobs:
+            return progress
+        print(format_projection(self.project(prompts, **extra)), flush=True)
+        if dry_run:
+            return progress
+
+        queue: Iterator[Tuple[PromptItem, ProviderSpec]] = iter(jobs)
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        torn = trim_torn_tail(self.output)
+        if torn:
+            print(f"结果文件末尾有 {torn} 字节的残行（上次中断时未写完），已截掉", flush=True)
+        with self.output.open("a", encoding="utf-8") as out:
+            async with FanOutEngine(
+                self.specs, concurrency=self.concurrency, timeout=self.timeout, limiter=self.limiter, hedge=self.hedge
+            ) as engine:
+
+                async def worker():
+                    # 固定数量的 worker 从同一个迭代器取任务，上万个组合也不会一次性创建上万个协程
+                    for item, spec in queue:
+                        result = await engine.run_one(spec, item.prompt, item.system, **extra)
+                        record = {"prompt_id": item.id, "category": item.category, **result.to_dict()}
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        out.flush()
+                        progress.record(record)
+                        if self.request_log is not None:
+                            await self.request_log.alog(RequestRecord.from_result(
+                                result, item.prompt, item.category, api_key=os.getenv(spec.api_key_env)
+                            ))
+
+                await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(jobs)))))
+        print(progress.format(), flush=True)
+        if self.limiter is not None:
+            for provider, stats in self.limiter.stats().items():
+                print(
+                    f"  {provider}: 排队 {stats['waited']}/{stats['requests']} 次，"
+                    f"平均等待 {stats['avg_wait']:.2f}s，最长 {stats['max_wait']:.2f}s，429 {stats['rate_limited']} 次",
+                    flush=True,
+                )
+        if self.hedge is not None:
+            for provider, stats in self.hedge.stats().items():
+                print(
+                    f"  {provider}: 对冲 {stats['hedged']}/{stats['requests']} 次（{stats['hedge_rate']:.1%}），"
+                    f"对冲胜出 {stats['hedge_wins']} 次，额外约 {stats['extra_tokens']} tokens / {stats['extra_cost']:.4f} 元",
+                    flush=True,
+                )
+        return progress
+
+
+def run_batch(
+    prompts: Union[str, Path, List[PromptItem]],
+    providers: Iterable[Union[str, ProviderSpec]],
+    output: Union[str, Path],
+    concurrency: int = 8,
+    timeout: Optional[float] = None,
+    request_log: Optional[RequestLogWriter] = None,
+    limiter: Optional[RateLimiter] = None,
+    hedge: Optional[HedgePolicy] = None,
+    dry_run: bool = False,
+    **extra,
+) -> Progress:
+    """
+    同步入口：运行一批 prompt 并把结果写入 output
+
+    Args:
+        prompts: prompt 文件路径或 PromptItem 列表
+        providers: 厂商名称或 ProviderSpec 列表
+        output: 结果 JSONL 路径（断点文件）
+        concurrency: 同时进行的请求数上限
+        timeout: 单个请求的超时时间（秒）
+        request_log: api_requests 日志器
+        limiter: 速率限制器
+        hedge: 对冲策略
+        dry_run: 只打印费用预估，不发请求
+        **extra: 额外请求参数
+
+    Returns:
+        最终的 Progress
+    """
+    if not isinstance(prompts, list):
+        prompts = load_prompts(prompts)
+    runner = BatchRunner(
+        providers, output, concurrency=concurrency, timeout=timeout, request_log=request_log, limiter=limiter,
+        hedge=hedge,
+    )
+
+    async def _main():
+        try:
+            return await runner.run(prompts, dry_run=dry_run, **extra)
+        finally:
+            await registry.aclose()
+
+    return asyncio.run(_main())
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Prompt 库批量运行（可断点续跑）")
+    parser.add_argument("prompts", help="prompt 文件（.jsonl / .yaml）")
+    parser.add_argument("-m", "--models", nargs="+", required=True, help="参与运行的厂商，可写成 厂商:模型")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="结果 JSONL，同时作为断点文件")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="同时进行的请求数上限")
+    parser.add_argument("--timeout", type=float, default=None, help="单个请求的超时时间（秒）")
+    parser.add_argument("--log-db", metavar="PATH", default=None, help="把每个请求写入该 SQLite 库的 api_requests 表")
+    parser.add_argument("--rpm", type=float, default=None, help="每个 API 密钥每分钟最多请求数")
+    parser.add_argument("--tpm", type=float, default=None, help="每个 API 密钥每分钟最多 token 数（按 prompt 预估）")
+    parser.add_argument("--hedge", action="store_true", help="首 token 超过该厂商滚动 p95 时发出对冲请求")
+    parser.add_argument("--hedge-after", type=float, default=None, metavar="SECONDS", help="首 token 超过固定秒数时发出对冲请求")
+    parser.add_argument("--dry-run", action="store_true", help="只预估 token 数和费用，不发请求")
+    args = parser.parse_args()
+
+    hedge = HedgePolicy(delay=args.hedge_after) if args.hedge or args.hedge_after is not None else None
+    limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm) if args.rpm or args.tpm else None
+    request_log = RequestLogWriter(args.log_db).start() if args.log_db else None
+    try:
+        run_batch(
+            args.prompts, args.models, args.output,
+            concurrency=args.concurrency, timeout=args.timeout, request_log=request_log,
+            limiter=limiter, hedge=hedge, dry_run=args.dry_run,
+        )
+    finally:
+        if request_log is not None:
+            request_log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+基于本地模拟服务的基准测试
+
+模拟服务在独立子进程中运行，测量结果只反映本仓库（及 OpenAI SDK）在客户端一侧的开销：
+    - overhead: 各厂商类每个分片的 CPU 开销，与直接迭代 SDK 流的基线对比
+    - concurrency: 异步并发引擎在不同并发数下的 CPU 占用，推算单核可承载的并发流数
+    - memory: 各厂商类每个打开中的流占用的内存
+    - imports: 各入口在全新解释器中的导入耗时，以及导入了哪些厂商 SDK（不需要模拟服务）
+
+用法：
+    python -m evalai.bench
+    python -m evalai.bench --only overhead --providers qwen gpt --chunks 5000
+    python -m evalai.bench --only imports
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Dict, Iterable, List
+
+import httpx
+
+from evalai.fanout import FanOutEngine
+from evalai.providers import PROVIDERS, ROOT, get_provider, load_stream_class
+from evalai.transport import registry
+
+BENCH_PROVIDERS = [name for name, spec in PROVIDERS.items() if spec.script]
+MOCK_KEY = "mock"
+
+# 导入耗时测试关注的重量级依赖
+HEAVY_MODULES = ("openai", "httpx", "numpy", "google.genai", "xai_sdk", "dashscope")
+
+# 名称 -> 在全新解释器中执行的语句；main.py 的入口在子进程里以 __main__ 运行，输出被丢弃
+IMPORT_TARGETS = {
+    "evalai.providers": "import evalai.providers",
+    "evalai.fanout": "import evalai.fanout",
+    "main.py --list-providers": "_run_main('--list-providers')",
+    "main.py --help": "_run_main('--help')",
+}
+
+_IMPORT_PROBE = """
+import contextlib, io, runpy, sys, time
+def _run_main(*argv):
+    sys.argv = ["main.py", *argv]
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            runpy.run_path("main.py", run_name="__main__")
+        except SystemExit:
+            pass
+start = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def mock_process(**options):
+    """
+    在子进程中启动模拟服务
+
+    Args:
+        **options: evalai.mock_server 的命令行参数，例如 ttft=0, chunk_rate=0
+
+    Returns:
+        模拟服务的 base_url
+    """
+    port = _free_port()
+    args = [sys.executable, "-m", "evalai.mock_server", "--port", str(port)]
+    for key, value in options.items():
+        args += [f"--{key.replace('_', '-')}", str(value)]
+    proc = subprocess.Popen(args, cwd=ROOT, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or proc.poll() is not None:
+                    raise RuntimeError("模拟服务启动失败")
+                time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _instance(name: str, base_url: str):
+    cls = load_stream_class(name)
+    return cls(api_key=MOCK_KEY, base_url=base_url)
+
+
+def _raw_stream(name: str, base_url: str) -> int:
+    # 基线：直接迭代 SDK 的流，不做任何归一化
+    spec = get_provider(name)
+    client = registry.openai_client(MOCK_KEY, base_url)
+    count = 0
+    if spec.api == "responses":
+        for _ in client.responses.create(model=spec.model, input=[{"role": "user", "content": "hi"}], stream=True):
+            count += 1
+    else:
+        for _ in client.chat.completions.create(
+            model=spec.model,
+            messages=[{"role": "user", "content": "hi"}],
+            stream=True,
+            stream_options={"include_usage": True},
+        ):
+            count += 1
+    return count
+
+
+def _harness_stream(name: str, base_url: str) -> int:
+    count = 0
+    for _ in _instance(name, base_url).stream("hi"):
+        count += 1
+    return count
+
+
+def _cpu(fn):
+    start = time.process_time()
+    result = fn()
+    return time.process_time() - start, result
+
+
+def bench_overhead(providers: Iterable[str], chunks: int = 2000, repeat: int = 5) -> List[Dict]:
+    """
+    每个分片的客户端 CPU 开销
+
+    Args:
+        providers: 厂商名称
+        chunks: 每次请求的分片数
+        repeat: 重复次数，取最小值
+
+    Returns:
+        每个厂商一行：基线与厂商类的每分片 CPU 时间（微秒）及差值
+    """
+    rows = []
+    with mock_process(ttft=0, chunk_rate=0, chunks=chunks) as base_url:
+        for name in providers:
+            _harness_stream(name, base_url)  # 预热：加载脚本、建立连接
+            raw_cpu = cpu = float("inf")
+            # 基线与厂商类交替运行，各取最小值，减少机器抖动的影响
+            for _ in range(repeat):
+                elapsed, raw_count = _cpu(lambda: _raw_stream(name, base_url))
+                raw_cpu = min(raw_cpu, elapsed)
+                elapsed, count = _cpu(lambda: _harness_stream(name, base_url))
+                cpu = min(cpu, elapsed)
+            rows.append({
+                "provider": name,
+                "chunks": count,
+                "sdk_us": raw_cpu / raw_count * 1e6,
+                "harness_us": cpu / count * 1e6,
+                "overhead_us": (cpu - raw_cpu) / count * 1e6,
+            })
+    return rows
+
+
+def bench_concurrency(levels: Iterable[int], provider: str = "qwen", chunks: int = 40, chunk_rate: float = 20.0) -> List[Dict]:
+    """
+    并发引擎的单核承载能力
+
+    每个流以固定速率接收分片，测量客户端进程的 CPU 占用率，按 并发数 / 占用率 推算单核可承载的并发流数。
+
+    Args:
+        levels: 要测试的并发数
+        provider: 使用的厂商配置
+        chunks: 每个流的分片数
+        chunk_rate: 每个流每秒的分片数
+
+    Returns:
+        每个并发数一行测量结果
+    """
+    levels = list(levels)
+    registry.limits = httpx.Limits(max_connections=None, max_keepalive_connections=max(levels), keepalive_expiry=60.0)
+    rows = []
+    with mock_process(ttft=0.05, chunk_rate=chunk_rate, chunks=chunks) as base_url:
+        os.environ.setdefault("EVALAI_BENCH_KEY", MOCK_KEY)
+        spec = replace(get_provider(provider), base_url=base_url, api_key_env="EVALAI_BENCH_KEY")
+
+        async def run(n: int):
+            async with FanOutEngine([spec] * n, concurrency=n) as engine:
+                await engine.warm_up(n)
+                start_wall, start_cpu = time.perf_counter(), time.process_time()
+                results = await engine.run("hi")
+                wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            await registry.aclose()
+            return results, wall, cpu
+
+        for n in levels:
+            results, wall, cpu = asyncio.run(run(n))
+            ok = sum(r.ok for r in results)
+            delivered = sum(r.metrics.chunk_count for r in results)
+            utilization = cpu / wall if wall else 0.0
+            rows.append({
+                "streams": n,
+                "ok": ok,
+                "wall_s": wall,
+                "cpu_s": cpu,
+                "cpu_util": utilization,
+                "chunks_per_s": delivered / wall if wall else 0.0,
+                "streams_per_core": n / utilization if utilization else float("inf"),
+            })
+    return rows
+
+
+def bench_memory(providers: Iterable[str], streams: int = 50) -> List[Dict]:
+    """
+    每个打开中的流占用的内存
+
+    打开 streams 个流并各自读到第一个事件，用 tracemalloc 统计新增内存后平均到每个流。
+
+    Args:
+        providers: 厂商名称
+        streams: 同时打开的流数（同步客户端受连接池上限约束）
+
+    Returns:
+        每个厂商一行：每个流的平均字节数
+    """
+    rows = []
+    with mock_process(ttft=0, chunk_rate=1, chunks=1000) as base_url:
+        for name in providers:
+            _instance(name, base_url)  # 预先加载脚本，避免把模块本身计入
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            opened = []
+            for _ in range(streams):
+                gen = _instance(name, base_url).stream("hi")
+                next(gen)
+                opened.append(gen)
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+            for gen in opened:
+                gen.close()
+            rows.append({"provider": name, "streams": streams, "bytes_per_stream": used / streams})
+        registry.close()
+    return rows
+
+
+def bench_imports(targets: Dict[str, str] = IMPORT_TARGETS, repeat: int = 5) -> List[Dict]:
+    """
+    测量各入口的导入耗时
+
+    每次都在全新的子进程中执行，排除模块缓存的影响；取多次中的最小值，减少系统抖动。
+
+    Args:
+        targets: 名称 -> 要计时的语句
+        repeat: 每个入口运行的次数
+
+    Returns:
+        每个入口一行：导入耗时（毫秒）和被导入的重量级依赖
+    """
+    rows = []
+    for name, stmt in targets.items():
+        code = _IMPORT_PROBE.format(stmt=stmt, heavy=HEAVY_MODULES)
+        best, loaded = None, ""
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True,
+                env={**os.environ, "PYTHONPATH": str(ROOT)},
+            ).stdout.split("\n")
+            elapsed = float(out[0]) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+            loaded = out[1]
+        rows.append({"target": name, "import_ms": best, "heavy_modules": loaded or "-"})
+    return rows
+
+
+def _print_rows(title: str, rows: List[Dict]):
+    print(f"\n===== {title} =====")
+    if not rows:
+        return
+    keys = list(rows[0])
+    print("  ".join(f"{k:>16}" for k in keys))
+    for row in rows:
+        cells = []
+        for k in keys:
+            v = row[k]
+            cells.append(f"{v:>16.2f}" if isinstance(v, float) else f"{v!s:>16}")
+        print("  ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于本地模拟服务的基准测试")
+    parser.add_argument("--only", choices=["overhead", "concurrency", "memory", "imports"], help="只运行其中一项")
+    parser.add_argument("--providers", nargs="+", default=BENCH_PROVIDERS, help="参与测试的厂商")
+    parser.add_argument("--chunks", type=int, default=2000, help="overhead 测试每次请求的分片数")
+    parser.add_argument("--levels", type=int, nargs="+", default=[50, 100, 200, 400], help="concurrency 测试的并发数")
+    parser.add_argument("--streams", type=int, default=50, help="memory 测试同时打开的流数")
+    parser.add_argument("--repeat", type=int, default=5, help="imports 测试每个入口运行的次数")
+    args = parser.parse_args()
+
+    if args.only in (None, "overhead"):
+        _print_rows("每分片 CPU 开销（微秒）", bench_overhead(args.providers, chunks=args.chunks))
+    if args.only in (None, "concurrency"):
+        _print_rows("并发流与单核承载", bench_concurrency(args.levels))
+    if args.only in (None, "memory"):
+        _print_rows("每个流的内存（字节）", bench_memory(args.providers, streams=args.streams))
+    if args.only in (None, "imports"):
+        _print_rows("导入耗时（毫秒）", bench_imports(repeat=args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""
+流式回答缓存
+
+以 (厂商, 模型, 系统消息, messages, 采样参数) 为键缓存完整的流式事件序列，内存中是有界 LRU，
+磁盘上是 SQLite 持久层。命中时按 StreamEvent 流回放：可以立即全部吐出，也可以按录制时的分片间隔重放，
+UI 和基准测试代码看到的事件序列与真实调用一致。支持 TTL 失效以及命中/未命中/淘汰计数。
+
+用法：
+    cache = ResponseCache("cache.sqlite3", ttl=86400)
+    bot = CachedProvider(QwenStream(), cache)
+    for event in bot.stream("讲一下什么是Spring Boot"):
+        ...
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from evalai.events import ERROR, REASONING, USAGE, StreamEvent
+from evalai.metrics import StreamMetrics
+
+Recorded = Tuple[str, str, float]  # (kind, text, 相对请求开始的秒数)
+CACHE_HIT = "cache"  # 回放产生的 USAGE 事件的 data
+
+
+class CacheEntry:
+    """
+    一次完整流式调用的录制结果
+
+    Attributes:
+        events: (kind, text, offset) 列表，不含最后的 USAGE 事件
+        usage: 录制时厂商返回的用量
+        duration: 录制时流的总耗时（秒）
+        created_at: 写入时间（Unix 时间戳），用于 TTL 判断
+    """
+
+    __slots__ = ("events", "usage", "duration", "created_at")
+
+    def __init__(self, events: List[Recorded], usage: Optional[Dict[str, int]], duration: float, created_at: float):
+        self.events = events
+        self.usage = usage
+        self.duration = duration
+        self.created_at = created_at
+
+    def dumps(self) -> str:
+        return json.dumps(
+            {"events": self.events, "usage": self.usage, "duration": self.duration},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def loads(cls, payload: str, created_at: float) -> "CacheEntry":
+        data = json.loads(payload)
+        return cls([tuple(e) for e in data["events"]], data["usage"], data["duration"], created_at)
+
+
+def make_key(
+    provider: str,
+    model: str,
+    system: Optional[str],
+    messages: Any,
+    params: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    生成缓存键
+
+    Args:
+        provider: 厂商名称
+        model: 模型名称
+        system: 系统消息
+        messages: 消息列表或 prompt
+        params: 采样参数等其余请求参数
+
+    Returns:
+        sha256 十六进制摘要
+    """
+    canonical = json.dumps(
+        [provider, model, system, messages, params or {}],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    两级缓存：内存 LRU + SQLite 磁盘层
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_entries: int = 256,
+        ttl: Optional[float] = None,
+    ):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite 文件路径，None 表示只用内存层
+            max_entries: 内存层最多保留的条目数
+            ttl: 条目有效期（秒），None 表示永不过期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created_at REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._db.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stores = 0
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return self.ttl is not None and time.time() - entry.created_at > self.ttl
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        查找缓存，过期条目视为未命中并删除
+
+        Args:
+            key: make_key() 生成的键
+
+        Returns:
+            CacheEntry 或 None
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._expired(entry):
+                    self._delete(key)
+                    self.expirations += 1
+                else:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry
+
+            if self._db is not None:
+                row = self._db.execute("SELECT created_at, payload FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = CacheEntry.loads(row[1], row[0])
+                    if self._expired(entry):
+                        self._delete(key)
+                        self.expirations += 1
+                    else:
+                        self._remember(key, entry)
+                        self.disk_hits += 1
+                        return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, entry: CacheEntry):
+        """写入两级缓存"""
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, created_at, payload) VALUES (?, ?, ?)",
+                    (key, entry.created_at, entry.dumps()),
+                )
+                self._db.commit()
+            self.stores += 1
+
+    def _remember(self, key: str, entry: CacheEntry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _delete(self, key: str):
+        self._memory.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def invalidate(self, key: str):
+        """删除指定条目"""
+        with self._lock:
+            self._delete(key)
+
+    def prune(self) -> int:
+        """
+        清理磁盘层中所有过期条目
+
+        Returns:
+            删除的条目数
+        """
+        if self.ttl is None:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for key in [k for k, e in self._memory.items() if e.created_at < cutoff]:
+                del self._memory[key]
+            if self._db is None:
+                return 0
+            removed = self._db.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+            self._db.commit()
+            self.expirations += removed
+            return removed
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中/淘汰等计数"""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stores": self.stores,
+            "memory_entries": len(self._memory),
+        }
+
+
+# ------------- 回放 -------------
+def _final_event(entry: CacheEntry, metrics: StreamMetrics) -> StreamEvent:
+    usage = entry.usage
+    metrics.finish(usage["completion_tokens"] if usage else None, usage.get("reasoning_tokens") if usage else None)
+    return StreamEvent(USAGE, ts=metrics.finished_at, usage=entry.usage, metrics=metrics, data=CACHE_HIT)
+
+
+def replay(entry: CacheEntry, timing: bool = False, metrics: Optional[StreamMetrics] = None) -> Iterator[StreamEvent]:
+    """
+    把缓存条目回放为 StreamEvent 流
+
+    Args:
+        entry: 缓存条目
+        timing: 是否按录制时的时间间隔重放；否则立即全部产出
+        metrics: 记录回放时延的 StreamMetrics，None 时新建
+
+    Returns:
+        StreamEvent 迭代器，最后一个 USAGE 事件的 data 为 CACHE_HIT
+    """
+    metrics = metrics if metrics is not None else StreamMetrics()
+    start = metrics.request_sent_at
+    for kind, text, offset in entry.events:
+        if timing:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield StreamEvent(kind, text, metrics.mark_reasoning() if kind == REASONING else metrics.mark_answer())
+    if timing:
+        delay = start + entry.duration - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    yield _final_event(entry, metrics)
+
+
+async def areplay(
+    entry: CacheEntry, timing: bool = False, metrics: Optional[StreamMetrics] = None
+) -> AsyncIterator[StreamEvent]:
+    """replay() 的异步版本"""
+    metrics = metrics if metrics is not None else StreamMetrics()
+    start = metrics.request_sent_at
+    for kind, text, offset in entry.events:
+        if timing:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield StreamEvent(kind, text, metrics.mark_reasoning() if kind == REASONING else metrics.mark_answer())
+    if timing:
+        delay = start + entry.duration - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    yield _final_event(entry, metrics)
+
+
+# ------------- 录制 -------------
+class _Recorder:
+    __slots__ = ("start", "events", "failed")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.events: List[Recorded] = []
+        self.failed = False
+
+    def feed(self, event: StreamEvent) -> Optional[CacheEntry]:
+        kind = event.kind
+        if kind == USAGE:
+            if self.failed:
+                return None
+            return CacheEntry(self.events, event.usage, event.ts - self.start, time.time())
+        if kind == ERROR:
+            self.failed = True
+        self.events.append((kind, event.text, event.ts - self.start))
+        return None
+
+
+def cached_stream(
+    cache: ResponseCache,
+    key: str,
+    factory: Callable[[], Iterator[StreamEvent]],
+    timing: bool = False,
+    metrics: Optional[StreamMetrics] = None,
+) -> Iterator[StreamEvent]:
+    """
+    带缓存的流：命中时回放，未命中时调用 factory() 并边转发边录制
+
+    只有完整结束（收到 USAGE 且没有 ERROR）的流才会写入缓存，中途放弃的不会。
+
+    Args:
+        cache: 缓存实例
+        key: 缓存键
+        factory: 未命中时创建真实流的函数
+        timing: 命中时是否按原始时间间隔回放
+        metrics: 命中时记录回放时延的 StreamMetrics
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        yield from replay(entry, timing, metrics)
+        return
+    recorder = _Recorder()
+    for event in factory():
+        recorded = recorder.feed(event)
+        if recorded is not None:
+            cache.put(key, recorded)
+        yield event
+
+
+async def acached_stream(
+    cache: ResponseCache,
+    key: str,
+    factory: Callable[[], AsyncIterator[StreamEvent]],
+    timing: bool = False,
+    metrics: Optional[StreamMetrics] = None,
+) -> AsyncIterator[StreamEvent]:
+    """
+    cached_stream() 的异步版本
+
+    SQLite 读写放到线程中执行，不阻塞同一事件循环上的其他流；
+    调用方提前结束迭代（截断、对冲落败、首 token 超时）时立即关闭上游流，归还 HTTP 连接。
+    """
+    entry = await asyncio.to_thread(cache.get, key)
+    if entry is not None:
+        async for event in areplay(entry, timing, metrics):
+            yield event
+        return
+    recorder = _Recorder()
+    events = factory()
+    try:
+        async for event in events:
+            recorded = recorder.feed(event)
+            if recorded is not None:
+                await asyncio.to_thread(cache.put, key, recorded)
+            yield event
+    finally:
+        await events.aclose()
+
+
+# 会改变回答内容的实例配置（例如 OpenAIClient 的推理开关和推理强度），与客户端的 base_url 一起计入缓存键
+_BOT_CONFIG = ("enable_reasoning", "reasoning_effort", "temperature", "top_p")
+
+
+def _bot_params(bot) -> Dict[str, Any]:
+    params = {name: getattr(bot, name) for name in _BOT_CONFIG if hasattr(bot, name)}
+    base_url = getattr(getattr(bot, "client", None), "base_url", None)
+    if base_url is not None:
+        params["base_url"] = str(base_url)
+    return params
+
+
+class CachedProvider:
+    """
+    给任意厂商类（QwenStream、KimiStream、DeepSeek*Stream、OpenAIClient）加上缓存
+
+    只包装 stream()；其余属性透传给原对象。缓存键包含类名、模型、系统消息、调用参数，
+    以及 _BOT_CONFIG 中的实例配置和客户端 base_url，配置不同的两个实例不会互相回放。
+    """
+
+    def __init__(self, bot, cache: ResponseCache, timing: bool = False):
+        """
+        Args:
+            bot: 厂商类实例
+            cache: 缓存实例
+            timing: 命中时是否按原始时间间隔回放
+        """
+        self.bot = bot
+        self.cache = cache
+        self.timing = timing
+
+    def __getattr__(self, name):
+        return getattr(self.bot, name)
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[StreamEvent]:
+        bot = self.bot
+        key = make_key(
+            type(bot).__name__,
+            bot.model,
+            getattr(bot, "system", None),
+            [{"role": "user", "content": prompt}],
+            {"call": kwargs, "bot": _bot_params(bot)},
+        )
+        return cached_stream(self.cache, key, lambda: bot.stream(prompt, **kwargs), self.timing)
@@ -0,0 +1,361 @@
+"""
+一致性测试（系统设计.md 中的「一致性测试：多次测试同一问题的回答一致性」）
+
+同一个 prompt 对每个模型并发采样 K 次，而不是把脚本顺序重跑 K 遍：
+    - 厂商配置（ProviderSpec）走 FanOutEngine 的异步请求，所有模型的 K 个样本一起受 concurrency 限制
+    - 各目录下脚本里的流式调用类（QwenStream 等）用线程池并发调用 stream()，共用 transport 的连接池
+采样时不使用回答缓存，否则 K 个样本会是同一个回答。
+
+所有样本收齐后一次性做向量化统计：
+    相似度    样本两两之间的 n-gram 余弦与 MinHash Jaccard（SimilarityEngine），取均值、最小值和分位数
+    长度      回答字符数的均值、标准差和变异系数
+    时延      首 token 时间、输出速度的均值、标准差和变异系数
+    成本      K 个样本的总费用（按 evalai.estimate.PRICES）
+一致性得分 = SIMILARITY_WEIGHT × 余弦相似度均值 + LENGTH_WEIGHT × max(0, 1 - 长度变异系数)，范围 0-1。
+
+用法：
+    reports = run_consistency("讲一下什么是Spring Boot", ["qwen", "kimi"], k=10, temperature=1.0)
+    print(format_reports(reports))
+    report = QwenStream().consistency("讲一下什么是Spring Boot", k=5)
+    python -m evalai.consistency "讲一下什么是Spring Boot" -m qwen kimi -k 10
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+try:
+    import numpy as np
+except ImportError as e:  # pragma: no cover
+    raise ImportError("一致性测试需要安装 numpy（pip install numpy）") from e
+
+from evalai.estimate import price_for
+from evalai.events import ERROR, REASONING, TEXT, USAGE
+from evalai.fanout import FanOutEngine, ModelResult
+from evalai.limits import Truncated
+from evalai.providers import ProviderSpec, get_provider
+from evalai.ratelimit import RateLimiter
+from evalai.requestlog import RequestLogWriter
+from evalai.similarity import SimilarityEngine
+from evalai.transport import registry
+
+SIMILARITY_WEIGHT = 0.7
+LENGTH_WEIGHT = 0.3
+
+
+def _spread(values: np.ndarray) -> Dict[str, Optional[float]]:
+    """均值、标准差、变异系数（忽略 NaN）"""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {"mean": None, "std": None, "cv": None}
+    mean = float(values.mean())
+    std = float(values.std())
+    return {"mean": mean, "std": std, "cv": std / mean if mean else None}
+
+
+@dataclass
+class ConsistencyReport:
+    """
+    单个模型 K 次采样的一致性统计
+
+    Attributes:
+        provider: 厂商名称
+        model: 模型名称
+        samples: 各次采样的结果
+        wall_time: K 次采样的实际总耗时（秒）
+        similarity: 两两相似度统计（cosine_mean / cosine_min / cosine_p10 / minhash_mean / minhash_min）
+        length: 回答字符数的 mean / std / cv
+        ttft: 首 token 时间（秒）的 mean / std / cv
+        tokens_per_second: 输出速度的 mean / std / cv
+        cost: K 个样本的总费用（元），单价未知时为 None
+        score: 一致性得分（0-1），成功样本不足 2 个时为 None
+    """
+    provider: str
+    model: str
+    samples: List[ModelResult]
+    wall_time: float = 0.0
+    similarity: Dict[str, Optional[float]] = field(default_factory=dict)
+    length: Dict[str, Optional[float]] = field(default_factory=dict)
+    ttft: Dict[str, Optional[float]] = field(default_factory=dict)
+    tokens_per_second: Dict[str, Optional[float]] = field(default_factory=dict)
+    cost: Optional[float] = None
+    score: Optional[float] = None
+
+    @property
+    def k(self) -> int:
+        return len(self.samples)
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for sample in self.samples if sample.ok)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可 JSON 序列化的字典（不含样本全文）"""
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "k": self.k,
+            "succeeded": self.succeeded,
+            "wall_time": self.wall_time,
+            "similarity": self.similarity,
+            "length": self.length,
+            "ttft": self.ttft,
+            "tokens_per_second": self.tokens_per_second,
+            "cost": self.cost,
+            "score": self.score,
+        }
+
+
+def analyze(
+    provider: str, model: str, samples: Sequence[ModelResult], wall_time: float = 0.0
+) -> ConsistencyReport:
+    """
+    统计一组采样结果的离散程度
+
+    Args:
+        provider: 厂商名称
+        model: 模型名称（用于查单价）
+        samples: 同一个 prompt 的多次结果
+        wall_time: 采样的实际总耗时（秒）
+
+    Returns:
+        ConsistencyReport
+    """
+    report = ConsistencyReport(provider, model, list(samples), wall_time)
+    ok = [sample for sample in samples if sample.ok and sample.text]
+
+    if len(ok) >= 2:
+        engine = SimilarityEngine()
+        for i, sample in enumerate(ok):
+            engine.feed(str(i), sample.text)
+            engine.finish(str(i))
+        rows, cols = np.triu_indices(len(ok), k=1)
+        cosine = engine.matrix("cosine")[rows, cols]
+        minhash = engine.matrix("minhash")[rows, cols]
+        report.similarity = {
+            "cosine_mean": float(cosine.mean()),
+            "cosine_min": float(cosine.min()),
+            "cosine_p10": float(np.percentile(cosine, 10)),
+            "minhash_mean": float(minhash.mean()),
+            "minhash_min": float(minhash.min()),
+        }
+
+    nan = float("nan")
+    lengths = np.array([len(sample.text) for sample in ok], dtype=np.float64)
+    ttfts = np.array([sample.ttft if sample.ttft is not None else nan for sample in samples if sample.ok])
+    speeds = np.array([
+        sample.metrics.tokens_per_second if sample.metrics.tokens_per_second is not None else nan
+        for sample in samples if sample.ok
+    ])
+    report.length = _spread(lengths)
+    report.ttft = _spread(ttfts)
+    report.tokens_per_second = _spread(speeds)
+
+    price = price_for(model)
+    if price is not None:
+        usages = np.array(
+            [[s.usage["prompt_tokens"], s.usage["completion_tokens"]] for s in samples if s.usage], dtype=np.float64
+        ).reshape(-1, 2)
+        report.cost = float(sum(price.cost(*usages.sum(axis=0))))
+
+    if report.similarity:
+        length_cv = report.length["cv"] or 0.0
+        report.score = SIMILARITY_WEIGHT * report.similarity["cosine_mean"] + LENGTH_WEIGHT * max(0.0, 1.0 - length_cv)
+    return report
+
+
+async def asample(
+    engine: FanOutEngine, prompt: str, k: int, system: Optional[str] = None, **extra
+) -> List[ConsistencyReport]:
+    """
+    对 engine 中的每个模型并发采样 k 次（总并发数受 engine.concurrency 限制）
+
+    Args:
+        engine: 不带缓存的 FanOutEngine
+        prompt: 用户提示词
+        k: 每个模型的采样次数
+        system: 系统消息
+        **extra: 额外请求参数（例如 temperature）
+
+    Returns:
+        与 engine.specs 顺序一致的 ConsistencyReport 列表
+    """
+    if k < 1:
+        raise ValueError("k 必须大于 0")
+    if engine.cache is not None:
+        raise ValueError("一致性测试不能使用回答缓存")
+    semaphore = asyncio.Semaphore(engine.concurrency)
+
+    async def guarded(spec: ProviderSpec) -> ModelResult:
+        async with semaphore:
+            return await engine.run_one(spec, prompt, system, **extra)
+
+    async def per_model(spec: ProviderSpec):
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(guarded(spec) for _ in range(k)))
+        return spec, samples, time.perf_counter() - started
+
+    collected = await asyncio.gather(*(per_model(spec) for spec in engine.specs))
+    # 统计放在所有请求结束之后，不占用事件循环处理流的时间
+    return [analyze(spec.name, spec.model, samples, wall) for spec, samples, wall in collected]
+
+
+def run_consistency(
+    prompt: str,
+    providers: Iterable[Union[str, ProviderSpec]],
+    k: int = 5,
+    concurrency: int = 8,
+    timeout: Optional[float] = None,
+    system: Optional[str] = None,
+    request_log: Optional[RequestLogWriter] = None,
+    limiter: Optional[RateLimiter] = None,
+    **extra,
+) -> List[ConsistencyReport]:
+    """
+    同步入口：每个模型并发采样 k 次并统计一致性
+
+    Args:
+        prompt: 用户提示词
+        providers: 厂商名称或 ProviderSpec 列表
+        k: 每个模型的采样次数
+        concurrency: 同时进行的请求数上限（所有模型合计）
+        timeout: 单次请求的超时时间（秒）
+        system: 系统消息
+        request_log: api_requests 日志器
+        limiter: 速率限制器
+        **extra: 额外请求参数
+
+    Returns:
+        ConsistencyReport 列表
+    """
+    async def _main():
+        try:
+            async with FanOutEngine(
+                providers, concurrency=concurrency, timeout=timeout, request_log=request_log, limiter=limiter,
+            ) as engine:
+                return await asample(engine, prompt, k, system, **extra)
+        finally:
+            await registry.aclose()
+
+    return asyncio.run(_main())
+
+
+def _collect_stream(client, prompt: str, provider: str, model: str, extra: Dict) -> ModelResult:
+    result = ModelResult(provider=provider, model=model)
+    text, reasoning = [], []
+    try:
+        for event in client.stream(prompt, **extra):
+            if event.kind == TEXT:
+                text.append(event.text)
+            elif event.kind == REASONING:
+                reasoning.append(event.text)
+            elif event.kind == USAGE:
+                result.usage = event.usage
+                if event.metrics is not None:
+                    result.metrics = event.metrics
+                if isinstance(event.data, Truncated):
+                    result.truncated = event.data.reason
+            elif event.kind == ERROR:
+                result.error = event.text
+    except Exception as e:
+        result.error = str(e)
+    result.text = "".join(text)
+    result.reasoning = "".join(reasoning)
+    return result
+
+
+def sample_stream(
+    client,
+    prompt: str,
+    k: int = 5,
+    concurrency: Optional[int] = None,
+    provider: Optional[str] = None,
+    **extra,
+) -> ConsistencyReport:
+    """
+    用脚本中的流式调用类（QwenStream、KimiStream 等）并发采样 k 次
+
+    这些类使用同步客户端，底层 httpx.Client 来自 transport 的共享连接池，可以在多个线程中同时使用。
+
+    Args:
+        client: 带 stream(prompt, **extra) 方法的对象
+        prompt: 用户提示词
+        k: 采样次数
+        concurrency: 同时进行的请求数，默认 k
+        provider: 报告中的厂商名称，默认取类名
+        **extra: 传给 stream() 的额外参数
+
+    Returns:
+        ConsistencyReport
+    """
+    if k < 1:
+        raise ValueError("k 必须大于 0")
+    provider = provider or type(client).__name__
+    model = getattr(client, "model", None) or provider
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(concurrency or k, k), thread_name_prefix="evalai-sample") as pool:
+        samples = list(pool.map(lambda _: _collect_stream(client, prompt, provider, model, extra), range(k)))
+    return analyze(provider, model, samples, time.perf_counter() - started)
+
+
+def format_reports(reports: Sequence[ConsistencyReport]) -> str:
+    """以表格形式输出各模型的一致性统计"""
+    def num(value, fmt="{:.2f}"):
+        return "-" if value is None else fmt.format(value)
+
+    header = ["厂商", "成功/K", "得分", "余弦均值", "余弦最小", "长度均值", "长度CV", "首token均值", "首tokenCV",
+              "tok/s均值", "tok/s CV", "耗时", "费用(元)"]
+    lines = ["\t".join(header)]
+    for r in reports:
+        lines.append("\t".join([
+            r.provider,
+            f"{r.succeeded}/{r.k}",
+            num(r.score),
+            num(r.similarity.get("cosine_mean")),
+            num(r.similarity.get("cosine_min")),
+            num(r.length.get("mean"), "{:.0f}"),
+            num(r.length.get("cv")),
+            num(r.ttft.get("mean"), "{:.2f}s"),
+            num(r.ttft.get("cv")),
+            num(r.tokens_per_second.get("mean"), "{:.1f}"),
+            num(r.tokens_per_second.get("cv")),
+            f"{r.wall_time:.2f}s",
+            num(r.cost, "{:.4f}"),
+        ]))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="一致性测试：同一个问题对每个模型并发采样 K 次")
+    parser.add_argument("prompt", help="提示词")
+    parser.add_argument("-m", "--models", nargs="+", required=True, help="参与测试的厂商，可写成 厂商:模型")
+    parser.add_argument("-k", type=int, default=5, help="每个模型的采样次数")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="同时进行的请求数上限（所有模型合计）")
+    parser.add_argument("--timeout", type=float, default=None, help="单次请求的超时时间（秒）")
+    parser.add_argument("--system", default=None, help="系统消息")
+    parser.add_argument("--temperature", type=float, default=None, help="采样温度，默认使用厂商默认值")
+    parser.add_argument("--log-db", metavar="PATH", default=None, help="把每个请求写入该 SQLite 库的 api_requests 表")
+    args = parser.parse_args()
+
+    extra = {"temperature": args.temperature} if args.temperature is not None else {}
+    request_log = RequestLogWriter(args.log_db).start() if args.log_db else None
+    try:
+        reports = run_consistency(
+            args.prompt, [get_provider(model) for model in args.models], k=args.k,
+            concurrency=args.concurrency, timeout=args.timeout, system=args.system,
+            request_log=request_log, **extra,
+        )
+    finally:
+        if request_log is not None:
+            request_log.close()
+    print(format_reports(reports))
+    for report in reports:
+        errors = {sample.error for sample in report.samples if not sample.ok}
+        for error in errors:
+            print(f"{report.provider} 失败: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+多轮对话上下文管理
+
+每条消息在加入时估算一次 token 数并累加，不会每轮重新统计整个历史；厂商返回实际的 prompt_tokens 后
+再校正估算比例。历史超过预算时按整轮（从 user 消息开始）一次性淘汰到低水位，而不是每轮只丢最早的一条：
+两次淘汰之间消息前缀保持不变，厂商的前缀缓存（prompt caching）可以持续命中。
+系统消息始终保留；提供 summarizer 时，被淘汰的轮次会被并入一条固定在系统消息之后的摘要。
+
+用法：
+    conv = Conversation(system="You are a helpful assistant.", budget=8000)
+    for event in conv.chat(client, "grok-code-fast", "你好"):
+        ...
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from evalai.events import TEXT, USAGE, StreamEvent, iter_chat_events
+from evalai.metrics import StreamMetrics
+from evalai.estimate import MESSAGE_OVERHEAD, estimate_tokens
+
+Summarizer = Callable[[Optional[str], List[Dict[str, str]]], str]
+
+
+def llm_summarizer(client, model: str, max_tokens: int = 300) -> Summarizer:
+    """
+    用模型本身压缩被淘汰的轮次
+
+    Args:
+        client: OpenAI 兼容客户端
+        model: 用于生成摘要的模型
+        max_tokens: 摘要的最大长度
+
+    Returns:
+        summarizer(上一版摘要, 被淘汰的消息) -> 新摘要
+    """
+    def summarize(previous: Optional[str], evicted: List[Dict[str, str]]) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+        if previous:
+            transcript = f"此前的摘要：{previous}\n\n{transcript}"
+        resp = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "把下面的对话压缩成简短的要点摘要，保留事实、约定和未解决的问题。"},
+                {"role": "user", "content": transcript},
+            ],
+            max_tokens=max_tokens,
+        )
+        return resp.choices[0].message.content or ""
+
+    return summarize
+
+
+class Conversation:
+    """
+    带 token 预算的对话历史
+    """
+
+    def __init__(
+        self,
+        system: Optional[str] = None,
+        budget: int = 16000,
+        low_water: float = 0.6,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        """
+        初始化对话
+
+        Args:
+            system: 系统消息，始终保留在最前面
+            budget: 每次请求的输入 token 上限（估算值，含系统消息和摘要）
+            low_water: 超出预算时淘汰到 budget * low_water 为止
+            summarizer: 被淘汰轮次的摘要函数，None 时直接丢弃
+        """
+        if not 0 < low_water <= 1:
+            raise ValueError("low_water 必须在 (0, 1] 之间")
+        self.system = system
+        self.budget = budget
+        self.low_water = low_water
+        self.summarizer = summarizer
+        self.summary: Optional[str] = None
+        self.ratio = 1.0  # 实际 prompt_tokens / 估算值
+        self.evictions = 0
+        self._history: List[Dict[str, str]] = []
+        self._costs: List[int] = []
+        self._history_tokens = 0
+        self._messages: List[Dict[str, str]] = []
+        self._rebuild()
+
+    # ------------- 消息 -------------
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        """本轮要发送的消息列表（内部复用同一个列表，调用方不要修改）"""
+        return self._messages
+
+    @property
+    def tokens(self) -> int:
+        """当前消息列表的估算 token 数（已按实际用量校正）"""
+        fixed = self._cost(self.system) + self._cost(self._summary_text())
+        return int((fixed + self._history_tokens) * self.ratio)
+
+    def add(self, role: str, content: str):
+        """
+        追加一条消息，必要时淘汰最早的若干轮
+
+        Args:
+            role: "user" 或 "assistant"
+            content: 消息内容
+        """
+        message = {"role": role, "content": content}
+        cost = self._cost(content)
+        self._history.append(message)
+        self._costs.append(cost)
+        self._history_tokens += cost
+        self._messages.append(message)
+        if role == "user" and self.tokens > self.budget:
+            self._evict()
+
+    def add_user(self, content: str):
+        self.add("user", content)
+
+    def add_assistant(self, content: str):
+        self.add("assistant", content)
+
+    def observe_usage(self, prompt_tokens: int, estimated: Optional[int] = None):
+        """
+        用厂商返回的 prompt_tokens 校正估算比例
+
+        Args:
+            prompt_tokens: 实际输入 token 数
+            estimated: 该请求发送时的估算值（未乘比例），None 时使用当前值
+        """
+        if estimated is None:
+            estimated = int(self.tokens / self.ratio)
+        if estimated > 0 and prompt_tokens > 0:
+            # 指数平均，避免单次异常值导致预算大幅波动
+            self.ratio = 0.7 * self.ratio + 0.3 * (prompt_tokens / estimated)
+
+    def clear(self):
+        """清空历史和摘要，只保留系统消息"""
+        self._history, self._costs, self._history_tokens = [], [], 0
+        self.summary = None
+        self._rebuild()
+
+    # ------------- 内部 -------------
+    @staticmethod
+    def _cost(content: Optional[str]) -> int:
+        return estimate_tokens(content) + MESSAGE_OVERHEAD if content else 0
+
+    def _pop(self):
+        self._history.pop()
+        self._history_tokens -= self._costs.pop()
+        self._messages.pop()
+
+    def _summary_text(self) -> Optional[str]:
+        return f"此前对话的摘要：{self.summary}" if self.summary else None
+
+    def _rebuild(self):
+        messages = []
+        if self.system:
+            messages.append({"role": "system", "content": self.system})
+        summary = self._summary_text()
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        messages.extend(self._history)
+        self._messages = messages
+
+    def _evict(self):
+        target = self.budget * self.low_water
+        history, costs = self._history, self._costs
+        # 最后一条 user 消息（本轮问题）不能淘汰
+        last_user = max(i for i, m in enumerate(history) if m["role"] == "user")
+        cut = 0
+        while cut < last_user and self.tokens > target:
+            self._history_tokens -= costs[cut]
+            cut += 1
+            # 按整轮淘汰：淘汰到下一条 user 消息为止
+            while cut < last_user and history[cut]["role"] != "user":
+                self._history_tokens -= costs[cut]
+                cut += 1
+        if not cut:
+            return
+        evicted = history[:cut]
+        self._history, self._costs = history[cut:], costs[cut:]
+        self.evictions += 1
+        if self.summarizer is not None:
+            self.summary = self.summarizer(self.summary, evicted)
+        self._rebuild()
+
+    # ------------- 调用 -------------
+    def chat(self, client, model: str, content: str, **params: Any) -> Iterator[StreamEvent]:
+        """
+        发送一轮用户消息并流式返回回答，结束后把回答加入历史
+
+        Args:
+            client: OpenAI 兼容客户端
+            model: 模型名称
+            content: 用户消息
+            **params: 额外请求参数
+
+        Returns:
+            StreamEvent 迭代器
+        """
+        self.add_user(content)
+        estimated = int(self.tokens / self.ratio)
+        parts: List[str] = []
+        completed = False
+        try:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=self._messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **params,
+            )
+            for event in iter_chat_events(resp, StreamMetrics()):
+                if event.kind == TEXT:
+                    parts.append(event.text)
+                elif event.kind == USAGE and event.usage:
+                    self.observe_usage(event.usage["prompt_tokens"], estimated)
+                yield event
+            completed = True
+        finally:
+            if completed:
+                self.add_assistant("".join(parts))
+            else:
+                # 请求失败或被中断：撤回本轮问题，避免历史里出现没有回答的 user 消息
+                self._pop()
@@ -0,0 +1,378 @@
+"""
+发送前的 token 与费用预估
+
+各厂商的分词器不同，同一段中文在 DeepSeek、Kimi、Qwen 上的 token 数可以相差近一倍。这里按厂商注册计数器：
+安装了 tiktoken 时 OpenAI 系模型使用真实分词器（encode_ordinary_batch 多线程批量编码），
+其余厂商（以及没有 tiktoken 时的 OpenAI 系模型）只是按官方文档标定的字符比例估算，误差可达数十个百分点，
+每段文本只需要 len() 和一次 UTF-8 编码，都在 C 中完成，没有单独的批量接口。
+需要准确计数的厂商可以用 register_tokenizer() 换成真实分词器。
+
+预估结果用于：
+    - 批量运行前按 models 表的单价预估整批费用（python -m evalai.batch ... --dry-run）
+    - 速率限制器按 TPM 预留 token
+    - 流被取消或超时、厂商没有返回用量时补上估算的用量
+
+价格单位为 元/百万 tokens；以美元计价的模型按 USD_TO_CNY 折算。价格表只是参考值，以厂商控制台为准，
+可以用 register_price() 覆盖。
+
+用法：
+    rows = project_batch(load_prompts("prompts.jsonl"), [get_provider("qwen"), get_provider("kimi")])
+    print(format_projection(rows))
+"""
+import math
+import threading
+import warnings
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_OUTPUT_TOKENS = 512  # 未指定 max_tokens 时预估的输出 token 数
+MESSAGE_OVERHEAD = 4  # 每条消息的角色和分隔符
+REQUEST_OVERHEAD = 3  # 每次请求的起止标记
+USD_TO_CNY = 7.2
+
+
+class HeuristicCounter:
+    """
+    按字符比例估算 token 数
+
+    中日韩等 3 字节字符按 wide_rate 计，其余字符按 narrow_rate 计。只是估算，不是真实分词。
+    """
+
+    __slots__ = ("wide_rate", "narrow_rate")
+
+    def __init__(self, wide_rate: float = 1.0, narrow_rate: float = 0.25):
+        """
+        Args:
+            wide_rate: 每个中日韩字符约合多少 token
+            narrow_rate: 每个 ASCII 字符约合多少 token
+        """
+        self.wide_rate = wide_rate
+        self.narrow_rate = narrow_rate
+
+    def weight(self, text: str) -> float:
+        """不取整的估算值；流式分片逐个累加时用它，最后再取整，避免每个短分片都向上取整"""
+        if not text:
+            return 0.0
+        chars = len(text)
+        wide = (len(text.encode("utf-8")) - chars) // 2  # 3 字节字符各多出 2 个字节
+        return wide * self.wide_rate + (chars - wide) * self.narrow_rate
+
+    def count(self, text: str) -> int:
+        return math.ceil(self.weight(text))
+
+    def __repr__(self):
+        return f"HeuristicCounter({self.wide_rate}, {self.narrow_rate})"
+
+
+class TiktokenCounter:
+    """
+    基于 tiktoken 的精确计数（需要安装 tiktoken，首次使用时加载编码表）
+    """
+
+    __slots__ = ("encoding_name", "_encoding")
+
+    def __init__(self, encoding_name: str = "o200k_base"):
+        import tiktoken
+
+        self.encoding_name = encoding_name
+        self._encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode_ordinary(text)) if text else 0
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [len(tokens) for tokens in self._encoding.encode_ordinary_batch(list(texts))]
+
+    def __repr__(self):
+        return f"TiktokenCounter({self.encoding_name!r})"
+
+
+DEFAULT_COUNTER = HeuristicCounter()
+# 比例取自各厂商文档中的换算说明
+_HEURISTICS: Dict[str, HeuristicCounter] = {
+    "deepseek": HeuristicCounter(0.6, 0.3),
+    "kimi": HeuristicCounter(0.6, 0.25),
+    "qwen": HeuristicCounter(0.7, 0.25),
+}
+_TIKTOKEN_ENCODINGS = {"gpt": "o200k_base"}
+
+_counters: Dict[str, Any] = {}
+_counters_lock = threading.Lock()
+
+
+def register_tokenizer(provider: str, counter: Any):
+    """
+    为厂商指定计数器
+
+    Args:
+        provider: 厂商名称（如 "qwen"、"deepseek"）
+        counter: 提供 count(text) 的对象；有 count_batch(texts) 时批量预估会使用它
+    """
+    with _counters_lock:
+        _counters[provider] = counter
+
+
+def _family(provider: str) -> str:
+    # deepseek-chat / deepseek-reasoner 共用同一个分词器
+    return provider.split("-", 1)[0]
+
+
+def counter_for(provider: Optional[str]) -> Any:
+    """
+    厂商对应的计数器，首次调用时创建
+
+    Args:
+        provider: 厂商名称，None 时返回通用估算
+
+    Returns:
+        计数器
+    """
+    if provider is None:
+        return DEFAULT_COUNTER
+    counter = _counters.get(provider)
+    if counter is not None:
+        return counter
+    with _counters_lock:
+        counter = _counters.get(provider)
+        if counter is None:
+            family = _family(provider)
+            counter = _counters.get(family)
+            if counter is None:
+                counter = _load_counter(family)
+                _counters[family] = counter
+            _counters[provider] = counter
+    return counter
+
+
+def _load_counter(family: str) -> Any:
+    encoding = _TIKTOKEN_ENCODINGS.get(family)
+    if encoding is not None:
+        try:
+            return TiktokenCounter(encoding)
+        except ImportError:
+            pass
+        except Exception as e:
+            # 离线环境下编码表可能下载失败
+            warnings.warn(f"加载 tiktoken 编码 {encoding} 失败，{family} 改用估算: {e}")
+    return _HEURISTICS.get(family, DEFAULT_COUNTER)
+
+
+def estimate_tokens(text: str, provider: Optional[str] = None) -> int:
+    """
+    估算文本的 token 数
+
+    Args:
+        text: 文本
+        provider: 厂商名称，None 时按中日韩字符约 1 个 token、ASCII 约 4 个字符 1 个 token 估算
+
+    Returns:
+        token 数
+    """
+    return counter_for(provider).count(text) if text else 0
+
+
+def estimate_prompt_tokens(messages: Iterable[Dict[str, Any]], provider: Optional[str] = None) -> int:
+    """
+    估算消息列表的输入 token 数
+
+    Args:
+        messages: chat 消息列表
+        provider: 厂商名称
+
+    Returns:
+        输入 token 数
+    """
+    counter = counter_for(provider)
+    tokens = REQUEST_OVERHEAD
+    for message in messages:
+        content = message.get("content")
+        tokens += MESSAGE_OVERHEAD + (counter.count(content) if isinstance(content, str) and content else 0)
+    return tokens
+
+
+def estimate_request_tokens(
+    messages: Iterable[Dict[str, Any]], max_output: Optional[int] = None, provider: Optional[str] = None
+) -> int:
+    """
+    估算一次请求会计入 TPM 的 token 数（输入 + 预期输出）
+
+    Args:
+        messages: chat 消息列表
+        max_output: 请求的最大输出 token 数，None 时按 DEFAULT_OUTPUT_TOKENS 预估
+        provider: 厂商名称
+
+    Returns:
+        预估 token 数
+    """
+    return estimate_prompt_tokens(messages, provider) + (max_output if max_output is not None else DEFAULT_OUTPUT_TOKENS)
+
+
+def estimate_usage(
+    messages: Iterable[Dict[str, Any]], output: str, provider: Optional[str] = None, reasoning: str = ""
+) -> Dict[str, int]:
+    """
+    按已收到的输出估算用量，用于流被取消、厂商没有返回 usage 的情况
+
+    Args:
+        messages: 发送的消息列表
+        output: 已收到的回答文本
+        provider: 厂商名称
+        reasoning: 已收到的推理过程，计入 completion_tokens，同时单独给出 reasoning_tokens
+
+    Returns:
+        与厂商 usage 相同格式的字典
+    """
+    prompt_tokens = estimate_prompt_tokens(messages, provider)
+    reasoning_tokens = estimate_tokens(reasoning, provider) if reasoning else 0
+    completion_tokens = estimate_tokens(output, provider) + reasoning_tokens
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    if reasoning_tokens:
+        usage["reasoning_tokens"] = reasoning_tokens
+    return usage
+
+
+# ------------- 价格 -------------
+@dataclass(frozen=True)
+class ModelPrice:
+    """
+    模型单价（元/百万 tokens），对应 models 表的 input_price / output_price
+    """
+    input: float
+    output: float
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> Tuple[float, float]:
+        """返回 (输入费用, 输出费用)，单位元"""
+        return prompt_tokens * self.input / 1e6, completion_tokens * self.output / 1e6
+
+
+PRICES: Dict[str, ModelPrice] = {
+    "qwen-plus": ModelPrice(0.8, 2.0),
+    "kimi-k2-0905-preview": ModelPrice(4.0, 16.0),
+    "deepseek-chat": ModelPrice(2.0, 3.0),
+    "deepseek-reasoner": ModelPrice(2.0, 3.0),
+    "gpt-5-nano": ModelPrice(0.05 * USD_TO_CNY, 0.40 * USD_TO_CNY),
+    "grok-code-fast": ModelPrice(0.20 * USD_TO_CNY, 1.50 * USD_TO_CNY),
+    "gemini-2.5-flash": ModelPrice(0.30 * USD_TO_CNY, 2.50 * USD_TO_CNY),
+}
+
+
+def register_price(model: str, input_price: float, output_price: float):
+    """
+    设置或覆盖模型单价
+
+    Args:
+        model: 模型名称
+        input_price: 输入价格（元/百万 tokens）
+        output_price: 输出价格（元/百万 tokens）
+    """
+    PRICES[model] = ModelPrice(input_price, output_price)
+
+
+def price_for(model: str) -> Optional[ModelPrice]:
+    """模型单价，未知模型返回 None"""
+    return PRICES.get(model)
+
+
+# ------------- 批量预估 -------------
+@dataclass
+class CostEstimate:
+    """
+    单个模型在一批 prompt 上的预估用量和费用
+    """
+    provider: str
+    model: str
+    requests: int
+    input_tokens: int
+    output_tokens: int
+    input_cost: Optional[float] = None
+    output_cost: Optional[float] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def total_cost(self) -> Optional[float]:
+        """总费用（元），模型不在价格表中时为 None"""
+        if self.input_cost is None:
+            return None
+        return self.input_cost + self.output_cost
+
+
+def project(spec, prompts: Sequence[Any], max_output: Optional[int] = None) -> CostEstimate:
+    """
+    预估一个模型跑完一组 prompt 的用量和费用
+
+    Args:
+        spec: ProviderSpec
+        prompts: 字符串或带 prompt / system 属性的对象（如 batch.PromptItem）
+        max_output: 每个请求预估的输出 token 数，None 时取 spec.params 中的 max_tokens，再没有则用 DEFAULT_OUTPUT_TOKENS
+
+    Returns:
+        CostEstimate
+    """
+    counter = counter_for(spec.name)
+    texts = [getattr(item, "prompt", item) for item in prompts]
+    # 同一批 prompt 往往共用一个系统消息，每种只计数一次
+    systems: Dict[str, int] = {}
+    system_tokens = 0
+    for item in prompts:
+        system = getattr(item, "system", None) or spec.system
+        cost = systems.get(system)
+        if cost is None:
+            cost = systems[system] = counter.count(system)
+        system_tokens += cost
+    overhead = REQUEST_OVERHEAD + 2 * MESSAGE_OVERHEAD
+    count_batch = getattr(counter, "count_batch", None)
+    counts = count_batch(texts) if count_batch is not None else map(counter.count, texts)
+    input_tokens = sum(counts) + system_tokens + overhead * len(texts)
+
+    if max_output is None:
+        max_output = spec.params.get("max_tokens", spec.params.get("max_output_tokens"))
+    output_tokens = (max_output if max_output is not None else DEFAULT_OUTPUT_TOKENS) * len(texts)
+
+    estimate = CostEstimate(spec.name, spec.model, len(texts), input_tokens, output_tokens)
+    price = price_for(spec.model)
+    if price is not None:
+        estimate.input_cost, estimate.output_cost = price.cost(input_tokens, output_tokens)
+    return estimate
+
+
+def project_batch(prompts: Sequence[Any], specs: Iterable[Any], max_output: Optional[int] = None) -> List[CostEstimate]:
+    """
+    预估 prompt × 模型 全组合的用量和费用
+
+    Args:
+        prompts: 字符串或带 prompt / system 属性的对象
+        specs: ProviderSpec 列表
+        max_output: 每个请求预估的输出 token 数
+
+    Returns:
+        每个模型一行 CostEstimate
+    """
+    prompts = list(prompts)
+    return [project(spec, prompts, max_output) for spec in specs]
+
+
+def format_projection(rows: List[CostEstimate]) -> str:
+    """把预估结果格式化为表格"""
+    lines = [f"{'模型':<40}{'请求数':>8}{'输入 tokens':>14}{'输出 tokens':>14}{'预估费用(元)':>14}"]
+    total, unpriced = 0.0, []
+    for row in rows:
+        cost = row.total_cost
+        if cost is None:
+            unpriced.append(row.model)
+        else:
+            total += cost
+        lines.append(
+            f"{row.provider + ':' + row.model:<40}{row.requests:>8}{row.input_tokens:>14}{row.output_tokens:>14}"
+            f"{f'{cost:.4f}' if cost is not None else '-':>14}"
+        )
+    lines.append(f"合计预估费用 {total:.4f} 元（输出 token 数按 max_tokens 或默认值估算，是上限）")
+    if unpriced:
+        lines.append(f"未知单价，未计入: {', '.join(unpriced)}")
+    return "\n".join(lines)
@@ -0,0 +1,193 @@
+"""
+统一的流式事件类型
+
+各厂商的流式输出（chat.completions 分片、Responses API 事件）都归一化为 StreamEvent，
+下游只需按 kind 分支，不再对每个分片做 isinstance 判断。
+StreamEvent 使用 __slots__，每个分片只分配一个小对象，时间戳直接复用 StreamMetrics 记录的读数。
+"""
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional
+
+from evalai.metrics import StreamMetrics
+
+# 事件类型
+TEXT = "text"            # 回答文本增量
+REASONING = "reasoning"  # 推理过程增量（DeepSeek reasoning_content、Responses API 推理摘要）
+USAGE = "usage"          # 流结束：用量（厂商未返回时为 None）与时延指标
+ERROR = "error"          # 流内错误事件
+
+# Responses API 中需要处理的事件
+_RESPONSES_TEXT = "response.output_text.delta"
+_RESPONSES_REASONING = ("response.reasoning_summary_text.delta", "response.reasoning_text.delta")
+_RESPONSES_DONE = "response.completed"
+_RESPONSES_ERROR = ("error", "response.failed")
+
+
+class StreamEvent:
+    """
+    单个流式事件
+
+    Attributes:
+        kind: 事件类型，TEXT / REASONING / USAGE / ERROR
+        text: 文本增量或错误信息
+        usage: 用量字典（prompt_tokens / completion_tokens / total_tokens，厂商返回推理 token 数时另有
+            reasoning_tokens，它已包含在 completion_tokens 中），仅 USAGE 事件
+        metrics: 本次请求的 StreamMetrics，仅 USAGE 事件
+        data: 厂商原始数据，例如 Responses API 的最终 response 对象
+        ts: time.perf_counter() 时间戳
+    """
+
+    __slots__ = ("kind", "text", "usage", "metrics", "data", "ts")
+
+    def __init__(
+        self,
+        kind: str,
+        text: str = "",
+        ts: float = 0.0,
+        usage: Optional[Dict[str, int]] = None,
+        metrics: Optional[StreamMetrics] = None,
+        data: Any = None,
+    ):
+        self.kind = kind
+        self.text = text
+        self.ts = ts
+        self.usage = usage
+        self.metrics = metrics
+        self.data = data
+
+    def __repr__(self):
+        if self.kind == USAGE:
+            return f"StreamEvent(usage, {self.usage})"
+        return f"StreamEvent({self.kind}, {self.text!r})"
+
+
+def _reasoning_tokens(details) -> Optional[int]:
+    # SDK 解析出的对象或兼容接口原样透传的字典
+    if details is None:
+        return None
+    if isinstance(details, dict):
+        return details.get("reasoning_tokens")
+    return getattr(details, "reasoning_tokens", None)
+
+
+def _chat_usage(usage) -> Dict[str, int]:
+    data = {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+    reasoning = _reasoning_tokens(getattr(usage, "completion_tokens_details", None))
+    if reasoning is not None:
+        data["reasoning_tokens"] = reasoning
+    return data
+
+
+def _responses_usage(usage) -> Dict[str, int]:
+    data = {
+        "prompt_tokens": usage.input_tokens,
+        "completion_tokens": usage.output_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+    reasoning = _reasoning_tokens(getattr(usage, "output_tokens_details", None))
+    if reasoning is not None:
+        data["reasoning_tokens"] = reasoning
+    return data
+
+
+def _close(resp):
+    # 调用方提前结束迭代时立即归还连接，否则连接会一直占用连接池
+    close = getattr(resp, "close", None)
+    if close is not None:
+        close()
+
+
+def _usage_event(metrics: StreamMetrics, usage: Optional[Dict[str, int]], data: Any = None) -> StreamEvent:
+    metrics.finish(usage["completion_tokens"] if usage else None, usage.get("reasoning_tokens") if usage else None)
+    return StreamEvent(USAGE, ts=metrics.finished_at, usage=usage, metrics=metrics, data=data)
+
+
+def iter_chat_events(resp: Iterable, metrics: StreamMetrics) -> Iterator[StreamEvent]:
+    """
+    把 chat.completions 流式响应归一化为 StreamEvent
+
+    最后一定产出一个 USAGE 事件；没有请求 include_usage 时其 usage 为 None。
+    迭代结束或被提前关闭时会关闭底层 HTTP 响应。
+
+    Args:
+        resp: client.chat.completions.create(stream=True) 的返回值
+        metrics: 本次请求的时延记录
+    """
+    usage = None
+    try:
+        for chunk in resp:
+            if chunk.choices:
+                delta = chunk.choices[0].delta
+                # DeepSeek Reasoner 的推理过程在 reasoning_content 中
+                reasoning = getattr(delta, "reasoning_content", None)
+                if reasoning:
+                    yield StreamEvent(REASONING, reasoning, metrics.mark_reasoning())
+                if delta.content:
+                    yield StreamEvent(TEXT, delta.content, metrics.mark_answer())
+            if chunk.usage:
+                usage = _chat_usage(chunk.usage)
+    finally:
+        _close(resp)
+    yield _usage_event(metrics, usage)
+
+
+async def aiter_chat_events(resp: AsyncIterator, metrics: StreamMetrics) -> AsyncIterator[StreamEvent]:
+    """iter_chat_events() 的异步版本"""
+    usage = None
+    async for chunk in resp:
+        if chunk.choices:
+            delta = chunk.choices[0].delta
+            reasoning = getattr(delta, "reasoning_content", None)
+            if reasoning:
+                yield StreamEvent(REASONING, reasoning, metrics.mark_reasoning())
+            if delta.content:
+                yield StreamEvent(TEXT, delta.content, metrics.mark_answer())
+        if chunk.usage:
+            usage = _chat_usage(chunk.usage)
+    yield _usage_event(metrics, usage)
+
+
+def _responses_event(event, metrics: StreamMetrics) -> Optional[StreamEvent]:
+    kind = event.type
+    if kind == _RESPONSES_TEXT:
+        return StreamEvent(TEXT, event.delta, metrics.mark_answer())
+    if kind in _RESPONSES_REASONING:
+        return StreamEvent(REASONING, event.delta, metrics.mark_reasoning())
+    if kind == _RESPONSES_DONE:
+        response = event.response
+        usage = _responses_usage(response.usage) if response.usage else None
+        return _usage_event(metrics, usage, data=response)
+    if kind in _RESPONSES_ERROR:
+        message = getattr(event, "message", None) or str(getattr(getattr(event, "response", None), "error", ""))
+        return StreamEvent(ERROR, message, metrics.mark_chunk(), data=event)
+    return None
+
+
+def iter_responses_events(resp: Iterable, metrics: StreamMetrics) -> Iterator[StreamEvent]:
+    """
+    把 Responses API 流式事件归一化为 StreamEvent
+
+    response.completed 对应 USAGE 事件，最终 response 对象放在 data 中。
+
+    Args:
+        resp: client.responses.create(stream=True) 的返回值
+        metrics: 本次请求的时延记录
+    """
+    try:
+        for raw in resp:
+            event = _responses_event(raw, metrics)
+            if event is not None:
+                yield event
+    finally:
+        _close(resp)
+
+
+async def aiter_responses_events(resp: AsyncIterator, metrics: StreamMetrics) -> AsyncIterator[StreamEvent]:
+    """iter_responses_events() 的异步版本"""
+    async for raw in resp:
+        event = _responses_event(raw, metrics)
+        if event is not None:
+            yield event
@@ -0,0 +1,345 @@
+"""
+请求历史导出（系统设计.md 中的「数据导出：支持 Excel、CSV、JSON 格式导出」）
+
+记录从 api_requests 按批读取（fetchmany），经生成器逐行写出，内存占用只和批大小有关，与总行数无关：
+    .csv / .jsonl / .json   逐行写入文本；文件名以 .gz / .bz2 / .xz 结尾时边写边压缩
+    .xlsx                   openpyxl 的 write-only 模式，行写出后即释放（需要安装 openpyxl）
+
+Excel 单元格最多 32767 个字符、单个工作表最多 1048576 行：超长的回答会被截断并计数，超出行数时自动新建工作表。
+
+用法：
+    stats = export_requests("requests.sqlite3", "history.csv.gz", where="created_at >= ?", params=(since,))
+    python -m evalai.export requests.sqlite3 -o history.xlsx --since 2025-10-01 --model qwen-plus
+"""
+import argparse
+import bz2
+import csv
+import functools
+import gzip
+import json
+import lzma
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+FORMATS = ("csv", "jsonl", "json", "xlsx")
+# 压缩级别取速度和体积的折中：gzip 用命令行默认的 6 级；xz 用 3 级，字典较小，内存占用约 30MB
+_COMPRESSORS: Dict[str, Callable[..., IO]] = {
+    ".gz": functools.partial(gzip.open, compresslevel=6),
+    ".bz2": bz2.open,
+    ".xz": functools.partial(lzma.open, preset=3),
+}
+XLSX_MAX_CELL = 32767
+XLSX_MAX_ROWS = 1048576
+
+
+class ExportError(Exception):
+    """导出相关异常"""
+    pass
+
+
+@dataclass
+class ExportStats:
+    """
+    导出结果
+
+    Attributes:
+        rows: 导出的行数
+        seconds: 耗时（秒）
+        bytes: 输出文件大小（字节，压缩后）
+        truncated_cells: 因超出 Excel 单元格上限被截断的单元格数
+    """
+    rows: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    truncated_cells: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def format(self) -> str:
+        text = (
+            f"导出 {self.rows} 行，用时 {self.seconds:.1f}s（{self.rows_per_second:.0f} 行/s），"
+            f"文件 {self.bytes / 1e6:.1f} MB"
+        )
+        if self.truncated_cells:
+            text += f"，{self.truncated_cells} 个单元格超出 Excel 上限已截断"
+        return text
+
+
+def table_columns(path: Union[str, Path]) -> List[str]:
+    """
+    api_requests 表实际的列（含 id、rating_score、rating_comment 等不由 RequestLogWriter 写入的列）
+
+    Args:
+        path: SQLite 文件路径
+
+    Returns:
+        按表定义顺序排列的列名
+    """
+    conn = sqlite3.connect(str(path))
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(api_requests)")]
+    finally:
+        conn.close()
+    if not columns:
+        raise ExportError(f"{path} 中没有 api_requests 表")
+    return columns
+
+
+def iter_requests(
+    path: Union[str, Path],
+    columns: Optional[Sequence[str]] = None,
+    where: Optional[str] = None,
+    params: Sequence[Any] = (),
+    chunk_size: int = 1000,
+) -> Iterator[Tuple]:
+    """
+    逐行读取 api_requests
+
+    Args:
+        path: SQLite 文件路径
+        columns: 要读取的列，None 表示表中的全部列
+        where: 可选的 WHERE 条件
+        params: where 中的参数
+        chunk_size: 每次 fetchmany 的行数，决定内存占用上限
+
+    Returns:
+        按 columns 顺序排列的元组迭代器
+    """
+    existing = table_columns(path)
+    columns = existing if columns is None else columns
+    unknown = [name for name in columns if name not in existing]
+    if unknown:
+        raise ExportError(f"api_requests 中没有这些列: {', '.join(unknown)}")
+    sql = f"SELECT {', '.join(columns)} FROM api_requests"
+    if where:
+        sql += f" WHERE {where}"
+    sql += " ORDER BY id"
+    conn = sqlite3.connect(str(path))
+    try:
+        cursor = conn.execute(sql, tuple(params))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def _format_time(ts: Optional[float]) -> Optional[str]:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) if ts is not None else None
+
+
+def _open_text(path: Path) -> IO[str]:
+    opener = _COMPRESSORS.get(path.suffix)
+    if opener is not None:
+        return opener(path, "wt", encoding="utf-8", newline="")
+    return path.open("w", encoding="utf-8", newline="")
+
+
+def detect_format(path: Union[str, Path]) -> str:
+    """按文件后缀（忽略压缩后缀）判断导出格式"""
+    path = Path(path)
+    suffixes = [s for s in path.suffixes if s not in _COMPRESSORS]
+    fmt = suffixes[-1].lstrip(".").lower() if suffixes else ""
+    if fmt not in FORMATS:
+        raise ExportError(f"无法从文件名 {path.name} 判断导出格式，可选: {', '.join(FORMATS)}")
+    return fmt
+
+
+class _Progress:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.rows = 0
+
+    def tick(self):
+        self.rows += 1
+        # 每 1000 行才取一次时间
+        if self.interval and not self.rows % 1000:
+            now = time.perf_counter()
+            if now - self.last >= self.interval:
+                self.last = now
+                print(f"已导出 {self.rows} 行，{self.rows / (now - self.started):.0f} 行/s", flush=True)
+
+
+def _write_csv(out: IO[str], header: Sequence[str], rows: Iterator[Tuple], progress: _Progress):
+    out.write("\ufeff")  # BOM，Excel 打开 UTF-8 CSV 时不会乱码
+    writer = csv.writer(out)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        progress.tick()
+
+
+def _write_jsonl(out: IO[str], header: Sequence[str], rows: Iterator[Tuple], progress: _Progress):
+    dumps = json.dumps
+    for row in rows:
+        out.write(dumps(dict(zip(header, row)), ensure_ascii=False))
+        out.write("\n")
+        progress.tick()
+
+
+def _write_json(out: IO[str], header: Sequence[str], rows: Iterator[Tuple], progress: _Progress):
+    # 逐个元素写出 JSON 数组，不在内存中拼出整个列表
+    dumps = json.dumps
+    out.write("[")
+    separator = "\n"
+    for row in rows:
+        out.write(separator)
+        out.write(dumps(dict(zip(header, row)), ensure_ascii=False))
+        separator = ",\n"
+        progress.tick()
+    out.write("\n]\n")
+
+
+def _write_xlsx(path: Path, header: Sequence[str], rows: Iterator[Tuple], progress: _Progress, stats: ExportStats):
+    try:
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    except ImportError as e:
+        raise ExportError("导出 XLSX 需要安装 openpyxl（pip install openpyxl）") from e
+
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    sub = ILLEGAL_CHARACTERS_RE.sub
+    for row in rows:
+        if sheet_rows >= XLSX_MAX_ROWS:
+            sheet = workbook.create_sheet(f"api_requests_{len(workbook.worksheets) + 1}")
+            sheet.append(list(header))
+            sheet_rows = 1
+        cells = []
+        for value in row:
+            if isinstance(value, str):
+                value = sub("", value)  # 控制字符会导致 openpyxl 报错
+                if len(value) > XLSX_MAX_CELL:
+                    value = value[:XLSX_MAX_CELL]
+                    stats.truncated_cells += 1
+            cells.append(value)
+        sheet.append(cells)
+        sheet_rows += 1
+        progress.tick()
+    if sheet is None:
+        workbook.create_sheet("api_requests_1").append(list(header))
+    workbook.save(path)
+
+
+def export_rows(
+    rows: Iterator[Tuple],
+    header: Sequence[str],
+    output: Union[str, Path],
+    fmt: Optional[str] = None,
+    report_interval: float = 5.0,
+) -> ExportStats:
+    """
+    把行迭代器写入文件
+
+    Args:
+        rows: 按 header 顺序排列的元组迭代器
+        header: 列名
+        output: 输出路径；.gz / .bz2 / .xz 后缀表示边写边压缩（XLSX 本身已压缩，不支持）
+        fmt: 导出格式，None 时按文件后缀判断
+        report_interval: 打印进度的间隔（秒），0 表示不打印
+
+    Returns:
+        ExportStats
+    """
+    output = Path(output)
+    fmt = fmt or detect_format(output)
+    if fmt not in FORMATS:
+        raise ExportError(f"不支持的导出格式 {fmt}，可选: {', '.join(FORMATS)}")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    stats = ExportStats()
+    progress = _Progress(report_interval)
+    if fmt == "xlsx":
+        if output.suffix in _COMPRESSORS:
+            raise ExportError("XLSX 本身就是压缩格式，不需要再压缩")
+        _write_xlsx(output, header, rows, progress, stats)
+    else:
+        writer = {"csv": _write_csv, "jsonl": _write_jsonl, "json": _write_json}[fmt]
+        with _open_text(output) as out:
+            writer(out, header, rows, progress)
+    stats.rows = progress.rows
+    stats.seconds = time.perf_counter() - progress.started
+    stats.bytes = os.path.getsize(output)
+    return stats
+
+
+def export_requests(
+    db: Union[str, Path],
+    output: Union[str, Path],
+    columns: Optional[Sequence[str]] = None,
+    where: Optional[str] = None,
+    params: Sequence[Any] = (),
+    fmt: Optional[str] = None,
+    report_interval: float = 5.0,
+) -> ExportStats:
+    """
+    把 api_requests 导出为 CSV / JSONL / JSON / XLSX
+
+    Args:
+        db: RequestLogWriter 写入的 SQLite 文件
+        output: 输出路径
+        columns: 导出的列，None 表示表中的全部列（含评分）
+        where: 可选的 WHERE 条件，例如 "model = ? AND created_at >= ?"
+        params: where 中的参数
+        fmt: 导出格式，None 时按文件后缀判断
+        report_interval: 打印进度的间隔（秒），0 表示不打印
+
+    Returns:
+        ExportStats
+    """
+    columns = list(columns) if columns else table_columns(db)
+    rows = iter_requests(db, columns, where, params)
+    if "created_at" in columns:
+        # 时间戳转成本地时间，表格软件里可以直接阅读和筛选
+        i = columns.index("created_at")
+        rows = (row[:i] + (_format_time(row[i]),) + row[i + 1:] for row in rows)
+    return export_rows(rows, columns, output, fmt, report_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出 api_requests 请求历史")
+    parser.add_argument("db", help="SQLite 日志库")
+    parser.add_argument("-o", "--output", required=True, help="输出文件（.csv / .jsonl / .json / .xlsx，可加 .gz / .bz2 / .xz）")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="导出格式，默认按文件后缀判断")
+    parser.add_argument("--columns", nargs="+", default=None, help="只导出这些列")
+    parser.add_argument("--since", default=None, help="起始日期（YYYY-MM-DD）")
+    parser.add_argument("--until", default=None, help="结束日期（YYYY-MM-DD，不含）")
+    parser.add_argument("--model", default=None, help="只导出该模型")
+    parser.add_argument("--category", default=None, help="只导出该分类")
+    args = parser.parse_args()
+
+    conditions, params = [], []
+    if args.since:
+        conditions.append("created_at >= ?")
+        params.append(time.mktime(time.strptime(args.since, "%Y-%m-%d")))
+    if args.until:
+        conditions.append("created_at < ?")
+        params.append(time.mktime(time.strptime(args.until, "%Y-%m-%d")))
+    if args.model:
+        conditions.append("model = ?")
+        params.append(args.model)
+    if args.category:
+        conditions.append("prompt_category = ?")
+        params.append(args.category)
+    try:
+        stats = export_requests(
+            args.db, args.output, columns=args.columns,
+            where=" AND ".join(conditions) or None, params=params, fmt=args.format,
+        )
+    except ExportError as e:
+        parser.error(str(e))
+    print(stats.format())
+
+
+if __name__ == "__main__":
+    main()
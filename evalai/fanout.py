@@ -0,0 +1,514 @@
+"""
+多模型并发对比引擎
+
+把同一个 prompt 同时发送给多个厂商（asyncio + AsyncOpenAI），用信号量限制同时进行的请求数。
+总耗时约等于最慢的那个模型，而不是所有模型耗时之和。
+"""
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from openai import AsyncOpenAI
+
+from evalai.cache import CACHE_HIT, ResponseCache, acached_stream, make_key
+from evalai.events import ERROR, REASONING, TEXT, USAGE, StreamEvent, aiter_chat_events, aiter_responses_events
+from evalai.health import HealthMonitor
+from evalai.hedge import HedgePolicy, hedged_stream
+from evalai.ledger import BalanceLedger, Hold, InsufficientBalance, estimate_cost, usage_cost
+from evalai.limits import OutputLimits, Truncated, alimit_events
+from evalai.metrics import StreamMetrics
+from evalai.providers import ProviderSpec, get_provider
+from evalai.estimate import estimate_prompt_tokens, estimate_request_tokens, estimate_usage
+from evalai.ratelimit import RateLimiter
+from evalai.requestlog import RequestLogWriter, RequestRecord
+from evalai.transport import registry
+
+
+class FirstTokenTimeout(Exception):
+    """首个 token 未在限定时间内到达"""
+    pass
+
+
+async def _first_token_deadline(events: AsyncIterator[StreamEvent], timeout: float) -> AsyncIterator[StreamEvent]:
+    # 只限制第一个 TEXT / REASONING 事件之前的等待时间，之后的输出不受影响
+    it = events.__aiter__()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(it.__anext__(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise FirstTokenTimeout(timeout) from None
+            except StopAsyncIteration:
+                return
+            yield event
+            if event.kind in (TEXT, REASONING):
+                break
+        async for event in it:
+            yield event
+    finally:
+        await it.aclose()
+
+
+@dataclass
+class ModelResult:
+    """
+    单个模型的对比结果
+    """
+    provider: str
+    model: str
+    text: str = ""
+    reasoning: str = ""
+    usage: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+    cached: bool = False
+    timed_out: bool = False
+    truncated: Optional[str] = None
+    usage_estimated: bool = False
+    metrics: StreamMetrics = field(default_factory=StreamMetrics)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """首个 token 响应时间（秒）"""
+        return self.metrics.ttft
+
+    @property
+    def duration(self) -> float:
+        """完成时间（秒）"""
+        return self.metrics.duration or 0.0
+
+    def to_dict(self) -> Dict:
+        """导出为可 JSON 序列化的字典"""
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "text": self.text,
+            "reasoning": self.reasoning,
+            "usage": self.usage,
+            "error": self.error,
+            "cached": self.cached,
+            "truncated": self.truncated,
+            "usage_estimated": self.usage_estimated,
+            "metrics": self.metrics.to_dict(),
+        }
+
+
+class FanOutEngine:
+    """
+    一个 prompt 并发发给多个厂商
+    """
+
+    def __init__(
+        self,
+        providers: Iterable[Union[str, ProviderSpec]],
+        concurrency: int = 4,
+        timeout: Optional[float] = None,
+        cache: Optional[ResponseCache] = None,
+        cache_timing: bool = False,
+        request_log: Optional[RequestLogWriter] = None,
+        limiter: Optional[RateLimiter] = None,
+        hedge: Optional[HedgePolicy] = None,
+        on_event: Optional[Callable[[ProviderSpec, StreamEvent], None]] = None,
+        limits: Optional[OutputLimits] = None,
+        health: Optional[HealthMonitor] = None,
+        ledger: Optional[BalanceLedger] = None,
+        user_id: Optional[int] = None,
+    ):
+        """
+        初始化并发引擎
+
+        Args:
+            providers: 厂商名称（支持 "厂商:模型"）或 ProviderSpec 列表
+            concurrency: 同时进行的请求数上限
+            timeout: 单个模型的超时时间（秒），None 表示不限制
+            cache: 回答缓存，None 表示不使用缓存
+            cache_timing: 缓存命中时是否按录制时的时间间隔回放
+            request_log: api_requests 日志器，每个请求结束后写入一条记录
+            limiter: 速率限制器；设置后由它负责 429、连接错误、超时和 5xx 的重试，SDK 自身不再重试
+            hedge: 对冲策略；首个事件迟迟不到时再发一个相同请求，取先到者
+            on_event: 每收到一个事件时的回调（例如 SideBySideRenderer.feed），需要足够快，不能阻塞
+            limits: 输出硬限制；超限时立即关闭连接，结果记为截断而不是失败
+            health: 健康监控；熔断中的厂商直接返回失败，不发请求，每个请求的结果都会记入监控
+            ledger: 预充值余额账本；发请求前预留预估费用，余额不足时直接返回失败，结束后按实际用量结算
+            user_id: 扣费的用户 ID，设置 ledger 时必填
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency 必须大于 0")
+        if ledger is not None and user_id is None:
+            raise ValueError("设置 ledger 时必须指定 user_id")
+        self.specs = [p if isinstance(p, ProviderSpec) else get_provider(p) for p in providers]
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.cache = cache
+        self.cache_timing = cache_timing
+        self.request_log = request_log
+        self.limiter = limiter
+        self.hedge = hedge
+        self.on_event = on_event
+        self.limits = limits
+        self.health = health
+        self.ledger = ledger
+        self.user_id = user_id
+        self._clients: Dict[Tuple[Optional[str], str], AsyncOpenAI] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        """释放引擎持有的客户端；底层连接池由 evalai.transport.registry 统一管理，不在这里关闭"""
+        self._clients = {}
+
+    def _client(self, spec: ProviderSpec) -> AsyncOpenAI:
+        # 同一 base_url + 密钥的多个模型（如 deepseek-chat / deepseek-reasoner）共用一个客户端
+        key = (spec.base_url, spec.api_key_env)
+        client = self._clients.get(key)
+        if client is None:
+            client = registry.async_openai_client(spec.api_key(), spec.base_url, proxy=spec.proxy())
+            if self.limiter is not None:
+                # 429、连接错误、超时和 5xx 都由 RateLimiter.call() 重试，SDK 再重试会绕过限速
+                client = client.with_options(max_retries=0)
+            self._clients[key] = client
+        return client
+
+    async def warm_up(self, connections: int = 1) -> Dict[str, int]:
+        """
+        预先为每个厂商打开连接，让建连和 TLS 握手不计入首 token 时间
+
+        Args:
+            connections: 每个 base_url 预先打开的连接数
+
+        Returns:
+            {base_url: 成功建立的连接数}
+        """
+        targets = {(spec.base_url, spec.proxy()) for spec in self.specs}
+        counts = await asyncio.gather(
+            *(registry.async_warm_up(base_url, connections, proxy=proxy) for base_url, proxy in targets)
+        )
+        return {base_url or "openai": count for (base_url, _), count in zip(targets, counts)}
+
+    async def run(self, prompt: str, system: Optional[str] = None, **extra) -> List[ModelResult]:
+        """
+        并发执行一次对比
+
+        Args:
+            prompt: 用户提示词
+            system: 系统消息，None 时使用各厂商默认值
+            **extra: 额外请求参数，会覆盖厂商默认参数
+
+        Returns:
+            与 providers 顺序一致的 ModelResult 列表；单个模型失败只记录在其 error 中
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def guarded(spec: ProviderSpec) -> ModelResult:
+            async with semaphore:
+                return await self.run_one(spec, prompt, system, **extra)
+
+        return list(await asyncio.gather(*(guarded(spec) for spec in self.specs)))
+
+    async def run_one(
+        self,
+        spec: ProviderSpec,
+        prompt: str,
+        system: Optional[str] = None,
+        first_token_timeout: Optional[float] = None,
+        **extra,
+    ) -> ModelResult:
+        """
+        对单个厂商执行一次请求并收集完整结果（不受 concurrency 限制）
+
+        Args:
+            spec: 厂商配置
+            prompt: 用户提示词
+            system: 系统消息
+            first_token_timeout: 首 token 的最长等待时间（秒），超过后放弃并记为超时
+            **extra: 额外请求参数
+
+        Returns:
+            ModelResult；失败和超时记录在 error 中，不抛出异常
+        """
+        result = ModelResult(provider=spec.name, model=spec.model)
+        result.metrics.mark_sent()
+        if self.health is not None and not self.health.allow(spec):
+            # 熔断中：立即失败，不占用并发名额等待超时
+            retry_after = self.health.breaker(spec).retry_after()
+            result.error = f"熔断中：{spec.name} 最近连续失败，{retry_after:.0f}s 后再试"
+            result.metrics.finish()
+            return result
+        hold, balance = None, None
+        if self.ledger is not None:
+            await self.ledger.aload(self.user_id)  # 第一次用到该用户时要读库，放到线程里
+            try:
+                hold = self.ledger.reserve(self.user_id, self._estimate_cost(spec, prompt, system, extra))
+            except InsufficientBalance as e:
+                result.error = str(e)
+                result.metrics.finish()
+                return result
+        try:
+            await asyncio.wait_for(
+                self._collect(spec, prompt, system, extra, result, first_token_timeout), self.timeout
+            )
+        except asyncio.TimeoutError:
+            result.error = f"超时（{self.timeout}s）"
+            result.timed_out = True
+        except FirstTokenTimeout:
+            result.error = f"首 token 超时（{first_token_timeout}s）"
+            result.timed_out = True
+        except Exception as e:
+            result.error = f"API 请求失败: {e}"
+        finally:
+            if result.truncated is not None:
+                result.usage_estimated = True
+            elif result.usage is None and (result.text or result.reasoning):
+                # 超时或中途断开时厂商不会再返回用量，已生成的部分同样计费，按收到的文本估算
+                result.usage = estimate_usage(
+                    _messages(spec, prompt, system), result.text, spec.name, reasoning=result.reasoning
+                )
+                result.usage_estimated = True
+            metrics = result.metrics
+            if metrics.finished_at is None:
+                usage = result.usage
+                metrics.finish(
+                    usage["completion_tokens"] if usage else None, usage.get("reasoning_tokens") if usage else None
+                )
+            if hold is not None:
+                # 放在 finally 中：请求被取消时也要结算已生成的部分或释放预留
+                balance = self._settle(hold, spec, result)
+        if self.health is not None:
+            self.health.record_result(result)
+        if self.request_log is not None:
+            record = RequestRecord.from_result(result, prompt, api_key=os.getenv(spec.api_key_env), user_id=self.user_id)
+            if balance is not None:
+                record.balance_before, record.balance_after = balance
+            # 只是入队，真正的写入在后台线程；队列满需要等待时不阻塞事件循环
+            await self.request_log.alog(record)
+        return result
+
+    def _estimate_cost(self, spec: ProviderSpec, prompt: str, system: Optional[str], extra: Dict) -> Optional[float]:
+        # 与 stream() 的参数合并顺序一致，按最终生效的输出上限预留
+        params = {**spec.params, **(self.limits.request_params(spec.api) if self.limits else {}), **extra}
+        max_output = params.get("max_tokens", params.get("max_output_tokens"))
+        return estimate_cost(spec.model, _messages(spec, prompt, system), max_output, spec.name)
+
+    def _settle(self, hold: Hold, spec: ProviderSpec, result: ModelResult) -> Optional[Tuple[float, float]]:
+        if result.cached or result.usage is None:
+            # 缓存回放和没有产生输出的失败都不计费
+            self.ledger.release(hold)
+            return None
+        return self.ledger.settle(hold, usage_cost(spec.model, result.usage))
+
+    async def _collect(
+        self,
+        spec: ProviderSpec,
+        prompt: str,
+        system: Optional[str],
+        extra: Dict,
+        result: ModelResult,
+        first_token_timeout: Optional[float] = None,
+    ):
+        text, reasoning = [], []
+        on_event = self.on_event
+        events = self.stream(spec, prompt, system, result.metrics, **extra)
+        if first_token_timeout is not None:
+            events = _first_token_deadline(events, first_token_timeout)
+        try:
+            async for event in events:
+                if on_event is not None:
+                    on_event(spec, event)
+                kind = event.kind
+                if kind == TEXT:
+                    text.append(event.text)
+                elif kind == REASONING:
+                    reasoning.append(event.text)
+                elif kind == USAGE:
+                    result.usage = event.usage
+                    result.cached = event.data == CACHE_HIT
+                    if isinstance(event.data, Truncated):
+                        result.truncated = event.data.reason
+                elif kind == ERROR:
+                    result.error = event.text
+        finally:
+            result.text = "".join(text)
+            result.reasoning = "".join(reasoning)
+
+    async def stream(
+        self,
+        spec: ProviderSpec,
+        prompt: str,
+        system: Optional[str] = None,
+        metrics: Optional[StreamMetrics] = None,
+        **extra,
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        单个厂商的异步事件流
+
+        Args:
+            spec: 厂商配置
+            prompt: 用户提示词
+            system: 系统消息，None 时使用厂商默认值
+            metrics: 时延记录，None 时新建
+            **extra: 额外请求参数，会覆盖厂商默认参数
+
+        Returns:
+            StreamEvent 异步迭代器，最后一个事件为 USAGE（或 ERROR）
+        """
+        metrics = metrics if metrics is not None else StreamMetrics()
+        limits = self.limits
+        params = {**spec.params, **(limits.request_params(spec.api) if limits else {}), **extra}
+        system = system or spec.system
+        prompt_tokens = estimate_prompt_tokens(_messages(spec, prompt, system), spec.name)
+        if self.cache is None:
+            events = self._open(spec, prompt, system, metrics, params)
+        else:
+            key = make_key(spec.name, spec.model, system, [{"role": "user", "content": prompt}], params)
+            events = acached_stream(
+                self.cache, key, lambda: self._open(spec, prompt, system, metrics, params),
+                self.cache_timing, metrics,
+            )
+        if limits is not None:
+            # 放在缓存外层：被截断的流不会写入缓存
+            events = alimit_events(events, limits, metrics, prompt_tokens, spec.name)
+        async for event in events:
+            yield event
+
+    def _open(
+        self, spec: ProviderSpec, prompt: str, system: str, metrics: StreamMetrics, params: Dict
+    ) -> AsyncIterator[StreamEvent]:
+        if self.hedge is None:
+            return self._live_stream(spec, prompt, system, metrics, params)
+        sent = asyncio.Event()  # 限速器放行后置位，对冲计时从这时开始
+        return hedged_stream(
+            self.hedge, spec.name,
+            lambda m: self._live_stream(spec, prompt, system, m, params, sent.set),
+            metrics, _messages(spec, prompt, system), spec.model, sent,
+        )
+
+    async def _live_stream(
+        self,
+        spec: ProviderSpec,
+        prompt: str,
+        system: str,
+        metrics: StreamMetrics,
+        params: Dict,
+        on_sent: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[StreamEvent]:
+        client = self._client(spec)
+        messages = _messages(spec, prompt, system)
+
+        async def create():
+            metrics.mark_sent()  # 限速排队的时间不计入首 token 时间
+            if on_sent is not None:
+                on_sent()
+            if spec.api == "responses":
+                return await client.responses.create(
+                    model=spec.model,
+                    input=messages[1:],
+                    instructions=system,
+                    stream=True,
+                    **params,
+                )
+            return await client.chat.completions.create(
+                model=spec.model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **params,
+            )
+
+        reservation = None
+        if self.limiter is None:
+            resp = await create()
+        else:
+            max_output = params.get("max_tokens", params.get("max_output_tokens"))
+            reservation, resp = await self.limiter.call(
+                spec.name, client.api_key, estimate_request_tokens(messages, max_output, spec.name), create
+            )
+        events = aiter_responses_events(resp, metrics) if spec.api == "responses" else aiter_chat_events(resp, metrics)
+        used = None
+        try:
+            async for event in events:
+                if event.kind == USAGE and event.usage:
+                    used = event.usage["total_tokens"]
+                yield event
+        finally:
+            # 提前结束（超时、取消、调用方 break）时立即关闭连接，不再继续接收
+            await resp.close()
+            if reservation is not None:
+                self.limiter.settle(reservation, used)
+
+
+def _messages(spec: ProviderSpec, prompt: str, system: Optional[str]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system or spec.system},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def fan_out(
+    prompt: str,
+    providers: Iterable[Union[str, ProviderSpec]],
+    concurrency: int = 4,
+    timeout: Optional[float] = None,
+    system: Optional[str] = None,
+    warm_up: bool = False,
+    cache: Optional[ResponseCache] = None,
+    cache_timing: bool = False,
+    request_log: Optional[RequestLogWriter] = None,
+    limiter: Optional[RateLimiter] = None,
+    hedge: Optional[HedgePolicy] = None,
+    on_event: Optional[Callable[[ProviderSpec, StreamEvent], None]] = None,
+    limits: Optional[OutputLimits] = None,
+    health: Optional[HealthMonitor] = None,
+    ledger: Optional[BalanceLedger] = None,
+    user_id: Optional[int] = None,
+    **extra,
+) -> List[ModelResult]:
+    """
+    同步入口：并发对比一次并返回各模型结果
+
+    Args:
+        prompt: 用户提示词
+        providers: 厂商名称或 ProviderSpec 列表
+        concurrency: 同时进行的请求数上限
+        timeout: 单个模型的超时时间（秒）
+        system: 系统消息
+        warm_up: 是否在发送请求前预热连接
+        cache: 回答缓存，None 表示不使用缓存
+        cache_timing: 缓存命中时是否按录制时的时间间隔回放
+        request_log: api_requests 日志器
+        limiter: 速率限制器
+        hedge: 对冲策略
+        on_event: 每收到一个事件时的回调
+        limits: 输出硬限制
+        health: 健康监控与熔断
+        ledger: 预充值余额账本
+        user_id: 扣费的用户 ID
+        **extra: 额外请求参数
+
+    Returns:
+        ModelResult 列表
+    """
+    async def _main():
+        try:
+            async with FanOutEngine(
+                providers, concurrency=concurrency, timeout=timeout, cache=cache, cache_timing=cache_timing,
+                request_log=request_log, limiter=limiter, hedge=hedge,
+                on_event=on_event, limits=limits, health=health, ledger=ledger, user_id=user_id,
+            ) as engine:
+                if warm_up:
+                    await engine.warm_up()
+                return await engine.run(prompt, system=system, **extra)
+        finally:
+            # asyncio.run 结束后事件循环即失效，连接池随之关闭
+            await registry.aclose()
+
+    return asyncio.run(_main())
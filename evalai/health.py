@@ -0,0 +1,501 @@
+"""
+厂商健康监控与熔断（系统设计.md 中的「服务监控」「SLA 跟踪」）
+
+后台线程按固定间隔向每个厂商/模型发送极小的流式请求（max_tokens=1），记录首 token 时间和总耗时；
+FanOutEngine 传入 health 后，真实请求的结果同样会记录下来。
+
+时延分布用 HDR 风格的对数-线性直方图保存：1ms 到 10 分钟分成约 1000 个桶，相对误差不超过 1/64；
+滚动窗口由若干时间片组成，过期的时间片整体清零复用，内存占用固定，与请求数量无关。
+
+熔断器（CircuitBreaker）连续失败 failure_threshold 次后打开：这段时间内的请求直接失败，不再等待超时，
+并行对比时其它模型不会被拖住；冷却 reset_timeout 秒后放行一个试探请求（半开），成功则恢复，
+失败则冷却时间加倍（最多 max_reset_timeout）。后台探测成功同样会关闭熔断器。
+
+用法：
+    with HealthMonitor(["qwen", "kimi", "deepseek-chat"], interval=60) as health:
+        fan_out(prompt, providers, health=health)
+        print(health.format())
+    python -m evalai.health -m qwen kimi deepseek-chat gpt --interval 30
+"""
+import argparse
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from evalai.events import ERROR, REASONING, TEXT, iter_chat_events, iter_responses_events
+from evalai.metrics import StreamMetrics
+from evalai.providers import ProviderSpec, get_provider
+from evalai.transport import registry
+
+# 直方图：前 128 个桶每个 1ms，之后每个 2 的幂区间分 64 个桶
+_SUB_BITS = 7
+_SUB = 1 << _SUB_BITS
+_HALF = _SUB // 2
+MAX_MS = 10 * 60 * 1000
+BUCKETS = _SUB + (MAX_MS.bit_length() - _SUB_BITS) * _HALF
+_ZEROS = bytes(array("L").itemsize * BUCKETS)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+Key = Tuple[str, str]
+
+
+def _bucket(ms: int) -> int:
+    if ms < _SUB:
+        return ms if ms > 0 else 0
+    if ms > MAX_MS:
+        ms = MAX_MS
+    shift = ms.bit_length() - _SUB_BITS
+    return _SUB + (shift - 1) * _HALF + (ms >> shift) - _HALF
+
+
+def _bucket_value(index: int) -> float:
+    """桶的中点（毫秒）"""
+    if index < _SUB:
+        return float(index)
+    shift = (index - _SUB) // _HALF + 1
+    low = ((index - _SUB) % _HALF + _HALF) << shift
+    return low + ((1 << shift) - 1) / 2
+
+
+class RollingHistogram:
+    """
+    固定内存的滚动时延直方图
+
+    窗口分为 slices 个时间片，每个时间片一组计数；写入时若时间片已过期则先清零。
+    """
+
+    __slots__ = ("slice_seconds", "slices", "_counts", "_sums", "_epochs")
+
+    def __init__(self, window: float = 3600.0, slices: int = 12):
+        """
+        Args:
+            window: 统计窗口（秒）
+            slices: 窗口分成的时间片数，越多过期越平滑
+        """
+        if window <= 0 or slices < 1:
+            raise ValueError("window 和 slices 必须大于 0")
+        self.slice_seconds = window / slices
+        self.slices = slices
+        self._counts = [array("L", _ZEROS) for _ in range(slices)]
+        self._sums = [0.0] * slices
+        self._epochs = [-1] * slices
+
+    def _slot(self, now: float) -> int:
+        epoch = int(now // self.slice_seconds)
+        slot = epoch % self.slices
+        if self._epochs[slot] != epoch:
+            self._counts[slot] = array("L", _ZEROS)
+            self._sums[slot] = 0.0
+            self._epochs[slot] = epoch
+        return slot
+
+    def record(self, seconds: float, now: Optional[float] = None):
+        """记录一次时延（秒）"""
+        slot = self._slot(time.time() if now is None else now)
+        self._counts[slot][_bucket(int(seconds * 1000))] += 1
+        self._sums[slot] += seconds
+
+    def _live(self, now: float) -> List[int]:
+        oldest = int(now // self.slice_seconds) - self.slices + 1
+        return [slot for slot, epoch in enumerate(self._epochs) if epoch >= oldest]
+
+    def snapshot(self, now: Optional[float] = None) -> Tuple[List[int], float]:
+        """窗口内合并后的 (各桶计数, 时延总和)"""
+        live = self._live(time.time() if now is None else now)
+        merged = [0] * BUCKETS
+        total = 0.0
+        for slot in live:
+            total += self._sums[slot]
+            for i, c in enumerate(self._counts[slot]):
+                if c:
+                    merged[i] += c
+        return merged, total
+
+    def percentiles(self, qs: Iterable[float] = (50, 95, 99), now: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """
+        窗口内的时延分位数
+
+        Returns:
+            {"count", "mean", "p50", ...}，时延单位为秒；没有数据时分位数为 None
+        """
+        counts, total = self.snapshot(now)
+        n = sum(counts)
+        qs = sorted(qs)
+        result: Dict[str, Optional[float]] = {"count": n, "mean": total / n if n else None}
+        if not n:
+            result.update({f"p{q:g}": None for q in qs})
+            return result
+        targets = [(q, max(1, -(-q * n // 100))) for q in qs]  # 第 ceil(q% × n) 个值
+        seen = 0
+        it = iter(targets)
+        q, rank = next(it)
+        for index, c in enumerate(counts):
+            seen += c
+            while seen >= rank:
+                result[f"p{q:g}"] = _bucket_value(index) / 1000
+                try:
+                    q, rank = next(it)
+                except StopIteration:
+                    return result
+        return result
+
+
+class CircuitBreaker:
+    """
+    连续失败计数熔断器（线程安全）
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0, max_reset_timeout: float = 300.0):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后打开
+            reset_timeout: 打开后多久进入半开、放行一个试探请求（秒）
+            max_reset_timeout: 试探失败时冷却时间翻倍的上限（秒）
+        """
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold 必须大于 0")
+        self.failure_threshold = failure_threshold
+        self.base_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """当前是否放行请求；半开状态只放行一个试探请求"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            # 试探请求一直没有结果（例如被取消）时，再过一个冷却周期放行下一个
+            if now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.opened_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> float:
+        """距离下一次试探还有多少秒"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.reset_timeout = self.base_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                # 试探失败：重新打开并延长冷却时间
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self._open()
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+
+
+@dataclass
+class ProbeResult:
+    """单次探测结果"""
+    provider: str
+    model: str
+    ok: bool
+    ttft: Optional[float] = None
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+
+class _Endpoint:
+    # 探测线程和事件循环线程都会调用 record()；计数和直方图（含过期时间片的清零）都在 lock 下读写
+    __slots__ = ("spec", "ttft", "latency", "breaker", "requests", "errors", "last_error", "last_checked", "lock")
+
+    def __init__(self, spec: ProviderSpec, window: float, breaker: CircuitBreaker):
+        self.spec = spec
+        self.ttft = RollingHistogram(window)
+        self.latency = RollingHistogram(window)
+        self.breaker = breaker
+        self.requests = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+class HealthMonitor:
+    """
+    按厂商/模型维护时延直方图和熔断器，可选地在后台定时探测
+    """
+
+    def __init__(
+        self,
+        providers: Iterable[Union[str, ProviderSpec]],
+        interval: float = 60.0,
+        timeout: float = 15.0,
+        prompt: str = "hi",
+        window: float = 3600.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        max_reset_timeout: float = 300.0,
+    ):
+        """
+        Args:
+            providers: 厂商名称（支持 "厂商:模型"）或 ProviderSpec 列表
+            interval: 后台探测间隔（秒）
+            timeout: 单次探测的超时时间（秒），超时记为失败
+            prompt: 探测用的提示词
+            window: 直方图统计窗口（秒）
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断后多久放行试探请求（秒）
+            max_reset_timeout: 冷却时间上限（秒）
+        """
+        if interval <= 0:
+            raise ValueError("interval 必须大于 0")
+        self.interval = interval
+        self.timeout = timeout
+        self.prompt = prompt
+        self.probes = 0
+        self._endpoints: Dict[Key, _Endpoint] = {}
+        for p in providers:
+            spec = p if isinstance(p, ProviderSpec) else get_provider(p)
+            self._endpoints[(spec.name, spec.model)] = _Endpoint(
+                spec, window, CircuitBreaker(failure_threshold, reset_timeout, max_reset_timeout)
+            )
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _endpoint(self, provider: str, model: str) -> Optional[_Endpoint]:
+        return self._endpoints.get((provider, model))
+
+    def breaker(self, spec: ProviderSpec) -> Optional[CircuitBreaker]:
+        """spec 对应的熔断器，未登记的厂商返回 None"""
+        endpoint = self._endpoint(spec.name, spec.model)
+        return endpoint.breaker if endpoint is not None else None
+
+    def allow(self, spec: ProviderSpec) -> bool:
+        """是否应当发出请求；熔断中返回 False，调用方应直接失败"""
+        breaker = self.breaker(spec)
+        return breaker is None or breaker.allow()
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        ok: bool,
+        ttft: Optional[float] = None,
+        duration: Optional[float] = None,
+        error: Optional[str] = None,
+    ):
+        """
+        记录一次请求的结果（探测请求和真实请求都用这个入口）
+
+        Args:
+            provider: 厂商名称
+            model: 模型名称
+            ok: 是否成功
+            ttft: 首 token 时间（秒）
+            duration: 总耗时（秒）
+            error: 失败原因
+        """
+        endpoint = self._endpoint(provider, model)
+        if endpoint is None:
+            return
+        now = time.time()
+        with endpoint.lock:
+            endpoint.requests += 1
+            endpoint.last_checked = now
+            if ok:
+                if ttft is not None:
+                    endpoint.ttft.record(ttft, now)
+                if duration is not None:
+                    endpoint.latency.record(duration, now)
+            else:
+                endpoint.errors += 1
+                endpoint.last_error = error
+        if ok:
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.record_failure()
+
+    def record_result(self, result):
+        """记录 FanOutEngine 的 ModelResult；被截断的结果算成功，缓存命中不计入"""
+        if result.cached:
+            return
+        self.record(result.provider, result.model, result.ok, result.ttft, result.metrics.duration, result.error)
+
+    def probe(self, spec: ProviderSpec) -> ProbeResult:
+        """
+        发送一次极小的流式请求并记录结果（同步，在探测线程池中调用）
+
+        Returns:
+            ProbeResult
+        """
+        metrics = StreamMetrics()
+        result = ProbeResult(spec.name, spec.model, ok=False)
+        try:
+            client = registry.openai_client(spec.api_key(), spec.base_url, proxy=spec.proxy()).with_options(
+                timeout=self.timeout, max_retries=0,
+            )
+            metrics.mark_sent()
+            if spec.api == "responses":
+                # Responses API 的 max_output_tokens 最小为 16
+                resp = client.responses.create(
+                    model=spec.model, input=self.prompt, stream=True, max_output_tokens=16, **spec.params,
+                )
+                events = iter_responses_events(resp, metrics)
+            else:
+                resp = client.chat.completions.create(
+                    model=spec.model, messages=[{"role": "user", "content": self.prompt}], stream=True,
+                    stream_options={"include_usage": True}, max_tokens=1, **spec.params,
+                )
+                events = iter_chat_events(resp, metrics)
+            for event in events:
+                if event.kind == ERROR:
+                    result.error = event.text
+                elif event.kind in (TEXT, REASONING) and result.ttft is None:
+                    result.ttft = metrics.ttft
+            result.ok = result.error is None
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        if metrics.finished_at is None:
+            metrics.finish()
+        result.duration = metrics.duration
+        if result.ok and result.ttft is None:
+            result.ttft = metrics.ttft
+        self.probes += 1
+        self.record(spec.name, spec.model, result.ok, result.ttft, result.duration, result.error)
+        return result
+
+    def probe_all(self) -> List[ProbeResult]:
+        """并发探测所有厂商一次"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=max(1, len(self._endpoints)), thread_name_prefix="evalai-probe")
+        return list(self._pool.map(lambda endpoint: self.probe(endpoint.spec), list(self._endpoints.values())))
+
+    def start(self) -> "HealthMonitor":
+        """启动后台探测线程（立即探测一次，之后每 interval 秒一次）"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="evalai-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.probe_all()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def close(self):
+        """停止后台探测"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def status(self) -> Dict[str, Dict]:
+        """
+        各厂商当前状态
+
+        Returns:
+            {"厂商/模型": {"state", "requests", "errors", "error_rate", "ttft": {...}, "latency": {...}, ...}}
+        """
+        now = time.time()
+        result = {}
+        for (provider, model), endpoint in self._endpoints.items():
+            breaker = endpoint.breaker
+            with endpoint.lock:
+                requests, errors = endpoint.requests, endpoint.errors
+                last_error, last_checked = endpoint.last_error, endpoint.last_checked
+                ttft = endpoint.ttft.percentiles(now=now)
+                latency = endpoint.latency.percentiles(now=now)
+            result[f"{provider}/{model}"] = {
+                "state": breaker.state,
+                "retry_after": breaker.retry_after(),
+                "requests": requests,
+                "errors": errors,
+                "error_rate": errors / requests if requests else None,
+                "trips": breaker.trips,
+                "rejected": breaker.rejected,
+                "last_error": last_error,
+                "last_checked": last_checked,
+                "ttft": ttft,
+                "latency": latency,
+            }
+        return result
+
+    def format(self) -> str:
+        """以表格形式输出各厂商状态"""
+        def ms(value):
+            return "-" if value is None else f"{value * 1000:.0f}"
+
+        lines = ["\t".join(["厂商/模型", "状态", "请求", "失败率", "首token p50/p95/p99 (ms)", "总耗时 p50/p95/p99 (ms)", "最近错误"])]
+        for name, s in self.status().items():
+            state = s["state"] + (f"（{s['retry_after']:.0f}s 后试探）" if s["state"] == OPEN else "")
+            rate = "-" if s["error_rate"] is None else f"{s['error_rate']:.0%}"
+            ttft, latency = s["ttft"], s["latency"]
+            lines.append("\t".join([
+                name, state, str(s["requests"]), rate,
+                "/".join(ms(ttft[q]) for q in ("p50", "p95", "p99")),
+                "/".join(ms(latency[q]) for q in ("p50", "p95", "p99")),
+                (s["last_error"] or "")[:60],
+            ]))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="厂商健康监控：定时发送极小的流式请求并统计时延分布")
+    parser.add_argument("-m", "--models", nargs="+", required=True, help="监控的厂商，可写成 厂商:模型")
+    parser.add_argument("--interval", type=float, default=60.0, help="探测间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=15.0, help="单次探测的超时时间（秒）")
+    parser.add_argument("--rounds", type=int, default=0, help="探测轮数，0 表示一直运行直到 Ctrl+C")
+    args = parser.parse_args()
+
+    monitor = HealthMonitor(args.models, interval=args.interval, timeout=args.timeout)
+    rounds = 0
+    try:
+        while not args.rounds or rounds < args.rounds:
+            started = time.monotonic()
+            monitor.probe_all()
+            rounds += 1
+            print(time.strftime("%H:%M:%S"), f"第 {rounds} 轮")
+            print(monitor.format(), flush=True)
+            if args.rounds and rounds >= args.rounds:
+                break
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+对冲请求（hedged requests）
+
+流式请求在阈值时间内还没有收到第一个事件时，再发一个相同的请求，哪个先出结果就用哪个，
+另一个立即取消并关闭连接。阈值可以是固定秒数，也可以是该厂商最近若干次首 token 时间的滚动 p95。
+对冲会多花一份输入 token（以及被取消前已生成的输出），所以用 max_rate 限制对冲比例，并统计额外消耗：
+落败请求拿不到厂商的 usage，按已收到的输出用 estimate_usage 估算 token 数，再按模型单价折算费用。
+
+用法：
+    policy = HedgePolicy(percentile=95)
+    async with FanOutEngine(["kimi", "deepseek-reasoner"], hedge=policy) as engine:
+        ...
+    print(policy.stats())
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Optional
+
+from evalai.estimate import estimate_usage, price_for
+from evalai.events import REASONING, TEXT, USAGE, StreamEvent
+from evalai.metrics import StreamMetrics, percentile
+
+
+class HedgeStats:
+    """
+    单个厂商的对冲统计
+    """
+
+    __slots__ = ("requests", "hedged", "hedge_wins", "extra_tokens", "extra_cost")
+
+    def __init__(self):
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.extra_tokens = 0
+        self.extra_cost = 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "extra_tokens": self.extra_tokens,
+            "extra_cost": self.extra_cost,
+        }
+
+
+class HedgePolicy:
+    """
+    决定何时发出对冲请求，并记录各厂商的首 token 时间和对冲统计
+    """
+
+    def __init__(
+        self,
+        delay: Optional[float] = None,
+        percentile: float = 95.0,
+        window: int = 200,
+        min_samples: int = 20,
+        max_rate: float = 0.1,
+    ):
+        """
+        初始化对冲策略
+
+        Args:
+            delay: 固定阈值（秒）；None 时使用滚动分位数
+            percentile: 滚动阈值使用的首 token 时间分位
+            window: 每个厂商保留的最近首 token 时间样本数
+            min_samples: 样本数达到该值之前不使用滚动阈值（不对冲）
+            max_rate: 对冲请求占全部请求的比例上限
+        """
+        self.delay = delay
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self._ttfts: Dict[str, Deque[float]] = {}
+        self._stats: Dict[str, HedgeStats] = {}
+
+    def stats_for(self, provider: str) -> HedgeStats:
+        """厂商的对冲统计，不存在时新建"""
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = HedgeStats()
+        return stats
+
+    def threshold(self, provider: str) -> Optional[float]:
+        """当前的对冲阈值（秒），None 表示不对冲"""
+        if self.delay is not None:
+            return self.delay
+        samples = self._ttfts.get(provider)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        return percentile(sorted(samples), self.percentile)
+
+    def observe(self, provider: str, ttft: float):
+        """记录一次用户实际感受到的首 token 时间（从第一个请求发出算起）"""
+        samples = self._ttfts.get(provider)
+        if samples is None:
+            samples = self._ttfts[provider] = deque(maxlen=self.window)
+        samples.append(ttft)
+
+    def should_hedge(self, stats: HedgeStats) -> bool:
+        """再发一个对冲请求后，对冲比例是否仍不超过 max_rate（请求量少时不会因为 0 < max_rate 而每次都对冲）"""
+        return stats.hedged + 1 <= self.max_rate * stats.requests
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各厂商的对冲率、对冲胜出次数和额外消耗的 token 数、费用（元，估算）"""
+        return {provider: stats.to_dict() for provider, stats in self._stats.items()}
+
+
+async def _cancel(task: "asyncio.Future", stream: AsyncIterator[StreamEvent]):
+    # 先取消挂起的 __anext__，再关闭生成器，让其 finally 中的 resp.close() 立即执行
+    if not task.done():
+        task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    await stream.aclose()
+
+
+def _loser_usage(
+    task: "asyncio.Future", messages: Iterable[Dict[str, Any]], provider: str
+) -> Dict[str, int]:
+    # 落败请求最多收到了第一个事件；流已结束时直接用厂商返回的用量
+    event = task.result() if task.done() else None
+    if event is not None and event.kind == USAGE and event.usage:
+        return event.usage
+    output = event.text if event is not None and event.kind == TEXT else ""
+    reasoning = event.text if event is not None and event.kind == REASONING else ""
+    return estimate_usage(messages, output, provider, reasoning)
+
+
+def _adopt(target: StreamMetrics, source: StreamMetrics):
+    for name in StreamMetrics.__slots__:
+        setattr(target, name, getattr(source, name))
+
+
+async def hedged_stream(
+    policy: HedgePolicy,
+    provider: str,
+    factory: Callable[[StreamMetrics], AsyncIterator[StreamEvent]],
+    metrics: StreamMetrics,
+    messages: Iterable[Dict[str, Any]] = (),
+    model: Optional[str] = None,
+    sent: Optional[asyncio.Event] = None,
+) -> AsyncIterator[StreamEvent]:
+    """
+    带对冲的事件流
+
+    Args:
+        policy: 对冲策略
+        provider: 厂商名称（统计和阈值按它区分）
+        factory: 以 StreamMetrics 为参数、每次调用都发起一次新请求的事件流工厂
+        metrics: 调用方的时延记录；对冲请求胜出时，其指标会并入这里，首 token 时间仍从第一个请求发出算起
+        messages: 发送的消息列表，用于估算落败请求的用量
+        model: 模型名称，用于按单价折算额外费用
+        sent: 原请求真正发出（通过限速排队）时置位的事件；对冲计时从这时开始，排队时间不会触发对冲。
+            None 表示从调用 factory 时开始计时
+
+    Returns:
+        胜出请求的 StreamEvent 异步迭代器
+    """
+    stats = policy.stats_for(provider)
+    messages = list(messages)
+    stats.requests += 1
+    delay = policy.threshold(provider)
+    primary = factory(metrics)
+    first = asyncio.ensure_future(primary.__anext__())
+    tasks = {first: (primary, metrics)}
+    winner = None
+    try:
+        if sent is not None and delay is not None:
+            admitted = asyncio.ensure_future(sent.wait())
+            try:
+                await asyncio.wait({first, admitted}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                admitted.cancel()
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if not done and policy.should_hedge(stats):
+            stats.hedged += 1
+            backup_metrics = StreamMetrics()
+            backup = factory(backup_metrics)
+            tasks[asyncio.ensure_future(backup.__anext__())] = (backup, backup_metrics)
+
+        error: Optional[BaseException] = None
+        pending = set(tasks)
+        while winner is None and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # 同时完成时优先使用原请求
+            for task in sorted(done, key=lambda t: t is not first):
+                if task.cancelled() or task.exception() is not None:
+                    error = error or (None if task.cancelled() else task.exception())
+                elif winner is None:
+                    winner = task
+        if winner is None:
+            raise error if error is not None else asyncio.CancelledError()
+
+        stream, stream_metrics = tasks.pop(winner)
+        for task, (other, _) in tasks.items():
+            failed = task.done() and (task.cancelled() or task.exception() is not None)
+            usage = None if failed else _loser_usage(task, messages, provider)
+            await _cancel(task, other)
+            if usage is not None:
+                stats.extra_tokens += usage["total_tokens"]
+                price = price_for(model) if model else None
+                if price is not None:
+                    stats.extra_cost += sum(price.cost(usage["prompt_tokens"], usage["completion_tokens"]))
+        tasks = {}
+        policy.observe(provider, time.perf_counter() - metrics.request_sent_at)
+        if stream_metrics is not metrics:
+            stats.hedge_wins += 1
+            stream_metrics.request_sent_at = metrics.request_sent_at
+
+        event = winner.result()
+        while True:
+            if event.kind == USAGE and stream_metrics is not metrics:
+                _adopt(metrics, stream_metrics)
+                event.metrics = metrics
+            yield event
+            try:
+                event = await stream.__anext__()
+            except StopAsyncIteration:
+                break
+    finally:
+        for task, (other, _) in tasks.items():
+            await _cancel(task, other)
+        if winner is not None:
+            await stream.aclose()
@@ -0,0 +1,430 @@
+"""
+预充值余额账本（系统设计.md 中的 users.balance 与 api_requests.balance_before / balance_after）
+
+并发流式请求下，每次调用结束后再读-改-写一次余额行既有竞态又慢。账本把余额放在内存里：
+    - 发请求前按预估费用原子地预留（reserve），可用余额不足时直接拒绝，实现"超预算自动停止服务"
+    - 收到 usage 后按实际费用结算（settle），多退少补
+    - 请求出错、被取消或命中缓存时释放预留（release）
+    - 余额变化只累计为每个用户的净变化量，由后台线程按 flush_interval 批量写回，一个批次一个事务
+
+预留、结算、释放都只是一次加锁的整数运算，不访问数据库；只有第一次用到某个用户时读一次余额，
+在事件循环中先 await aload(user_id)，这次读取放到线程里，不阻塞事件循环。
+金额在内部以 1e-9 元为单位的整数保存，累加不产生浮点误差。
+写回使用 "balance = balance + 净变化量"，同一个库上的其他写入者（例如充值）不会被覆盖，
+但它们的变化要等 refresh() 之后才会反映到本进程的内存余额中。
+
+本地库没有完整的 users 表，这里只建 id / balance / updated_at 三列。
+
+用法：
+    with BalanceLedger("requests.sqlite3") as ledger:
+        ledger.deposit(1, 50.0)
+        async with FanOutEngine(["qwen", "kimi"], ledger=ledger, user_id=1) as engine:
+            ...
+        print(ledger.balance(1), ledger.stats())
+
+    python -m evalai.ledger requests.sqlite3 --user 1 --deposit 50
+"""
+import argparse
+import asyncio
+import atexit
+import sqlite3
+import threading
+import time
+import warnings
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from evalai.estimate import DEFAULT_OUTPUT_TOKENS, estimate_prompt_tokens, price_for
+
+UNIT = 1_000_000_000  # 内部金额单位：1e-9 元
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    balance REAL NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+"""
+_UPSERT = """
+INSERT INTO users (id, balance, updated_at) VALUES (?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET balance = balance + excluded.balance, updated_at = excluded.updated_at
+"""
+
+
+class LedgerError(Exception):
+    """余额账本相关异常"""
+    pass
+
+
+class InsufficientBalance(LedgerError):
+    """可用余额不足，请求未发出"""
+    pass
+
+
+def _units(amount: float) -> int:
+    return round(amount * UNIT)
+
+
+def _yuan(units: int) -> float:
+    return units / UNIT
+
+
+def usage_cost(model: str, usage: Optional[Dict[str, int]]) -> Optional[float]:
+    """
+    按实际用量计算费用
+
+    Args:
+        model: 模型名称
+        usage: 厂商返回（或估算）的用量，None 表示没有用量
+
+    Returns:
+        费用（元）；模型不在价格表中时返回 None
+    """
+    price = price_for(model)
+    if price is None:
+        return None
+    if not usage:
+        return 0.0
+    return sum(price.cost(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)))
+
+
+def estimate_cost(
+    model: str, messages: Iterable[Dict[str, str]], max_output: Optional[int] = None, provider: Optional[str] = None
+) -> Optional[float]:
+    """
+    预估一次请求最多花费多少，用于预留
+
+    Args:
+        model: 模型名称
+        messages: chat 消息列表
+        max_output: 请求的最大输出 token 数，None 时按 DEFAULT_OUTPUT_TOKENS 预估
+        provider: 厂商名称（决定分词方式）
+
+    Returns:
+        预估费用（元）；模型不在价格表中时返回 None
+    """
+    price = price_for(model)
+    if price is None:
+        return None
+    output = max_output if max_output is not None else DEFAULT_OUTPUT_TOKENS
+    return sum(price.cost(estimate_prompt_tokens(messages, provider), output))
+
+
+class Hold:
+    """
+    一次请求的余额预留，请求结束后交给 BalanceLedger.settle() 或 release()
+    """
+
+    __slots__ = ("user_id", "amount", "done")
+
+    def __init__(self, user_id: int, amount: int):
+        self.user_id = user_id
+        self.amount = amount
+        self.done = False
+
+    @property
+    def yuan(self) -> float:
+        """预留金额（元）"""
+        return _yuan(self.amount)
+
+
+class _Account:
+    __slots__ = ("balance", "reserved")
+
+    def __init__(self, balance: int):
+        self.balance = balance
+        self.reserved = 0
+
+
+class BalanceLedger:
+    """
+    内存中的预充值余额账本，线程安全，可同时用于多个事件循环
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        flush_interval: float = 1.0,
+        allow_unpriced: bool = True,
+    ):
+        """
+        初始化账本（不会立即启动后台线程，见 start()）
+
+        Args:
+            path: SQLite 数据库路径（可以与 RequestLogWriter 共用一个库）；None 表示只在内存中记账
+            flush_interval: 余额变化最多在内存中停留的时间（秒）
+            allow_unpriced: 是否放行不在价格表中的模型（不预留、不扣费）；False 时直接拒绝
+        """
+        self.path = Path(path) if path is not None else None
+        self.flush_interval = flush_interval
+        self.allow_unpriced = allow_unpriced
+        self._lock = threading.Lock()
+        self._accounts: Dict[int, _Account] = {}
+        self._pending: Dict[int, int] = {}
+        self._wake = threading.Event()
+        self._flush_lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.reserved = 0
+        self.rejected = 0
+        self.settled = 0
+        self.released = 0
+        self.overdrafts = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.errors = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self) -> "BalanceLedger":
+        """启动后台写回线程；进程退出时会自动 close()。只在内存中记账时什么也不做"""
+        if self.path is not None and self._thread is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = self._connect()  # 在调用方线程里建表，路径或权限错误立即抛出
+            conn.close()
+            self._thread = threading.Thread(target=self._run, name="evalai-ledger", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    # ------------- 账户 -------------
+    def _load(self, user_id: int) -> int:
+        if self.path is None:
+            return 0
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT balance FROM users WHERE id = ?", (user_id,)).fetchone()
+        finally:
+            conn.close()
+        return _units(row[0]) if row else 0
+
+    def _account(self, user_id: int) -> _Account:
+        # 调用方不持有锁；数据库读取放在锁外，不阻塞其他用户的预留
+        account = self._accounts.get(user_id)
+        if account is None:
+            balance = self._load(user_id)
+            with self._lock:
+                account = self._accounts.setdefault(user_id, _Account(balance))
+        return account
+
+    async def aload(self, user_id: int):
+        """
+        在事件循环中预先加载账户：第一次用到该用户时在线程中读取余额，之后的 reserve() 不再访问数据库
+
+        Args:
+            user_id: 用户 ID
+        """
+        if user_id not in self._accounts:
+            await asyncio.to_thread(self._account, user_id)
+
+    def refresh(self, user_id: Optional[int] = None):
+        """
+        写回未落盘的变化后，从数据库重新读取余额（用于看到其他进程的充值）
+
+        Args:
+            user_id: 只刷新该用户，None 表示全部已加载的用户
+        """
+        with self._flush_lock:  # 刷新期间不能有后台写回，否则写回的变化会被漏算
+            self.flush()
+            for uid in [user_id] if user_id is not None else list(self._accounts):
+                balance = self._load(uid)
+                with self._lock:
+                    account = self._accounts.setdefault(uid, _Account(balance))
+                    # 刷新期间新产生、尚未写回的变化要叠加上去
+                    account.balance = balance + self._pending.get(uid, 0)
+
+    def balance(self, user_id: int) -> float:
+        """账户余额（元），含已预留但尚未结算的部分"""
+        return _yuan(self._account(user_id).balance)
+
+    def available(self, user_id: int) -> float:
+        """可用余额（元）：余额减去进行中请求的预留"""
+        account = self._account(user_id)
+        with self._lock:
+            return _yuan(account.balance - account.reserved)
+
+    def deposit(self, user_id: int, amount: float) -> float:
+        """
+        充值（amount 为负时为扣款调整）
+
+        Args:
+            user_id: 用户 ID
+            amount: 金额（元）
+
+        Returns:
+            充值后的余额（元）
+        """
+        account = self._account(user_id)
+        units = _units(amount)
+        with self._lock:
+            account.balance += units
+            self._add_pending(user_id, units)
+            return _yuan(account.balance)
+
+    def _add_pending(self, user_id: int, units: int):
+        if units and self.path is not None:
+            self._pending[user_id] = self._pending.get(user_id, 0) + units
+
+    # ------------- 预留与结算 -------------
+    def reserve(self, user_id: int, amount: Optional[float]) -> Hold:
+        """
+        预留一次请求的预估费用
+
+        Args:
+            user_id: 用户 ID
+            amount: 预估费用（元）；None 表示模型不在价格表中
+
+        Returns:
+            Hold，请求结束后交给 settle() 或 release()
+        """
+        if amount is None:
+            if not self.allow_unpriced:
+                with self._lock:
+                    self.rejected += 1
+                raise InsufficientBalance("模型不在价格表中，无法预估费用")
+            amount = 0.0
+        units = _units(amount)
+        account = self._account(user_id)
+        with self._lock:
+            available = account.balance - account.reserved
+            if available <= 0 or available < units:
+                self.rejected += 1
+                raise InsufficientBalance(f"余额不足：可用 {_yuan(available):.4f} 元，本次预留 {amount:.4f} 元")
+            account.reserved += units
+            self.reserved += 1
+        return Hold(user_id, units)
+
+    def settle(self, hold: Hold, cost: Optional[float]) -> Tuple[float, float]:
+        """
+        按实际费用结算，释放多余的预留
+
+        实际费用超过预留（例如没有设置输出上限时的长回答）时照常扣除，余额可能变为负数，计入 overdrafts。
+
+        Args:
+            hold: reserve() 返回的预留
+            cost: 实际费用（元）；None 视为 0
+
+        Returns:
+            (扣费前余额, 扣费后余额)，单位元
+        """
+        units = _units(cost or 0.0)
+        account = self._accounts[hold.user_id]
+        with self._lock:
+            before = account.balance
+            if hold.done:
+                return _yuan(before), _yuan(before)
+            hold.done = True
+            account.reserved -= hold.amount
+            account.balance -= units
+            self._add_pending(hold.user_id, -units)
+            self.settled += 1
+            if units > hold.amount:
+                self.overdrafts += 1
+            return _yuan(before), _yuan(account.balance)
+
+    def release(self, hold: Hold):
+        """请求出错、被取消或命中缓存，不扣费，释放全部预留"""
+        account = self._accounts[hold.user_id]
+        with self._lock:
+            if hold.done:
+                return
+            hold.done = True
+            account.reserved -= hold.amount
+            self.released += 1
+
+    # ------------- 写回 -------------
+    def flush(self) -> bool:
+        """
+        立即把累计的余额变化写回数据库
+
+        Returns:
+            是否写入成功（没有需要写回的变化时也返回 True）
+        """
+        if self.path is None:
+            return True
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return True
+            now = time.time()
+            rows = [(user_id, _yuan(units), now) for user_id, units in pending.items() if units]
+            try:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany(_UPSERT, rows)
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                # 写回失败时把变化量放回去，下次再试，不丢账
+                with self._lock:
+                    for user_id, units in pending.items():
+                        self._pending[user_id] = self._pending.get(user_id, 0) + units
+                self.errors += 1
+                warnings.warn(f"写回余额失败，{len(rows)} 个用户的变化将在下次重试: {e}")
+                return False
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+            return True
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self.flush()
+
+    def close(self, timeout: Optional[float] = None):
+        """写回剩余的变化并停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            atexit.unregister(self.close)
+            self._wake.set()
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        """记账统计"""
+        with self._lock:
+            in_flight = sum(account.reserved for account in self._accounts.values())
+            return {
+                "accounts": len(self._accounts),
+                "reserved": self.reserved,
+                "rejected": self.rejected,
+                "settled": self.settled,
+                "released": self.released,
+                "overdrafts": self.overdrafts,
+                "in_flight": _yuan(in_flight),
+                "pending_users": len(self._pending),
+                "flushes": self.flushes,
+                "flushed_rows": self.flushed_rows,
+                "errors": self.errors,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询或调整预充值余额")
+    parser.add_argument("db", help="SQLite 数据库路径")
+    parser.add_argument("--user", type=int, required=True, help="用户 ID")
+    parser.add_argument("--deposit", type=float, default=None, help="充值金额（元），负数为扣款调整")
+    args = parser.parse_args()
+
+    with BalanceLedger(args.db) as ledger:
+        if args.deposit is not None:
+            ledger.deposit(args.user, args.deposit)
+        print(f"用户 {args.user} 余额: {ledger.balance(args.user):.4f} 元")
+
+
+if __name__ == "__main__":
+    main()
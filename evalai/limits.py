@@ -0,0 +1,216 @@
+"""
+输出硬限制
+
+在客户端边接收边检查输出 token 数、耗时和字节数，一旦超限立即关闭事件流（随之关闭 HTTP 连接，
+厂商停止生成，不再为失控的长输出付费和等待），并以一个带 Truncated 的 USAGE 事件结束：
+usage 中是截断时已产生的用量（厂商此时不会再返回用量，输出 token 数按文本估算）。
+
+输出 token 上限同时作为 max_tokens 发给厂商，客户端检查只是兜底；提示词中的「用 N 个 token 完成回复」
+只是软约束，模型可以无视。客户端的 token 数是按字符估算的，逐个分片累加不取整的估算值；
+已经把 max_tokens 发给厂商时（server_capped，默认），估算值超过上限 SERVER_CAP_SLACK 倍才截断，
+正常情况下由厂商按 max_tokens 停止并返回真实用量，不会被估算误差提前截断。
+
+用法：
+    limits = OutputLimits(max_tokens=500, max_seconds=30)
+    resp = client.chat.completions.create(..., **limits.request_params())
+    for event in limit_events(iter_chat_events(resp, metrics), limits, metrics):
+        ...
+"""
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from evalai.events import REASONING, TEXT, USAGE, StreamEvent
+from evalai.metrics import StreamMetrics
+from evalai.estimate import counter_for
+
+MAX_TOKENS = "max_tokens"
+MAX_SECONDS = "max_seconds"
+MAX_BYTES = "max_bytes"
+TOKEN_SLACK = 1.1  # token 数是估算值，留出余量，避免在厂商按 max_tokens 正常停止前抢先截断
+SERVER_CAP_SLACK = 2.0  # 厂商已收到 max_tokens 时只防备它不遵守上限，按字符估算的误差可能接近一倍
+
+
+@dataclass(frozen=True)
+class OutputLimits:
+    """
+    单次请求的输出上限，None 表示不限制
+
+    Attributes:
+        max_tokens: 输出 token 数上限（含推理过程）
+        max_seconds: 从请求发出到输出结束的耗时上限（秒）
+        max_bytes: 输出文本的 UTF-8 字节数上限
+    """
+    max_tokens: Optional[int] = None
+    max_seconds: Optional[float] = None
+    max_bytes: Optional[int] = None
+
+    def request_params(self, api: str = "chat") -> Dict[str, Any]:
+        """发给厂商的服务端上限参数"""
+        if self.max_tokens is None:
+            return {}
+        return {"max_output_tokens" if api == "responses" else "max_tokens": self.max_tokens}
+
+
+class Truncated:
+    """
+    截断信息，作为结束 USAGE 事件的 data
+
+    Attributes:
+        reason: 触发的上限（MAX_TOKENS / MAX_SECONDS / MAX_BYTES）
+        limit: 该上限的值
+    """
+
+    __slots__ = ("reason", "limit")
+
+    def __init__(self, reason: str, limit: float):
+        self.reason = reason
+        self.limit = limit
+
+    def __repr__(self):
+        return f"Truncated({self.reason}={self.limit})"
+
+
+class _Budget:
+    __slots__ = ("limits", "deadline", "token_limit", "weight", "reasoning_weight", "bytes", "weigh")
+
+    def __init__(
+        self, limits: OutputLimits, metrics: StreamMetrics, provider: Optional[str] = None, server_capped: bool = True
+    ):
+        self.limits = limits
+        counter = counter_for(provider)
+        # 估算计数器按不取整的权重累加；只有 count() 的计数器（tiktoken 等）逐个分片计数本身就是整数
+        self.weigh = getattr(counter, "weight", counter.count)
+        self.deadline = metrics.request_sent_at + limits.max_seconds if limits.max_seconds is not None else None
+        self.token_limit = None
+        if limits.max_tokens is not None:
+            self.token_limit = limits.max_tokens * (SERVER_CAP_SLACK if server_capped else TOKEN_SLACK)
+        self.weight = 0.0
+        self.reasoning_weight = 0.0  # 其中推理过程的部分
+        self.bytes = 0
+
+    @property
+    def tokens(self) -> int:
+        return math.ceil(self.weight)
+
+    @property
+    def reasoning(self) -> int:
+        return math.ceil(self.reasoning_weight)
+
+    def consume(self, text: str, reasoning: bool = False) -> Optional[Truncated]:
+        limits = self.limits
+        weight = self.weigh(text)
+        self.weight += weight
+        if reasoning:
+            self.reasoning_weight += weight
+        if self.token_limit is not None and self.weight >= self.token_limit:
+            return Truncated(MAX_TOKENS, limits.max_tokens)
+        if limits.max_bytes is not None:
+            self.bytes += len(text.encode("utf-8"))
+            if self.bytes >= limits.max_bytes:
+                return Truncated(MAX_BYTES, limits.max_bytes)
+        return self.expired()
+
+    def expired(self) -> Optional[Truncated]:
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return Truncated(MAX_SECONDS, self.limits.max_seconds)
+        return None
+
+    def usage_event(self, metrics: StreamMetrics, truncated: Truncated, prompt_tokens: int) -> StreamEvent:
+        metrics.finish(self.tokens, self.reasoning or None)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": self.tokens,
+            "total_tokens": prompt_tokens + self.tokens,
+        }
+        if self.reasoning:
+            usage["reasoning_tokens"] = self.reasoning
+        return StreamEvent(USAGE, ts=metrics.finished_at, usage=usage, metrics=metrics, data=truncated)
+
+
+def limit_events(
+    events: Iterator[StreamEvent],
+    limits: OutputLimits,
+    metrics: StreamMetrics,
+    prompt_tokens: int = 0,
+    provider: Optional[str] = None,
+    server_capped: bool = True,
+) -> Iterator[StreamEvent]:
+    """
+    给同步事件流加上硬限制
+
+    同步流只能在分片到达时检查耗时；需要在长时间无输出时也能按时截断，请使用 alimit_events()。
+
+    Args:
+        events: 原始事件流（iter_chat_events / iter_responses_events 的返回值）
+        limits: 输出上限
+        metrics: 本次请求的时延记录
+        prompt_tokens: 预估的输入 token 数，截断时写入用量
+        provider: 厂商名称，按该厂商的分词估算输出 token 数
+        server_capped: 请求是否已带上 limits.request_params()；是则 token 上限交给厂商执行，
+            客户端只在估算值超过 SERVER_CAP_SLACK 倍时兜底截断，否则按 TOKEN_SLACK 截断
+
+    Returns:
+        StreamEvent 迭代器；未超限时与原始流完全相同
+    """
+    budget = _Budget(limits, metrics, provider, server_capped)
+    truncated = None
+    try:
+        for event in events:
+            kind = event.kind
+            if kind == TEXT or kind == REASONING:
+                truncated = budget.consume(event.text, kind == REASONING)
+                yield event
+                if truncated is not None:
+                    break
+            else:
+                yield event
+    finally:
+        # 关闭原始流会连带关闭 HTTP 响应，厂商随即停止生成
+        close = getattr(events, "close", None)
+        if close is not None:
+            close()
+    if truncated is not None:
+        yield budget.usage_event(metrics, truncated, prompt_tokens)
+
+
+async def alimit_events(
+    events: AsyncIterator[StreamEvent],
+    limits: OutputLimits,
+    metrics: StreamMetrics,
+    prompt_tokens: int = 0,
+    provider: Optional[str] = None,
+    server_capped: bool = True,
+) -> AsyncIterator[StreamEvent]:
+    """limit_events() 的异步版本；设置了 max_seconds 时，长时间没有分片也会按时截断"""
+    budget = _Budget(limits, metrics, provider, server_capped)
+    truncated = None
+    try:
+        while True:
+            if budget.deadline is None:
+                try:
+                    event = await events.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), max(budget.deadline - time.perf_counter(), 0))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    truncated = Truncated(MAX_SECONDS, limits.max_seconds)
+                    break
+            kind = event.kind
+            if kind == TEXT or kind == REASONING:
+                truncated = budget.consume(event.text, kind == REASONING)
+                yield event
+                if truncated is not None:
+                    break
+            else:
+                yield event
+    finally:
+        await events.aclose()
+    if truncated is not None:
+        yield budget.usage_event(metrics, truncated, prompt_tokens)
@@ -0,0 +1,260 @@
+"""
+流式调用的时延指标
+
+记录请求发出时间、首个 token 时间、每个分片的到达时间和结束时间，
+由此得到首 token 响应时间、分片间隔分位数（p50/p95/p99）、总耗时和输出速度。
+热路径上每个分片只做一次 perf_counter() 和一次数组追加，分位数等统计在读取时才计算。
+
+推理模型（DeepSeek Reasoner、开启思考的 Qwen、gpt-5 等）另外分开记录推理阶段和回答阶段：
+首个推理 token 时间、首个回答 token 时间、推理 / 回答 token 数及各自的速度。
+推理过程不下发的厂商（如未请求推理摘要的 Responses API）没有推理分片，
+这时推理耗时体现在首个回答 token 时间里，推理 token 数仍来自用量信息。
+"""
+import time
+from array import array
+from typing import Dict, Iterable, Optional
+
+
+def percentile(sorted_values, q: float) -> Optional[float]:
+    """
+    线性插值分位数
+
+    Args:
+        sorted_values: 已升序排列的数值序列
+        q: 分位（0-100）
+
+    Returns:
+        分位数值，序列为空时返回 None
+    """
+    n = len(sorted_values)
+    if n == 0:
+        return None
+    if n == 1:
+        return sorted_values[0]
+    pos = (n - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, n - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+class StreamMetrics:
+    """
+    单次流式请求的时延记录
+
+    时间均为 time.perf_counter() 的读数（秒），只用于相互求差。
+    """
+
+    __slots__ = (
+        "request_sent_at", "first_chunk_at", "finished_at", "chunk_times", "output_tokens",
+        "first_reasoning_at", "last_reasoning_at", "first_answer_at", "reasoning_tokens",
+    )
+
+    def __init__(self):
+        self.request_sent_at = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.chunk_times = array("d")
+        self.output_tokens: Optional[int] = None
+        self.first_reasoning_at: Optional[float] = None
+        self.last_reasoning_at: Optional[float] = None
+        self.first_answer_at: Optional[float] = None
+        self.reasoning_tokens: Optional[int] = None
+
+    def mark_sent(self):
+        """重新记录请求发出时间（实例创建时已记录一次）"""
+        self.request_sent_at = time.perf_counter()
+
+    def mark_chunk(self) -> float:
+        """记录一个内容分片的到达时间"""
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        self.chunk_times.append(now)
+        return now
+
+    def mark_reasoning(self) -> float:
+        """记录一个推理过程分片的到达时间"""
+        now = self.mark_chunk()
+        if self.first_reasoning_at is None:
+            self.first_reasoning_at = now
+        self.last_reasoning_at = now
+        return now
+
+    def mark_answer(self) -> float:
+        """记录一个回答文本分片的到达时间"""
+        now = self.mark_chunk()
+        if self.first_answer_at is None:
+            self.first_answer_at = now
+        return now
+
+    def finish(self, output_tokens: Optional[int] = None, reasoning_tokens: Optional[int] = None):
+        """
+        记录流结束
+
+        Args:
+            output_tokens: 用量信息中的输出 token 数（含推理）
+            reasoning_tokens: 其中的推理 token 数，厂商未返回时为 None
+        """
+        self.finished_at = time.perf_counter()
+        if output_tokens is not None:
+            self.output_tokens = output_tokens
+        if reasoning_tokens is not None:
+            self.reasoning_tokens = reasoning_tokens
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunk_times)
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """首个 token 响应时间（秒）"""
+        if self.first_chunk_at is None:
+            return None
+        return self.first_chunk_at - self.request_sent_at
+
+    @property
+    def duration(self) -> Optional[float]:
+        """完成时间（秒），流尚未结束时为 None"""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.request_sent_at
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """
+        输出速度（token/秒）
+
+        按首个分片到结束之间的生成阶段计算；只有一个分片时退化为按总耗时计算。
+        """
+        if not self.output_tokens or self.finished_at is None or self.first_chunk_at is None:
+            return None
+        elapsed = self.finished_at - self.first_chunk_at
+        if elapsed <= 0:
+            elapsed = self.finished_at - self.request_sent_at
+        return self.output_tokens / elapsed if elapsed > 0 else None
+
+    @property
+    def time_to_first_reasoning(self) -> Optional[float]:
+        """首个推理 token 时间（秒），没有推理分片时为 None"""
+        if self.first_reasoning_at is None:
+            return None
+        return self.first_reasoning_at - self.request_sent_at
+
+    @property
+    def time_to_first_answer(self) -> Optional[float]:
+        """首个回答 token 时间（秒），包含全部推理耗时"""
+        if self.first_answer_at is None:
+            return None
+        return self.first_answer_at - self.request_sent_at
+
+    @property
+    def reasoning_time(self) -> Optional[float]:
+        """推理阶段耗时（秒）：首个推理分片到首个回答分片（没有回答时到最后一个推理分片）"""
+        if self.first_reasoning_at is None:
+            return None
+        end = self.first_answer_at if self.first_answer_at is not None else self.last_reasoning_at
+        return end - self.first_reasoning_at
+
+    @property
+    def answer_tokens(self) -> Optional[int]:
+        """回答 token 数（输出 token 数减去推理 token 数）"""
+        if self.output_tokens is None:
+            return None
+        return self.output_tokens - (self.reasoning_tokens or 0)
+
+    @property
+    def reasoning_tokens_per_second(self) -> Optional[float]:
+        """推理速度（token/秒），只在有推理分片时可算"""
+        elapsed = self.reasoning_time
+        if not self.reasoning_tokens or not elapsed:
+            return None
+        return self.reasoning_tokens / elapsed
+
+    @property
+    def answer_tokens_per_second(self) -> Optional[float]:
+        """回答速度（token/秒）：首个回答分片到结束"""
+        tokens = self.answer_tokens
+        if not tokens or self.first_answer_at is None or self.finished_at is None:
+            return None
+        elapsed = self.finished_at - self.first_answer_at
+        return tokens / elapsed if elapsed > 0 else None
+
+    def gaps(self) -> array:
+        """相邻分片的到达间隔（秒）"""
+        t = self.chunk_times
+        return array("d", (t[i] - t[i - 1] for i in range(1, len(t))))
+
+    def gap_percentiles(self, qs: Iterable[float] = (50, 95, 99)) -> Dict[str, Optional[float]]:
+        """
+        分片间隔分位数
+
+        Args:
+            qs: 需要的分位
+
+        Returns:
+            形如 {"p50": ..., "p95": ..., "p99": ...} 的字典（秒）
+        """
+        gaps = sorted(self.gaps())
+        return {f"p{q:g}": percentile(gaps, q) for q in qs}
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        """导出汇总指标，便于打印或落库"""
+        data = {
+            "ttft": self.ttft,
+            "duration": self.duration,
+            "chunks": self.chunk_count,
+            "output_tokens": self.output_tokens,
+            "tokens_per_second": self.tokens_per_second,
+            "time_to_first_reasoning": self.time_to_first_reasoning,
+            "time_to_first_answer": self.time_to_first_answer,
+            "reasoning_time": self.reasoning_time,
+            "reasoning_tokens": self.reasoning_tokens,
+            "answer_tokens": self.answer_tokens,
+            "reasoning_tokens_per_second": self.reasoning_tokens_per_second,
+            "answer_tokens_per_second": self.answer_tokens_per_second,
+        }
+        data.update({f"gap_{k}": v for k, v in self.gap_percentiles().items()})
+        return data
+
+    def __repr__(self):
+        return f"StreamMetrics({self.to_dict()})"
+
+
+def format_metrics(metrics: Optional[StreamMetrics]) -> str:
+    """
+    把指标格式化为多行文本，供各脚本的打印函数使用
+
+    Args:
+        metrics: StreamMetrics 实例
+
+    Returns:
+        已缩进的多行文本，metrics 为 None 时返回空字符串
+    """
+    if metrics is None:
+        return ""
+
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f} ms"
+
+    def rate(value):
+        return "-" if value is None else f"{value:.1f} tokens/s"
+
+    gaps = metrics.gap_percentiles()
+    tps = metrics.tokens_per_second
+    lines = [
+        "时延指标:",
+        f"  - 首 token: {ms(metrics.ttft)}",
+        f"  - 完成: {ms(metrics.duration)}",
+        f"  - 分片数: {metrics.chunk_count}",
+        f"  - 分片间隔 p50/p95/p99: {ms(gaps['p50'])} / {ms(gaps['p95'])} / {ms(gaps['p99'])}",
+        f"  - 输出速度: {rate(tps)}",
+    ]
+    if metrics.first_reasoning_at is not None or metrics.reasoning_tokens:
+        lines += [
+            f"  - 首个推理 token / 首个回答 token: {ms(metrics.time_to_first_reasoning)} / {ms(metrics.time_to_first_answer)}",
+            f"  - 推理耗时: {ms(metrics.reasoning_time)}",
+            f"  - 推理 / 回答 Tokens: {metrics.reasoning_tokens if metrics.reasoning_tokens is not None else '-'}"
+            f" / {metrics.answer_tokens if metrics.answer_tokens is not None else '-'}",
+            f"  - 推理 / 回答速度: {rate(metrics.reasoning_tokens_per_second)} / {rate(metrics.answer_tokens_per_second)}",
+        ]
+    return "\n".join(lines)
@@ -0,0 +1,417 @@
+"""
+本地 OpenAI 兼容 SSE 模拟服务
+
+实现 chat.completions 流式协议（含 stream_options.include_usage 和 DeepSeek 的 reasoning_content）
+以及 gpt/main.py 使用的 Responses API 事件流。首 token 时间、分片速率、分片大小和错误注入均可配置，
+用于在不受厂商网络抖动影响的情况下测量本仓库自身的开销。
+
+用法：
+    python -m evalai.mock_server --port 8000 --ttft 0.2 --chunk-rate 50
+
+    with MockServer(MockConfig(ttft=0)).running() as server:
+        bot = QwenStream(api_key="mock", base_url=server.base_url)
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+WORDS = ("alpha ", "beta ", "gamma ", "delta ", "epsilon ", "zeta ", "eta ", "theta ")
+
+
+@dataclass
+class MockConfig:
+    """
+    模拟服务的行为配置
+
+    Attributes:
+        ttft: 首个分片前的等待时间（秒）
+        slow_rate: 首 token 变慢的请求比例（0-1），用于模拟长尾
+        slow_ttft: 变慢的请求首个分片前的等待时间（秒）
+        chunk_rate: 每秒发送的分片数，0 表示不限速
+        chunk_size: 每个分片包含的 token（单词）数
+        chunks: 每个回答的内容分片数
+        reasoning_chunks: 推理模型额外发送的 reasoning_content 分片数
+        reasoning_models: 模型名包含其中任一子串即视为推理模型
+        error_rate: 直接返回 HTTP 错误的请求比例（0-1）
+        error_status: 注入错误的状态码
+        retry_after: error_status 为 429 时返回的 Retry-After（秒）
+        disconnect_rate: 流发送到一半时直接断开连接的请求比例（0-1）
+        seed: 随机数种子，便于复现错误注入
+    """
+    ttft: float = 0.05
+    slow_rate: float = 0.0
+    slow_ttft: float = 1.0
+    chunk_rate: float = 100.0
+    chunk_size: int = 1
+    chunks: int = 50
+    reasoning_chunks: int = 10
+    reasoning_models: Tuple[str, ...] = ("reasoner",)
+    error_rate: float = 0.0
+    error_status: int = 500
+    retry_after: Optional[float] = None
+    disconnect_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+@lru_cache(maxsize=1024)
+def _word(index: int, size: int) -> str:
+    return "".join(WORDS[(index + k) % len(WORDS)] for k in range(size))
+
+
+def _sse(payload: Dict) -> bytes:
+    return b"data: " + json.dumps(payload, separators=(",", ":")).encode() + b"\n\n"
+
+
+def _chunked(data: bytes) -> bytes:
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+@lru_cache(maxsize=256)
+def _chat_frames(model: str, chunks: int, reasoning_chunks: int, size: int) -> Tuple[bytes, ...]:
+    # 同一模型/配置的分片内容固定，预先编码好，避免压测时服务端成为瓶颈
+    frames = []
+    base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": model}
+    for i in range(reasoning_chunks):
+        delta = {"role": "assistant", "content": None, "reasoning_content": _word(i, size)}
+        frames.append(_chunked(_sse({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})))
+    for i in range(chunks):
+        delta = {"role": "assistant", "content": _word(i, size)}
+        frames.append(_chunked(_sse({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})))
+    return tuple(frames)
+
+
+@lru_cache(maxsize=256)
+def _responses_frames(model: str, chunks: int, reasoning_chunks: int, size: int) -> Tuple[bytes, ...]:
+    frames = []
+    for i in range(reasoning_chunks):
+        frames.append(_chunked(_sse({
+            "type": "response.reasoning_summary_text.delta", "item_id": "rs_mock", "output_index": 0,
+            "summary_index": 0, "sequence_number": i, "delta": _word(i, size),
+        })))
+    for i in range(chunks):
+        frames.append(_chunked(_sse({
+            "type": "response.output_text.delta", "item_id": "msg_mock", "output_index": 1, "content_index": 0,
+            "sequence_number": reasoning_chunks + i, "delta": _word(i, size), "logprobs": [],
+        })))
+    return tuple(frames)
+
+
+class MockServer:
+    """
+    asyncio 实现的 HTTP/1.1 模拟服务，支持 keep-alive 和 chunked 传输
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        初始化模拟服务
+
+        Args:
+            config: 行为配置，None 时使用默认值
+            host: 监听地址
+            port: 监听端口，0 表示随机分配
+        """
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.active_streams = 0
+        self.max_active_streams = 0
+        self._random = random.Random(self.config.seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    @contextmanager
+    def running(self):
+        """在后台线程中运行服务，供同步代码使用"""
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name="mock-server", daemon=True)
+        thread.start()
+        started.wait()
+        try:
+            yield self
+        finally:
+            asyncio.run_coroutine_threadsafe(self.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    # ------------- HTTP 处理 -------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if line:
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+
+                keep_alive = await self._dispatch(method, path, body, writer)
+                if not keep_alive or headers.get("connection", "").lower() == "close":
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> bool:
+        if method != "POST":
+            # HEAD/GET 只用于预热连接
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            return True
+
+        config = self.config
+        if config.error_rate and self._random.random() < config.error_rate:
+            return await self._error(writer)
+
+        request = json.loads(body or b"{}")
+        path = path.split("?", 1)[0]
+        if path.endswith("/chat/completions"):
+            if not request.get("stream"):
+                return await self._chat_completion(request, writer)
+            return await self._stream(request, writer, responses=False)
+        if path.endswith("/responses"):
+            return await self._stream(request, writer, responses=True)
+        return await self._json(writer, 404, {"error": {"message": f"unknown path {path}", "type": "not_found"}})
+
+    async def _json(self, writer, status: int, payload: Dict, extra_headers: str = "") -> bool:
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} MOCK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+            f"{extra_headers}\r\n".encode() + data
+        )
+        await writer.drain()
+        return True
+
+    async def _error(self, writer) -> bool:
+        config = self.config
+        extra = ""
+        if config.error_status == 429 and config.retry_after is not None:
+            extra = f"Retry-After: {config.retry_after:g}\r\n"
+        return await self._json(
+            writer, config.error_status,
+            {"error": {"message": "mock injected error", "type": "server_error", "code": config.error_status}},
+            extra,
+        )
+
+    def _plan(self, request: Dict) -> Tuple[str, int, int, int]:
+        config = self.config
+        model = request.get("model", "mock")
+        reasoning = any(name in model for name in config.reasoning_models)
+        reasoning_chunks = config.reasoning_chunks if reasoning else 0
+        max_tokens = request.get("max_tokens") or request.get("max_output_tokens")
+        chunks = config.chunks
+        if max_tokens:
+            chunks = max(1, min(chunks, max_tokens // max(config.chunk_size, 1)))
+        return model, chunks, reasoning_chunks, config.chunk_size
+
+    @staticmethod
+    def _prompt_tokens(request: Dict) -> int:
+        messages = request.get("messages") or request.get("input") or []
+        if isinstance(messages, str):
+            return max(1, len(messages) // 4)
+        text = "".join(str(m.get("content", "")) for m in messages if isinstance(m, dict))
+        return max(1, (len(text) + len(str(request.get("instructions") or ""))) // 4)
+
+    async def _chat_completion(self, request: Dict, writer) -> bool:
+        model, chunks, reasoning_chunks, size = self._plan(request)
+        await asyncio.sleep(self.config.ttft)
+        content = "".join(_word(i, size) for i in range(chunks))
+        prompt_tokens = self._prompt_tokens(request)
+        completion_tokens = (chunks + reasoning_chunks) * size
+        message = {"role": "assistant", "content": content}
+        if reasoning_chunks:
+            message["reasoning_content"] = "".join(_word(i, size) for i in range(reasoning_chunks))
+        return await self._json(writer, 200, {
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": 0, "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "completion_tokens_details": {"reasoning_tokens": reasoning_chunks * size},
+            },
+        })
+
+    async def _stream(self, request: Dict, writer: asyncio.StreamWriter, responses: bool) -> bool:
+        config = self.config
+        model, chunks, reasoning_chunks, size = self._plan(request)
+        if responses:
+            # Responses API 只有在请求了 reasoning.summary 时才下发推理摘要
+            reasoning = request.get("reasoning") or {}
+            reasoning_tokens = reasoning_chunks * size if reasoning else 0
+            if not reasoning.get("summary"):
+                reasoning_chunks = 0
+            frames = _responses_frames(model, chunks, reasoning_chunks, size)
+        else:
+            reasoning_tokens = reasoning_chunks * size
+            frames = _chat_frames(model, chunks, reasoning_chunks, size)
+        disconnect_at = None
+        if config.disconnect_rate and self._random.random() < config.disconnect_rate:
+            disconnect_at = len(frames) // 2
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        self.active_streams += 1
+        self.max_active_streams = max(self.max_active_streams, self.active_streams)
+        try:
+            if responses:
+                writer.write(_chunked(_sse({
+                    "type": "response.created", "sequence_number": 0,
+                    "response": {"id": "resp_mock", "object": "response", "created_at": int(time.time()),
+                                 "model": model, "status": "in_progress", "output": []},
+                })))
+            await writer.drain()
+            slow = config.slow_rate and self._random.random() < config.slow_rate
+            await asyncio.sleep(config.slow_ttft if slow else config.ttft)
+
+            interval = 1.0 / config.chunk_rate if config.chunk_rate > 0 else 0.0
+            start = time.perf_counter()
+            for i, frame in enumerate(frames):
+                if writer.is_closing():
+                    # 客户端已断开（取消或对冲落败），不再往关闭的连接上写
+                    return False
+                if i == disconnect_at:
+                    writer.transport.abort()
+                    return False
+                writer.write(frame)
+                if interval:
+                    await writer.drain()
+                    delay = start + (i + 1) * interval - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                elif i % 64 == 63:
+                    await writer.drain()
+            if writer.is_closing():
+                return False
+
+            prompt_tokens = self._prompt_tokens(request)
+            output_tokens = chunks * size + reasoning_tokens
+            if responses:
+                writer.write(_chunked(_sse({
+                    "type": "response.completed", "sequence_number": len(frames) + 1,
+                    "response": {
+                        "id": "resp_mock", "object": "response", "created_at": int(time.time()), "model": model,
+                        "status": "completed", "output": [], "parallel_tool_calls": False,
+                        "tool_choice": "auto", "tools": [],
+                        "usage": {
+                            "input_tokens": prompt_tokens,
+                            "input_tokens_details": {"cached_tokens": 0},
+                            "output_tokens": output_tokens,
+                            "output_tokens_details": {"reasoning_tokens": reasoning_tokens},
+                            "total_tokens": prompt_tokens + output_tokens,
+                        },
+                    },
+                })))
+            else:
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    writer.write(_chunked(_sse({
+                        "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                        "choices": [],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": output_tokens,
+                            "total_tokens": prompt_tokens + output_tokens,
+                            "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+                        },
+                    })))
+                writer.write(_chunked(b"data: [DONE]\n\n"))
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            return True
+        finally:
+            self.active_streams -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 SSE 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ttft", type=float, default=MockConfig.ttft, help="首个分片前的等待时间（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="首 token 变慢的请求比例")
+    parser.add_argument("--slow-ttft", type=float, default=MockConfig.slow_ttft, help="变慢的请求的首 token 等待时间（秒）")
+    parser.add_argument("--chunk-rate", type=float, default=MockConfig.chunk_rate, help="每秒分片数，0 为不限速")
+    parser.add_argument("--chunk-size", type=int, default=MockConfig.chunk_size, help="每个分片的 token 数")
+    parser.add_argument("--chunks", type=int, default=MockConfig.chunks, help="每个回答的分片数")
+    parser.add_argument("--reasoning-chunks", type=int, default=MockConfig.reasoning_chunks)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="直接返回错误的请求比例")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="中途断开的请求比例")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        ttft=args.ttft,
+        slow_rate=args.slow_rate,
+        slow_ttft=args.slow_ttft,
+        chunk_rate=args.chunk_rate,
+        chunk_size=args.chunk_size,
+        chunks=args.chunks,
+        reasoning_chunks=args.reasoning_chunks,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed,
+    )
+    server = MockServer(config, args.host, args.port)
+
+    async def serve():
+        await server.start()
+        print(f"模拟服务已启动: {server.base_url}", flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+各厂商 OpenAI 兼容接口的接入配置
+
+默认值与各目录下脚本保持一致（qwen/main.py、kimi/main.py、deepseek/*.py、gpt/main.py、gork/test.py），
+供并发对比引擎等共享组件按名称选用。
+
+本模块只依赖标准库：列出厂商、检查 SDK 是否安装都不会导入 openai / httpx 等厂商 SDK，
+SDK 在第一次真正调用时才导入。第三方厂商可以通过插件注册：
+    - 安装包在 entry point 组 "evalai.providers" 中声明 ProviderSpec（或返回 ProviderSpec 列表的函数）
+    - 或者在环境变量 EVALAI_PROVIDER_PLUGINS 中列出模块名（逗号分隔），模块导入时调用 register_provider()，
+      或者在模块级变量 PROVIDERS 中给出 ProviderSpec 列表
+插件在第一次按名称查找不到厂商、或列出全部厂商时才加载。
+
+用法：
+    from evalai.providers import get_provider, list_providers, register_provider
+    register_provider(ProviderSpec("mistral", "https://api.mistral.ai/v1", "MISTRAL_API_KEY", "mistral-small"))
+"""
+import importlib
+import importlib.util
+import os
+import warnings
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+ROOT = Path(__file__).resolve().parents[1]
+
+DEFAULT_SYSTEM = "You are a helpful assistant."
+
+PLUGIN_GROUP = "evalai.providers"
+PLUGIN_ENV = "EVALAI_PROVIDER_PLUGINS"
+
+# 模块名与 pip 包名不一致的 SDK
+PIP_NAMES = {"google.genai": "google-genai", "xai_sdk": "xai-sdk", "dotenv": "python-dotenv"}
+
+
+class ProviderError(Exception):
+    """厂商配置相关异常"""
+    pass
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """
+    单个厂商/模型的接入配置
+
+    Attributes:
+        name: 厂商名称，命令行和结果中使用
+        base_url: OpenAI 兼容接口地址，None 表示使用 OpenAI 官方地址
+        api_key_env: 读取 API 密钥的环境变量名
+        model: 默认模型名称
+        api: 接口风格，"chat" 为 chat.completions，"responses" 为 Responses API
+        system: 默认系统消息
+        params: 每次请求附带的额外参数
+        proxy_env: 读取代理地址的环境变量名，未设置该变量时直连
+        script: 对应的独立脚本（相对仓库根目录），没有脚本时为 None
+        class_name: 脚本中的流式调用类名
+        sdk: 调用该厂商需要的 Python 模块，第一次使用时才导入
+    """
+    name: str
+    base_url: Optional[str]
+    api_key_env: str
+    model: str
+    api: str = "chat"
+    system: str = DEFAULT_SYSTEM
+    params: Dict[str, Any] = field(default_factory=dict)
+    proxy_env: Optional[str] = None
+    script: Optional[str] = None
+    class_name: Optional[str] = None
+    sdk: Tuple[str, ...] = ("openai", "httpx")
+
+    def api_key(self) -> str:
+        """从环境变量读取 API 密钥"""
+        key = os.getenv(self.api_key_env)
+        if not key:
+            raise ProviderError(f"缺少 {self.api_key_env}")
+        return key
+
+    def proxy(self) -> Optional[str]:
+        """从环境变量读取代理地址"""
+        return os.getenv(self.proxy_env) if self.proxy_env else None
+
+    def missing_sdk(self) -> List[str]:
+        """
+        返回未安装的 SDK 模块名
+
+        只查找模块文件，不执行导入，可以在列出厂商时放心调用。
+        """
+        return [module for module in self.sdk if not _module_available(module)]
+
+
+PROVIDERS: Dict[str, ProviderSpec] = {
+    "qwen": ProviderSpec(
+        "qwen", "https://dashscope.aliyuncs.com/compatible-mode/v1", "DASHSCOPE_API_KEY", "qwen-plus",
+        script="qwen/main.py", class_name="QwenStream",
+    ),
+    "kimi": ProviderSpec(
+        "kimi", "https://api.moonshot.cn/v1", "MOONSHOT_API_KEY", "kimi-k2-0905-preview",
+        script="kimi/main.py", class_name="KimiStream",
+    ),
+    "deepseek-chat": ProviderSpec(
+        "deepseek-chat", "https://api.deepseek.com", "DEEPSEEK_API_KEY", "deepseek-chat",
+        script="deepseek/chat-main.py", class_name="DeepSeekChatStream",
+    ),
+    "deepseek-reasoner": ProviderSpec(
+        "deepseek-reasoner", "https://api.deepseek.com", "DEEPSEEK_API_KEY", "deepseek-reasoner",
+        script="deepseek/reasoner-main.py", class_name="DeepSeekReasonerStream",
+    ),
+    "gpt": ProviderSpec(
+        "gpt", None, "OPENAI_API_KEY", "gpt-5-nano",
+        api="responses", params={"reasoning": {"effort": "minimal"}}, proxy_env="OPENAI_PROXY",
+        script="gpt/main.py", class_name="OpenAIClient",
+    ),
+    "grok": ProviderSpec(
+        "grok", "https://api.x.ai/v1", "XAI_API_KEY", "grok-code-fast", proxy_env="XAI_PROXY"
+    ),
+    "gemini": ProviderSpec(
+        "gemini", "https://generativelanguage.googleapis.com/v1beta/openai", "GEMINI_API_KEY", "gemini-2.5-flash",
+        proxy_env="GEMINI_PROXY",
+    ),
+}
+
+
+_plugins_loaded = False
+
+
+def _module_available(module: str) -> bool:
+    # 带点的模块名需要先找到父包；父包不存在时 find_spec 抛 ModuleNotFoundError
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def register_provider(spec: ProviderSpec, replace_existing: bool = False) -> ProviderSpec:
+    """
+    注册一个厂商，注册后即可按名称在命令行和各共享组件中使用
+
+    Args:
+        spec: 厂商配置
+        replace_existing: 同名厂商已存在时是否覆盖
+
+    Returns:
+        注册的 ProviderSpec
+    """
+    if spec.name in PROVIDERS and not replace_existing:
+        raise ProviderError(f"厂商 {spec.name} 已存在")
+    PROVIDERS[spec.name] = spec
+    return spec
+
+
+def _register_plugin(source: str, value: Union[ProviderSpec, Iterable[ProviderSpec], Callable, None]):
+    if callable(value) and not isinstance(value, ProviderSpec):
+        value = value()
+    if value is None:  # 模块导入时已自行调用 register_provider
+        return
+    for spec in [value] if isinstance(value, ProviderSpec) else value:
+        if spec.name in PROVIDERS:
+            warnings.warn(f"插件 {source} 中的厂商 {spec.name} 与已有厂商重名，已忽略")
+            continue
+        register_provider(spec)
+
+
+def load_plugins():
+    """加载 entry point 和环境变量中声明的厂商插件，只在第一次调用时执行"""
+    global _plugins_loaded
+    if _plugins_loaded:
+        return
+    _plugins_loaded = True
+    from importlib.metadata import entry_points  # 只在需要插件时付出扫描已安装包的开销
+
+    for ep in entry_points(group=PLUGIN_GROUP):
+        try:
+            _register_plugin(ep.value, ep.load())
+        except Exception as e:
+            warnings.warn(f"加载厂商插件 {ep.value} 失败: {e}")
+    for module in filter(None, (m.strip() for m in os.getenv(PLUGIN_ENV, "").split(","))):
+        try:
+            _register_plugin(module, getattr(importlib.import_module(module), "PROVIDERS", None))
+        except Exception as e:
+            warnings.warn(f"加载厂商插件 {module} 失败: {e}")
+
+
+def list_providers() -> List[ProviderSpec]:
+    """
+    列出所有厂商（含插件），按名称排序
+
+    Returns:
+        ProviderSpec 列表
+    """
+    load_plugins()
+    return [PROVIDERS[name] for name in sorted(PROVIDERS)]
+
+
+def import_sdk(spec: ProviderSpec) -> None:
+    """
+    导入厂商需要的 SDK，未安装时给出安装提示
+
+    Args:
+        spec: 厂商配置
+    """
+    for module in spec.sdk:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            package = PIP_NAMES.get(module, module.split(".")[0])
+            raise ProviderError(f"{spec.name} 需要 {module}，请先安装：pip install {package}") from e
+
+
+def get_provider(name: str) -> ProviderSpec:
+    """
+    按名称获取厂商配置
+
+    Args:
+        name: 厂商名称，可用 "厂商:模型" 的形式覆盖默认模型，例如 "qwen:qwen-max"
+
+    Returns:
+        对应的 ProviderSpec
+    """
+    provider, _, model = name.partition(":")
+    spec = PROVIDERS.get(provider)
+    if spec is None and not _plugins_loaded:
+        load_plugins()
+        spec = PROVIDERS.get(provider)
+    if spec is None:
+        raise ProviderError(f"未知的厂商: {provider}（可选: {', '.join(sorted(PROVIDERS))}）")
+    if model:
+        spec = replace(spec, model=model)
+    return spec
+
+
+_script_classes: Dict[str, type] = {}
+
+
+def load_stream_class(name: str) -> type:
+    """
+    从各目录下的独立脚本中加载流式调用类（如 qwen/main.py 中的 QwenStream）
+
+    脚本文件名可能含连字符（deepseek/chat-main.py），因此按文件路径加载而不是 import。
+
+    Args:
+        name: 厂商名称
+
+    Returns:
+        对应的类
+    """
+    spec = get_provider(name)
+    if not spec.script:
+        raise ProviderError(f"{spec.name} 没有对应的独立脚本")
+    cls = _script_classes.get(spec.script)
+    if cls is None:
+        import_sdk(spec)  # 先检查依赖，缺少 SDK 时给出安装提示而不是脚本里的 ImportError
+        module_name = "evalai_script_" + spec.script.replace("/", "_").replace("-", "_").removesuffix(".py")
+        module_spec = importlib.util.spec_from_file_location(module_name, ROOT / spec.script)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+        cls = _script_classes[spec.script] = getattr(module, spec.class_name)
+    return cls
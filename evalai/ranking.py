@@ -0,0 +1,418 @@
+"""
+增量排名（系统设计.md 中的综合排名、分类排名和趋势排名）
+
+每条请求记录到达时只更新几个累加器：按 (模型, 分类) 的全量累计，以及按 (模型, 分类, 时间桶) 的分桶累计，
+不保留原始记录。查询排行榜时从累加器算出各维度的原始指标，在参与排名的模型之间做 min-max 归一化后加权，
+复杂度只和模型数（趋势排名还要乘以窗口内的桶数）有关，与请求总数无关。
+权重在查询时传入，修改权重不需要重新扫描历史数据。
+
+维度（越高越好，归一化到 0-1）：
+    rating       用户评分均值
+    speed        成功请求的平均响应时间（越短越好）
+    efficiency   每秒输出 token 数
+    cost         每千 token 费用（越低越好）
+    reliability  成功率
+
+某个模型缺少某一维度的数据（例如还没有评分）时，该维度不参与它的加权，其余维度的权重按比例放大。
+
+用法：
+    ranking = RankingEngine()
+    writer = RequestLogWriter("requests.sqlite3", listeners=[ranking.observe_batch]).start()
+    ranking.rate("qwen-plus", 8, category="编程")
+    for row in ranking.leaderboard(category="编程", weights={"rating": 0.6, "cost": 0.4}):
+        ...
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from evalai.requestlog import RATING_SCALE
+
+DIMENSIONS = ("rating", "speed", "efficiency", "cost", "reliability")
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "rating": 0.4,
+    "speed": 0.2,
+    "efficiency": 0.15,
+    "cost": 0.15,
+    "reliability": 0.1,
+}
+_LOWER_IS_BETTER = {"speed", "cost"}
+ALL = None  # 不区分分类
+_FIELDS = (
+    "model", "prompt_category", "status", "response_time", "output_tokens", "thinking_tokens",
+    "total_tokens", "total_cost", "created_at", "rating_score",
+)
+_Row = namedtuple("_Row", _FIELDS)
+
+
+def _scale_rating(row: _Row, factor: float) -> _Row:
+    if row.rating_score is None:
+        return row
+    return row._replace(rating_score=row.rating_score * factor)
+
+
+class Aggregate:
+    """
+    一组请求的累加器，合并和更新都是 O(1)
+    """
+
+    __slots__ = (
+        "requests", "success", "latency_ms", "output_tokens", "total_tokens", "cost",
+        "rating_sum", "rating_count",
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.success = 0
+        self.latency_ms = 0.0  # 成功请求的响应时间之和
+        self.output_tokens = 0  # 成功请求的输出 token 数之和
+        self.total_tokens = 0
+        self.cost = 0.0
+        self.rating_sum = 0.0
+        self.rating_count = 0
+
+    def add(self, record):
+        self.requests += 1
+        self.total_tokens += record.total_tokens
+        self.cost += record.total_cost
+        if record.status == "success":
+            self.success += 1
+            self.latency_ms += record.response_time
+            self.output_tokens += record.output_tokens + record.thinking_tokens
+        # 日志库中事后补充的评分（RequestRecord 本身不带评分）
+        rating = getattr(record, "rating_score", None)
+        if rating is not None:
+            self.rating_sum += rating
+            self.rating_count += 1
+
+    def merge(self, other: "Aggregate"):
+        for name in Aggregate.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def values(self, rating_scale: float) -> Dict[str, Optional[float]]:
+        """各维度的原始指标，没有数据时为 None"""
+        return {
+            "rating": self.rating_sum / self.rating_count / rating_scale if self.rating_count else None,
+            "speed": self.latency_ms / self.success if self.success else None,
+            "efficiency": self.output_tokens / (self.latency_ms / 1000) if self.latency_ms > 0 else None,
+            # 费用为 0 通常是单价未知，按缺少数据处理
+            "cost": self.cost / self.total_tokens * 1000 if self.total_tokens and self.cost > 0 else None,
+            "reliability": self.success / self.requests if self.requests else None,
+        }
+
+
+@dataclass
+class Ranking:
+    """
+    排行榜中的一行
+
+    Attributes:
+        rank: 名次（从 1 开始）
+        model: 模型名称
+        score: 加权得分（0-1）
+        requests: 参与统计的请求数
+        metrics: 各维度的原始指标（评分已除以满分）
+        scores: 各维度归一化后的得分
+    """
+    rank: int
+    model: str
+    score: float
+    requests: int
+    metrics: Dict[str, Optional[float]] = field(default_factory=dict)
+    scores: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class Trend:
+    """
+    趋势排名中的一行：最近窗口与上一个窗口的对比
+
+    Attributes:
+        model: 模型名称
+        score: 最近窗口的得分
+        previous: 上一个窗口的得分，上一个窗口没有数据时为 None
+        delta: 得分变化
+        rank: 最近窗口的名次
+        rank_change: 名次变化（正数表示上升）
+    """
+    model: str
+    score: float
+    previous: Optional[float]
+    delta: Optional[float]
+    rank: int
+    rank_change: Optional[int]
+
+
+class RankingEngine:
+    """
+    按 (模型, 分类) 增量维护统计并按需排名
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        bucket_seconds: float = 86400.0,
+        retention: int = 90,
+        rating_scale: float = 10.0,
+        min_requests: int = 1,
+    ):
+        """
+        初始化排名引擎
+
+        Args:
+            weights: 默认权重，未给出的维度使用 DEFAULT_WEIGHTS
+            bucket_seconds: 趋势统计的时间桶长度（秒），默认按天
+            retention: 每个 (模型, 分类) 保留的时间桶数，更早的桶只计入全量累计
+            rating_scale: 评分满分（系统设计中主观评分为 1-10 分）；replay() 读到的日志评分为 1-5 分，
+                会按 rating_scale / RATING_SCALE 换算
+            min_requests: 请求数少于该值的模型不参与排名
+        """
+        self.weights = self._weights(weights, DEFAULT_WEIGHTS)
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention
+        self.rating_scale = rating_scale
+        self.min_requests = min_requests
+        self._totals: Dict[Tuple[str, Optional[str]], Aggregate] = {}
+        self._buckets: Dict[Tuple[str, Optional[str]], "OrderedDict[int, Aggregate]"] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _weights(weights: Optional[Dict[str, float]], base: Dict[str, float]) -> Dict[str, float]:
+        merged = dict(base)
+        for name, weight in (weights or {}).items():
+            if name not in DIMENSIONS:
+                raise ValueError(f"未知的排名维度 {name}，可选: {', '.join(DIMENSIONS)}")
+            if weight < 0:
+                raise ValueError("权重不能为负数")
+            merged[name] = weight
+        return merged
+
+    # ------------- 更新 -------------
+    def _cells(self, model: str, category: Optional[str], ts: float) -> List[Aggregate]:
+        bucket = int(ts // self.bucket_seconds)
+        cells = []
+        # 同时计入具体分类和「全部」，综合排名不必再合并各分类
+        for key in {(model, category), (model, ALL)}:
+            total = self._totals.get(key)
+            if total is None:
+                total = self._totals[key] = Aggregate()
+            cells.append(total)
+            buckets = self._buckets.get(key)
+            if buckets is None:
+                buckets = self._buckets[key] = OrderedDict()
+            cell = buckets.get(bucket)
+            if cell is None:
+                late = bool(buckets) and bucket < next(reversed(buckets))
+                if late and len(buckets) >= self.retention and bucket < next(iter(buckets)):
+                    continue  # 早于保留范围的迟到记录只计入全量累计
+                cell = buckets[bucket] = Aggregate()
+                if late:
+                    # 迟到的记录：重新按时间排序（很少发生）
+                    for old in sorted(buckets):
+                        buckets.move_to_end(old)
+                while len(buckets) > self.retention:
+                    buckets.popitem(last=False)
+            cells.append(cell)
+        return cells
+
+    def observe(self, record):
+        """
+        计入一条请求记录
+
+        Args:
+            record: RequestRecord（或具有相同字段的对象）
+        """
+        with self._lock:
+            for cell in self._cells(record.model, record.prompt_category, record.created_at):
+                cell.add(record)
+
+    def observe_batch(self, records: Iterable):
+        """批量计入，可直接作为 RequestLogWriter 的 listener"""
+        with self._lock:
+            for record in records:
+                for cell in self._cells(record.model, record.prompt_category, record.created_at):
+                    cell.add(record)
+
+    def replay(self, path: Union[str, Path], since: Optional[float] = None) -> int:
+        """
+        从 api_requests 日志库恢复统计（启动时调用一次，之后靠 observe 增量更新）
+
+        Args:
+            path: RequestLogWriter 写入的 SQLite 文件
+            since: 只读取该时间（Unix 时间戳）之后的记录
+
+        Returns:
+            读取的记录数
+        """
+        factor = self.rating_scale / RATING_SCALE  # 日志中的评分换算到 rate() 使用的尺度
+        sql = f"SELECT {', '.join(_FIELDS)} FROM api_requests"
+        params: Tuple = ()
+        if since is not None:
+            sql += " WHERE created_at >= ?"
+            params = (since,)
+        count = 0
+        conn = sqlite3.connect(str(path))
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                self.observe_batch(_scale_rating(_Row._make(row), factor) for row in rows)
+                count += len(rows)
+        finally:
+            conn.close()
+        return count
+
+    def rate(self, model: str, score: float, category: Optional[str] = None, ts: Optional[float] = None):
+        """
+        计入一次用户评分
+
+        Args:
+            model: 模型名称
+            score: 评分（0 到 rating_scale）
+            category: 提示词分类
+            ts: 评分时间，None 表示现在
+        """
+        if not 0 <= score <= self.rating_scale:
+            raise ValueError(f"评分必须在 0 到 {self.rating_scale} 之间")
+        with self._lock:
+            for cell in self._cells(model, category, time.time() if ts is None else ts):
+                cell.rating_sum += score
+                cell.rating_count += 1
+
+    # ------------- 查询 -------------
+    def categories(self) -> List[str]:
+        """出现过的分类"""
+        with self._lock:
+            return sorted({category for _, category in self._totals if category is not None})
+
+    def stats(self, model: str, category: Optional[str] = ALL) -> Optional[Dict[str, Optional[float]]]:
+        """
+        单个 (模型, 分类) 的全量累计指标，只查一次字典，可以在请求路径上调用
+
+        Returns:
+            各维度的原始指标（同 Ranking.metrics）加 requests；没有数据时返回 None
+        """
+        with self._lock:
+            aggregate = self._totals.get((model, category))
+            if aggregate is None:
+                return None
+            values = aggregate.values(self.rating_scale)
+            values["requests"] = aggregate.requests
+            return values
+
+    def _window(self, category: Optional[str], first: int, last: int) -> Dict[str, Aggregate]:
+        merged: Dict[str, Aggregate] = {}
+        for (model, cat), buckets in self._buckets.items():
+            if cat != category:
+                continue
+            total = Aggregate()
+            for bucket in reversed(buckets):
+                if bucket < first:
+                    break
+                if bucket <= last:
+                    total.merge(buckets[bucket])
+            if total.requests or total.rating_count:
+                merged[model] = total
+        return merged
+
+    def _rank(self, aggregates: Dict[str, Aggregate], weights: Dict[str, float]) -> List[Ranking]:
+        eligible = {model: agg for model, agg in aggregates.items() if agg.requests >= self.min_requests}
+        metrics = {model: agg.values(self.rating_scale) for model, agg in eligible.items()}
+        bounds = {}
+        for name in DIMENSIONS:
+            present = [m[name] for m in metrics.values() if m[name] is not None]
+            if present:
+                bounds[name] = (min(present), max(present))
+        rows = []
+        for model, values in metrics.items():
+            scores = {}
+            for name, value in values.items():
+                if value is None:
+                    continue
+                if name == "rating" or name == "reliability":
+                    # 本身就是 0-1 的绝对值，不做相对归一化
+                    score = value
+                else:
+                    lo, hi = bounds[name]
+                    score = 1.0 if hi == lo else (value - lo) / (hi - lo)
+                    if name in _LOWER_IS_BETTER:
+                        score = 1.0 - score
+                scores[name] = score
+            weight = sum(weights[name] for name in scores)
+            total = sum(weights[name] * score for name, score in scores.items()) / weight if weight else 0.0
+            rows.append(Ranking(0, model, total, eligible[model].requests, values, scores))
+        rows.sort(key=lambda row: (-row.score, row.model))
+        for i, row in enumerate(rows, 1):
+            row.rank = i
+        return rows
+
+    def leaderboard(
+        self,
+        category: Optional[str] = None,
+        weights: Optional[Dict[str, float]] = None,
+        last_buckets: Optional[int] = None,
+    ) -> List[Ranking]:
+        """
+        排行榜
+
+        Args:
+            category: 分类，None 表示综合排名
+            weights: 本次查询使用的权重，覆盖默认权重中的对应维度
+            last_buckets: 只统计最近若干个时间桶，None 表示全部历史
+
+        Returns:
+            按得分降序排列的 Ranking 列表
+        """
+        weights = self._weights(weights, self.weights)
+        with self._lock:
+            if last_buckets is None:
+                aggregates = {model: agg for (model, cat), agg in self._totals.items() if cat == category}
+            else:
+                last = self._current_bucket()
+                aggregates = self._window(category, last - last_buckets + 1, last)
+            return self._rank(aggregates, weights)
+
+    def trend(
+        self,
+        category: Optional[str] = None,
+        window: int = 7,
+        weights: Optional[Dict[str, float]] = None,
+    ) -> List[Trend]:
+        """
+        趋势排名：最近 window 个时间桶与之前 window 个时间桶的得分对比
+
+        Args:
+            category: 分类，None 表示全部
+            window: 窗口包含的时间桶数
+            weights: 本次查询使用的权重
+
+        Returns:
+            按得分变化降序排列的 Trend 列表（没有上一窗口数据的模型排在最后）
+        """
+        weights = self._weights(weights, self.weights)
+        with self._lock:
+            last = self._current_bucket()
+            current = self._rank(self._window(category, last - window + 1, last), weights)
+            previous = self._rank(self._window(category, last - 2 * window + 1, last - window), weights)
+        before = {row.model: row for row in previous}
+        rows = []
+        for row in current:
+            old = before.get(row.model)
+            rows.append(Trend(
+                row.model, row.score,
+                old.score if old else None,
+                row.score - old.score if old else None,
+                row.rank,
+                old.rank - row.rank if old else None,
+            ))
+        rows.sort(key=lambda t: (t.delta is None, -(t.delta or 0.0), t.rank))
+        return rows
+
+    def _current_bucket(self) -> int:
+        return int(time.time() // self.bucket_seconds)
@@ -0,0 +1,394 @@
+"""
+厂商速率限制
+
+按厂商（以及每个 API 密钥）维护每分钟请求数（RPM）和每分钟 token 数（TPM）两个令牌桶。
+请求发出前先按 prompt 估算 token 数并在桶中预留，桶内余额不足时排队等待而不是直接打到厂商的限流上；
+请求结束后再按实际用量多退少补。
+
+收到 429 时优先遵循 Retry-After，没有时使用带抖动的指数退避；同一个密钥上的其他请求也一起暂停，
+并把该桶的速率临时下调，之后每次成功再逐步恢复到配置值。
+使用限速器时 SDK 自身不再重试，连接错误、超时和 5xx 同样由 call() 按相同的退避重试（不暂停其他请求）。
+排队或请求途中被取消时，预留的额度会立即归还，不会挤占后面排队的请求。
+
+用法：
+    limiter = RateLimiter(rpm=60, tpm=100_000)
+    limiter.configure("qwen", rpm=600, tpm=1_000_000)
+    async with FanOutEngine(["qwen", "kimi"], limiter=limiter) as engine:
+        ...
+    print(limiter.stats())
+"""
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from openai import APIConnectionError, InternalServerError
+
+MIN_RATE_FACTOR = 0.1  # 429 后速率最多下调到配置值的 10%
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """
+    从异常对应的 HTTP 响应中读取 Retry-After（支持秒数、HTTP 日期和 retry-after-ms）
+
+    Returns:
+        等待秒数，没有该响应头时返回 None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """是否为可重试的 429（余额不足 insufficient_quota 同样返回 429，但重试没有意义）"""
+    if getattr(error, "status_code", None) != 429:
+        return False
+    return getattr(error, "code", None) != "insufficient_quota"
+
+
+def is_transient(error: BaseException) -> bool:
+    """是否为 SDK 原本会自动重试的临时错误：连接错误（含超时）和 5xx"""
+    return isinstance(error, (APIConnectionError, InternalServerError))
+
+
+class TokenBucket:
+    """
+    按分钟计的令牌桶
+
+    reserve() 允许余额变为负数：负数部分就是排在前面的请求尚未偿还的额度，
+    新请求需要等待的时间等于欠额除以补充速率，因此等待的请求按到达顺序依次放行。
+    """
+
+    __slots__ = ("limit", "rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        """
+        Args:
+            per_minute: 每分钟允许的额度
+            burst: 桶容量（空闲后允许的突发量），默认为每分钟额度的 1/6，避免窗口边界处翻倍
+        """
+        if per_minute <= 0:
+            raise ValueError("per_minute 必须大于 0")
+        self.limit = per_minute / 60.0
+        self.rate = self.limit
+        self.capacity = burst if burst is not None else max(per_minute / 6.0, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """预留额度并返回需要等待的秒数"""
+        self._refill(now)
+        self.tokens -= amount
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def refund(self, amount: float, now: float):
+        """归还（amount 为负时补扣）额度"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def penalize(self, until: float, now: float):
+        """429 之后：暂停到 until，并把速率下调 30%（同一暂停期内的多个 429 只下调一次）"""
+        self._refill(now)
+        if now >= self.blocked_until:
+            self.rate = max(self.rate * 0.7, self.limit * MIN_RATE_FACTOR)
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = min(self.tokens, 0.0)
+
+    def recover(self):
+        """成功一次后把速率恢复 5%，直到配置值"""
+        if self.rate < self.limit:
+            self.rate = min(self.limit, self.rate + self.limit * 0.05)
+
+
+class LimiterStats:
+    """
+    单个厂商的排队统计
+    """
+
+    __slots__ = ("requests", "waiting", "max_waiting", "waited", "total_wait", "max_wait", "rate_limited", "retries")
+
+    def __init__(self):
+        self.requests = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "waited": self.waited,
+            "avg_wait": self.total_wait / self.waited if self.waited else 0.0,
+            "max_wait": self.max_wait,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+        }
+
+
+class Reservation:
+    """
+    一次请求在各令牌桶中的预留，请求结束后交给 RateLimiter.settle()
+    """
+
+    __slots__ = ("provider", "buckets", "tokens", "wait")
+
+    def __init__(self, provider: str, buckets: List[Tuple[Optional[TokenBucket], Optional[TokenBucket]]],
+                 tokens: int, wait: float):
+        self.provider = provider
+        self.buckets = buckets
+        self.tokens = tokens
+        self.wait = wait
+
+
+_Scope = Tuple[str, Optional[str]]  # (厂商, 密钥摘要)；密钥摘要为 None 表示整个厂商共用
+
+
+class RateLimiter:
+    """
+    按厂商 / API 密钥的 RPM + TPM 限速器，线程安全，可同时用于多个事件循环
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        """
+        初始化限速器
+
+        Args:
+            rpm: 未单独配置的厂商，每个密钥默认的每分钟请求数，None 表示不限制
+            tpm: 未单独配置的厂商，每个密钥默认的每分钟 token 数，None 表示不限制
+            max_retries: 429 最多重试次数
+            base_delay: 没有 Retry-After 时指数退避的初始等待（秒）
+            max_delay: 单次退避的上限（秒）
+        """
+        self.default = (rpm, tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._limits: Dict[Tuple[str, bool], Tuple[Optional[float], Optional[float]]] = {}
+        self._buckets: Dict[_Scope, Tuple[Optional[TokenBucket], Optional[TokenBucket]]] = {}
+        self._stats: Dict[str, LimiterStats] = {}
+
+    def configure(self, provider: str, rpm: Optional[float] = None, tpm: Optional[float] = None, per_key: bool = True):
+        """
+        设置某个厂商的限额，只影响之后新建的桶
+
+        Args:
+            provider: 厂商名称
+            rpm: 每分钟请求数，None 表示不限制
+            tpm: 每分钟 token 数，None 表示不限制
+            per_key: True 时每个 API 密钥各有一份限额；False 时该厂商所有密钥共用一份
+        """
+        with self._lock:
+            self._limits[(provider, per_key)] = (rpm, tpm)
+
+    def _scopes(self, provider: str, api_key: Optional[str]) -> List[_Scope]:
+        key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16] if api_key else ""
+        scopes = [(provider, key_id)]
+        if (provider, False) in self._limits:
+            scopes.append((provider, None))
+        return scopes
+
+    def _bucket_pair(self, scope: _Scope) -> Tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        pair = self._buckets.get(scope)
+        if pair is None:
+            provider, key_id = scope
+            rpm, tpm = self._limits.get((provider, key_id is not None), self.default if key_id is not None else (None, None))
+            pair = self._buckets[scope] = (TokenBucket(rpm) if rpm else None, TokenBucket(tpm) if tpm else None)
+        return pair
+
+    def _stats_for(self, provider: str) -> LimiterStats:
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = LimiterStats()
+        return stats
+
+    def reserve(self, provider: str, api_key: Optional[str], tokens: int) -> Reservation:
+        """
+        在相关的桶中预留一次请求的额度（不等待）
+
+        Args:
+            provider: 厂商名称
+            api_key: 本次使用的 API 密钥
+            tokens: 预估的 token 数
+
+        Returns:
+            Reservation，其 wait 为需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            buckets = [self._bucket_pair(scope) for scope in self._scopes(provider, api_key)]
+            wait = 0.0
+            for requests, token_bucket in buckets:
+                if requests is not None:
+                    wait = max(wait, requests.reserve(1, now))
+                if token_bucket is not None:
+                    wait = max(wait, token_bucket.reserve(tokens, now))
+            stats = self._stats_for(provider)
+            stats.requests += 1
+            if wait > 0:
+                stats.waited += 1
+                stats.total_wait += wait
+                stats.max_wait = max(stats.max_wait, wait)
+        return Reservation(provider, buckets, tokens, wait)
+
+    async def acquire(self, provider: str, api_key: Optional[str], tokens: int) -> Reservation:
+        """预留额度，并在余额不足时异步等待"""
+        reservation = self.reserve(provider, api_key, tokens)
+        if reservation.wait > 0:
+            stats = self._stats[provider]
+            stats.waiting += 1
+            stats.max_waiting = max(stats.max_waiting, stats.waiting)
+            try:
+                await asyncio.sleep(reservation.wait)
+            except BaseException:
+                # 排队时被取消（超时、对冲落败、Ctrl+C）：请求还没发出，RPM 和 TPM 都归还
+                self.release(reservation)
+                raise
+            finally:
+                stats.waiting -= 1
+        return reservation
+
+    def release(self, reservation: Reservation):
+        """归还一次尚未发出的请求的全部预留"""
+        with self._lock:
+            now = time.monotonic()
+            for requests, token_bucket in reservation.buckets:
+                if requests is not None:
+                    requests.refund(1, now)
+                if token_bucket is not None:
+                    token_bucket.refund(reservation.tokens, now)
+
+    def settle(self, reservation: Reservation, used_tokens: Optional[int]):
+        """
+        请求结束后按实际用量校正 TPM 桶
+
+        Args:
+            reservation: acquire() 返回的预留
+            used_tokens: 实际消耗的总 token 数，None 表示未知（保持预估值）
+        """
+        if used_tokens is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for _, token_bucket in reservation.buckets:
+                if token_bucket is not None:
+                    token_bucket.refund(reservation.tokens - used_tokens, now)
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """
+        计算第 attempt 次重试前的等待时间
+
+        有 Retry-After 时在其基础上加至多 10% 的抖动，避免同时放行；否则使用全抖动指数退避。
+        """
+        if retry_after is not None:
+            return retry_after * (1 + random.random() * 0.1)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def on_rate_limited(self, reservation: Reservation, delay: float):
+        """收到 429：暂停相关的桶并下调速率"""
+        with self._lock:
+            now = time.monotonic()
+            for pair in reservation.buckets:
+                for bucket in pair:
+                    if bucket is not None:
+                        bucket.penalize(now + delay, now)
+            self._stats_for(reservation.provider).rate_limited += 1
+
+    def _on_success(self, reservation: Reservation):
+        with self._lock:
+            for pair in reservation.buckets:
+                for bucket in pair:
+                    if bucket is not None:
+                        bucket.recover()
+
+    async def call(
+        self,
+        provider: str,
+        api_key: Optional[str],
+        tokens: int,
+        factory: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Reservation, Any]:
+        """
+        在限额内发起请求，遇到 429、连接错误、超时或 5xx 时退避重试
+
+        Args:
+            provider: 厂商名称
+            api_key: 本次使用的 API 密钥
+            tokens: 预估的 token 数
+            factory: 每次调用都发起一次新请求的协程工厂
+
+        Returns:
+            (Reservation, factory 的返回值)；Reservation 需在请求结束后交给 settle()
+        """
+        attempt = 0
+        while True:
+            reservation = await self.acquire(provider, api_key, tokens)
+            try:
+                result = await factory()
+            except Exception as e:
+                rate_limited = is_rate_limited(e)
+                if not (rate_limited or is_transient(e)) or attempt >= self.max_retries:
+                    self.settle(reservation, 0)
+                    raise
+                delay = self.backoff(attempt, retry_after_seconds(e))
+                self.settle(reservation, 0)
+                attempt += 1
+                self._stats[provider].retries += 1
+                if rate_limited:
+                    # 之后的 acquire() 会等到暂停结束，同一密钥上的其他请求也一起等待
+                    self.on_rate_limited(reservation, delay)
+                else:
+                    # 临时错误只影响本次请求，单独等待
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 请求途中被取消：退还预估的 token，RPM 仍按已发出计
+                self.settle(reservation, 0)
+                raise
+            self._on_success(reservation)
+            return reservation, result
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各厂商的排队深度、等待时间和 429 次数"""
+        with self._lock:
+            return {provider: stats.to_dict() for provider, stats in self._stats.items()}
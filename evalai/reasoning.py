@@ -0,0 +1,258 @@
+"""
+推理强度（reasoning_effort）的时延与成本对比
+
+同一个 prompt 对每个推理模型按不同的推理强度各请求 n 次，统计推理阶段和回答阶段的指标
+（见 evalai.metrics.StreamMetrics）：
+    首个推理 token / 首个回答 token 时间、推理耗时、推理 / 回答 token 数及速度、推理费用
+取中位数，看清每一档推理强度多花了多少时间和钱。
+
+推理强度的传法随接口不同：
+    Responses API（gpt）     reasoning={"effort": ...}，summary=True 时另请求推理摘要以拿到推理阶段的分片
+    chat.completions        reasoning_effort=...（OpenAI 兼容接口，grok 等支持；DeepSeek Reasoner 会忽略）
+推理过程不下发时没有「首个推理 token」，推理耗时体现在首个回答 token 时间里，推理 token 数仍来自用量信息。
+
+用法：
+    rows = run_effort_sweep("9.11 和 9.9 哪个大？", ["gpt", "grok:grok-3-mini"], ["minimal", "low", "medium"], n=3)
+    print(format_rows(rows))
+    python -m evalai.reasoning "9.11 和 9.9 哪个大？" -m gpt --efforts minimal low medium high -n 3
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from statistics import median
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+from evalai.estimate import price_for
+from evalai.fanout import FanOutEngine, ModelResult
+from evalai.providers import ProviderSpec, get_provider
+from evalai.requestlog import RequestLogWriter
+from evalai.transport import registry
+
+EFFORTS = ("minimal", "low", "medium", "high")
+
+# 取中位数的 StreamMetrics 指标
+_FIELDS = (
+    "time_to_first_reasoning", "time_to_first_answer", "reasoning_time", "duration",
+    "reasoning_tokens", "answer_tokens", "reasoning_tokens_per_second", "answer_tokens_per_second",
+)
+
+
+@dataclass
+class EffortRow:
+    """
+    单个模型在某一档推理强度下 n 次请求的汇总
+
+    Attributes:
+        provider: 厂商名称
+        model: 模型名称
+        effort: 推理强度
+        n: 请求次数
+        succeeded: 成功次数
+        metrics: 各指标的中位数（秒 / token / token 每秒），没有数据时为 None
+        thinking_cost: 平均每次请求的推理费用（元），模型不在价格表中时为 None
+        samples: 各次请求的 ModelResult
+    """
+    provider: str
+    model: str
+    effort: str
+    n: int
+    succeeded: int
+    metrics: Dict[str, Optional[float]] = field(default_factory=dict)
+    thinking_cost: Optional[float] = None
+    samples: List[ModelResult] = field(default_factory=list, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "effort": self.effort,
+            "n": self.n,
+            "succeeded": self.succeeded,
+            **self.metrics,
+            "thinking_cost": self.thinking_cost,
+        }
+
+
+def effort_params(spec: ProviderSpec, effort: str, summary: bool = False) -> Dict[str, Any]:
+    """
+    按接口风格生成推理强度参数
+
+    Args:
+        spec: 厂商配置
+        effort: 推理强度
+        summary: Responses API 是否请求推理摘要
+
+    Returns:
+        额外请求参数，会覆盖厂商默认参数中的同名项
+    """
+    if spec.api == "responses":
+        reasoning = {"effort": effort}
+        if summary:
+            reasoning["summary"] = "auto"
+        return {"reasoning": reasoning}
+    return {"reasoning_effort": effort}
+
+
+def summarize(spec: ProviderSpec, effort: str, samples: Sequence[ModelResult]) -> EffortRow:
+    """
+    汇总同一档推理强度下的多次请求
+
+    Args:
+        spec: 厂商配置
+        effort: 推理强度
+        samples: 各次请求的结果
+
+    Returns:
+        EffortRow
+    """
+    ok = [r for r in samples if r.ok]
+    metrics = {}
+    for name in _FIELDS:
+        values = [v for v in (getattr(r.metrics, name) for r in ok) if v is not None]
+        metrics[name] = median(values) if values else None
+    thinking_cost = None
+    price = price_for(spec.model)
+    if price is not None and ok:
+        thinking_cost = sum(price.cost(0, (r.usage or {}).get("reasoning_tokens", 0))[1] for r in ok) / len(ok)
+    return EffortRow(spec.name, spec.model, effort, len(samples), len(ok), metrics, thinking_cost, list(samples))
+
+
+async def asweep(
+    engine: FanOutEngine,
+    prompt: str,
+    efforts: Sequence[str],
+    n: int = 3,
+    system: Optional[str] = None,
+    summary: bool = False,
+    **extra,
+) -> List[EffortRow]:
+    """
+    用已有的引擎对比各推理强度
+
+    所有请求一起受 engine.concurrency 限制；要排除并发对时延的干扰可以把 concurrency 设为 1。
+
+    Args:
+        engine: 并发引擎，其 specs 为参与对比的模型
+        prompt: 用户提示词
+        efforts: 推理强度列表
+        n: 每个模型每档推理强度的请求次数
+        system: 系统消息
+        summary: Responses API 是否请求推理摘要
+        **extra: 额外请求参数
+
+    Returns:
+        按模型、推理强度排列的 EffortRow 列表
+    """
+    if engine.cache is not None:
+        raise ValueError("推理强度对比不能使用回答缓存")
+    semaphore = asyncio.Semaphore(engine.concurrency)
+
+    async def one(spec: ProviderSpec, effort: str) -> ModelResult:
+        async with semaphore:
+            return await engine.run_one(spec, prompt, system, **{**extra, **effort_params(spec, effort, summary)})
+
+    plan = [(spec, effort) for spec in engine.specs for effort in efforts]
+    results = await asyncio.gather(*(one(spec, effort) for spec, effort in plan for _ in range(n)))
+    return [summarize(spec, effort, results[i * n:(i + 1) * n]) for i, (spec, effort) in enumerate(plan)]
+
+
+def run_effort_sweep(
+    prompt: str,
+    providers: Iterable[Union[str, ProviderSpec]],
+    efforts: Sequence[str] = EFFORTS,
+    n: int = 3,
+    concurrency: int = 4,
+    timeout: Optional[float] = None,
+    system: Optional[str] = None,
+    summary: bool = False,
+    request_log: Optional[RequestLogWriter] = None,
+    **extra,
+) -> List[EffortRow]:
+    """
+    同步入口：对比各推理强度的时延和推理成本
+
+    Args:
+        prompt: 用户提示词
+        providers: 厂商名称或 ProviderSpec 列表
+        efforts: 推理强度列表
+        n: 每个模型每档推理强度的请求次数
+        concurrency: 同时进行的请求数上限
+        timeout: 单次请求的超时时间（秒）
+        system: 系统消息
+        summary: Responses API 是否请求推理摘要
+        request_log: api_requests 日志器
+        **extra: 额外请求参数
+
+    Returns:
+        EffortRow 列表
+    """
+    async def _main():
+        try:
+            async with FanOutEngine(
+                providers, concurrency=concurrency, timeout=timeout, request_log=request_log,
+            ) as engine:
+                return await asweep(engine, prompt, efforts, n, system, summary, **extra)
+        finally:
+            await registry.aclose()
+
+    return asyncio.run(_main())
+
+
+def format_rows(rows: Sequence[EffortRow]) -> str:
+    """以表格形式输出各推理强度的中位数指标"""
+    def num(value, fmt="{:.2f}"):
+        return "-" if value is None else fmt.format(value)
+
+    header = ["厂商", "推理强度", "成功/n", "首推理token", "首回答token", "推理耗时", "完成",
+              "推理tokens", "回答tokens", "推理tok/s", "回答tok/s", "推理费用(元)"]
+    lines = ["\t".join(header)]
+    for r in rows:
+        m = r.metrics
+        lines.append("\t".join([
+            r.provider,
+            r.effort,
+            f"{r.succeeded}/{r.n}",
+            num(m.get("time_to_first_reasoning"), "{:.2f}s"),
+            num(m.get("time_to_first_answer"), "{:.2f}s"),
+            num(m.get("reasoning_time"), "{:.2f}s"),
+            num(m.get("duration"), "{:.2f}s"),
+            num(m.get("reasoning_tokens"), "{:.0f}"),
+            num(m.get("answer_tokens"), "{:.0f}"),
+            num(m.get("reasoning_tokens_per_second"), "{:.1f}"),
+            num(m.get("answer_tokens_per_second"), "{:.1f}"),
+            num(r.thinking_cost, "{:.5f}"),
+        ]))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比不同推理强度（reasoning_effort）的时延和推理成本")
+    parser.add_argument("prompt", help="提示词")
+    parser.add_argument("-m", "--models", nargs="+", required=True, help="参与对比的推理模型，可写成 厂商:模型")
+    parser.add_argument("--efforts", nargs="+", default=list(EFFORTS), help="推理强度")
+    parser.add_argument("-n", type=int, default=3, help="每档推理强度的请求次数")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时进行的请求数上限（所有模型合计）")
+    parser.add_argument("--timeout", type=float, default=None, help="单次请求的超时时间（秒）")
+    parser.add_argument("--system", default=None, help="系统消息")
+    parser.add_argument("--summary", action="store_true", help="Responses API 请求推理摘要，以测得首个推理 token 时间")
+    parser.add_argument("--log-db", metavar="PATH", default=None, help="把每个请求写入该 SQLite 库的 api_requests 表")
+    args = parser.parse_args()
+
+    request_log = RequestLogWriter(args.log_db).start() if args.log_db else None
+    try:
+        rows = run_effort_sweep(
+            args.prompt, [get_provider(model) for model in args.models], efforts=args.efforts, n=args.n,
+            concurrency=args.concurrency, timeout=args.timeout, system=args.system, summary=args.summary,
+            request_log=request_log,
+        )
+    finally:
+        if request_log is not None:
+            request_log.close()
+    print(format_rows(rows))
+    for row in rows:
+        for error in {sample.error for sample in row.samples if not sample.ok}:
+            print(f"{row.provider}（{row.effort}）失败: {error}")
+
+
+if __name__ == "__main__":
+    main()
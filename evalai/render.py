@@ -0,0 +1,277 @@
+"""
+多模型并排显示（系统设计.md 中的「并排显示」）
+
+各模型的流式输出先进入内存缓冲，由后台线程按固定帧率整屏重绘：每帧只做一次 write + flush，
+终端写入次数只取决于帧率，与模型数量和 token 速度无关，多个流的输出也不会互相穿插。
+每一栏顶部实时显示首 token 时间和输出速度，推理过程（REASONING）以暗色显示。
+
+feed() 只是一次加锁的列表追加，可以直接在事件循环或各个流的线程中调用；
+文本折行在绘制时按新增部分增量计算，中日韩字符按 2 列宽度处理。
+
+用法：
+    with SideBySideRenderer(["qwen", "kimi"]) as renderer:
+        ...
+        renderer.feed("qwen", event)
+"""
+import shutil
+import sys
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, TextIO, Tuple
+
+from evalai.events import ERROR, REASONING, TEXT, USAGE, StreamEvent
+
+SEPARATOR = " │ "
+DIM = "\x1b[2m"
+RESET = "\x1b[0m"
+MAX_LINES = 500  # 每栏保留的已折行行数
+
+
+def char_width(ch: str) -> int:
+    """字符在终端中占用的列数"""
+    if ch < "\u1100":
+        return 1
+    return 2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1
+
+
+def fit(text: str, width: int) -> str:
+    """按显示宽度截断并用空格补齐到 width 列"""
+    used = 0
+    out = []
+    for ch in text:
+        w = char_width(ch)
+        if used + w > width:
+            break
+        out.append(ch)
+        used += w
+    out.append(" " * (width - used))
+    return "".join(out)
+
+
+class Column:
+    """
+    单个模型的一栏：原始片段、增量折行结果和实时指标
+    """
+
+    __slots__ = (
+        "title", "pending", "segments", "lines", "line", "line_width", "line_dim", "width",
+        "started", "first_at", "last_at", "chunks", "status", "ttft", "speed",
+    )
+
+    def __init__(self, title: str):
+        self.title = title
+        self.pending: List[Tuple[bool, str]] = []
+        self.segments: List[Tuple[bool, str]] = []  # 全部原始片段，终端宽度变化时重新折行
+        self.lines: Deque[Tuple[bool, str]] = deque(maxlen=MAX_LINES)
+        self.line: List[str] = []
+        self.line_width = 0
+        self.line_dim = False
+        self.width = 0
+        self.started = time.perf_counter()
+        self.first_at: Optional[float] = None
+        self.last_at: Optional[float] = None
+        self.chunks = 0
+        self.status = ""
+        self.ttft: Optional[float] = None
+        self.speed: Optional[float] = None
+
+    def _push(self):
+        self.lines.append((self.line_dim, "".join(self.line)))
+        self.line = []
+        self.line_width = 0
+
+    def _wrap(self, dim: bool, text: str):
+        if dim != self.line_dim:
+            if self.line:
+                self._push()
+            self.line_dim = dim
+        width = self.width
+        for ch in text:
+            if ch == "\n":
+                self._push()
+                continue
+            if ch < " ":
+                ch = " "
+            w = char_width(ch)
+            if self.line_width + w > width:
+                self._push()
+            self.line.append(ch)
+            self.line_width += w
+
+    def layout(self, width: int, pending: List[Tuple[bool, str]]):
+        """把新增片段折行；宽度变化时从头重新折行"""
+        if width != self.width:
+            self.width = width
+            self.lines.clear()
+            self.line, self.line_width, self.line_dim = [], 0, False
+            for dim, text in self.segments:
+                self._wrap(dim, text)
+        for dim, text in pending:
+            self.segments.append((dim, text))
+            self._wrap(dim, text)
+
+    def tail(self, height: int) -> List[Tuple[bool, str]]:
+        """最后 height 行（含当前未满的一行）"""
+        rows = list(self.lines)
+        if self.line:
+            rows.append((self.line_dim, "".join(self.line)))
+        return rows[-height:]
+
+    def stats_line(self) -> str:
+        ttft = self.ttft
+        if ttft is None and self.first_at is not None:
+            ttft = self.first_at - self.started
+        speed = self.speed
+        if speed is None and self.first_at is not None and self.last_at is not None and self.last_at > self.first_at:
+            speed = (self.chunks - 1) / (self.last_at - self.first_at)
+        parts = [f"首token {ttft:.2f}s" if ttft is not None else "首token -"]
+        if speed is not None:
+            parts.append(f"{speed:.1f} tok/s")
+        if self.status:
+            parts.append(self.status)
+        return "  ".join(parts)
+
+
+class SideBySideRenderer:
+    """
+    按固定帧率重绘的多栏终端渲染器
+    """
+
+    def __init__(
+        self,
+        titles: Iterable[str],
+        fps: float = 15.0,
+        out: Optional[TextIO] = None,
+        size: Optional[Tuple[int, int]] = None,
+    ):
+        """
+        初始化渲染器
+
+        Args:
+            titles: 各栏标题，同时作为 feed() 的键
+            fps: 每秒最多重绘次数
+            out: 输出流，默认 sys.stdout
+            size: 固定的 (列数, 行数)，None 时跟随终端大小
+        """
+        if fps <= 0:
+            raise ValueError("fps 必须大于 0")
+        self.columns: Dict[str, Column] = {title: Column(title) for title in titles}
+        if not self.columns:
+            raise ValueError("至少需要一栏")
+        self.interval = 1.0 / fps
+        self.out = out or sys.stdout
+        self.size = size
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._height = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self) -> "SideBySideRenderer":
+        """启动后台重绘线程"""
+        if self._thread is None:
+            now = time.perf_counter()
+            for column in self.columns.values():
+                column.started = now
+            self.out.write("\x1b[?25l")  # 隐藏光标
+            self._thread = threading.Thread(target=self._loop, name="evalai-render", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """停止重绘，绘制最后一帧并恢复光标"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._draw()
+            self.out.write("\x1b[?25h")
+            self.out.flush()
+
+    def feed(self, title: str, event: StreamEvent):
+        """
+        接收一个流式事件
+
+        Args:
+            title: 栏标题
+            event: StreamEvent
+        """
+        column = self.columns[title]
+        kind = event.kind
+        if kind == TEXT or kind == REASONING:
+            now = event.ts or time.perf_counter()
+            if column.first_at is None:
+                column.first_at = now
+            column.last_at = now
+            column.chunks += 1
+            with self._lock:
+                column.pending.append((kind == REASONING, event.text))
+                self._dirty = True
+            return
+        if kind == USAGE:
+            metrics = event.metrics
+            if metrics is not None:
+                column.ttft = metrics.ttft
+                column.speed = metrics.tokens_per_second
+            column.status = "✓"
+        elif kind == ERROR:
+            column.status = f"✗ {event.text}"
+        with self._lock:
+            self._dirty = True
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            if self._dirty:
+                self._draw()
+
+    def _frame(self) -> str:
+        cols, rows = self.size or shutil.get_terminal_size((120, 30))
+        columns = list(self.columns.values())
+        n = len(columns)
+        width = max((cols - len(SEPARATOR) * (n - 1)) // n, 8)
+        body = max(rows - 4, 3)
+        with self._lock:
+            self._dirty = False
+            batches = [column.pending for column in columns]
+            for column in columns:
+                column.pending = []
+        # 折行在锁外进行，不阻塞 feed()
+        for column, pending in zip(columns, batches):
+            column.layout(width, pending)
+        tails = [column.tail(body) for column in columns]
+
+        lines = [
+            SEPARATOR.join(fit(column.title, width) for column in columns),
+            SEPARATOR.join(fit(column.stats_line(), width) for column in columns),
+            SEPARATOR.join("─" * width for _ in columns),
+        ]
+        blank = " " * width
+        for i in range(body):
+            cells = []
+            for tail in tails:
+                if i < len(tail):
+                    dim, text = tail[i]
+                    cell = fit(text, width)
+                    cells.append(f"{DIM}{cell}{RESET}" if dim else cell)
+                else:
+                    cells.append(blank)
+            lines.append(SEPARATOR.join(cells))
+        return "\x1b[K\n".join(lines) + "\x1b[K\n\x1b[J"
+
+    def _draw(self):
+        frame = self._frame()
+        # 回到上一帧的起始行整屏覆盖，整帧只写一次
+        prefix = f"\x1b[{self._height}F" if self._height else ""
+        self._height = frame.count("\n")
+        self.out.write(prefix + frame)
+        self.out.flush()
+        self.frames += 1
@@ -0,0 +1,390 @@
+"""
+API 请求日志（系统设计.md 中的 api_requests 表）
+
+请求完成后只把 RequestRecord 放进有界队列，由后台线程按批次写入 SQLite（WAL 模式），
+一个批次只提交一次事务。写日志不占用请求路径上的时间：队列满时按 block_timeout 等待或丢弃并计数，
+关闭时把队列中剩余的记录全部写完。在事件循环中用 alog()，需要等待时放到线程里等，不阻塞事件循环。
+
+本地库没有 users / models 表，model_id 用模型名称 model 代替，费用按 evalai.estimate.PRICES 中的单价计算；
+api_key 只保存脱敏后的形式。厂商返回推理 token 数时，推理部分记入 thinking_tokens / thinking_cost（按输出单价），
+output_tokens / output_cost 只包含回答部分，三项相加等于总量。
+
+用法：
+    with RequestLogWriter("requests.sqlite3") as log:
+        log.log(RequestRecord.from_result(result, prompt))
+        await log.alog(RequestRecord.from_result(result, prompt))  # 协程中
+"""
+import asyncio
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+import warnings
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Union
+
+from evalai.estimate import price_for
+
+if TYPE_CHECKING:
+    from evalai.fanout import ModelResult
+
+# api_requests.rating_score 的满分（系统设计.md：评分 1-5 分）；RankingEngine 读取时换算到自己的评分尺度
+RATING_SCALE = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    model TEXT NOT NULL,
+    api_key TEXT NOT NULL DEFAULT '',
+    api_name TEXT NOT NULL,
+    is_platform INTEGER NOT NULL DEFAULT 0,
+    prompt TEXT NOT NULL,
+    prompt_category TEXT,
+    response TEXT NOT NULL DEFAULT '',
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    thinking_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    input_cost REAL NOT NULL DEFAULT 0,
+    thinking_cost REAL NOT NULL DEFAULT 0,
+    output_cost REAL NOT NULL DEFAULT 0,
+    total_cost REAL NOT NULL DEFAULT 0,
+    response_time INTEGER NOT NULL DEFAULT 0,
+    rating_score REAL,  -- 1-5 分，见 RATING_SCALE
+    rating_comment TEXT,
+    status TEXT NOT NULL DEFAULT 'success' CHECK (status IN ('success', 'failed', 'timeout')),
+    error_message TEXT,
+    balance_before REAL,
+    balance_after REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_api_requests_created_at ON api_requests (created_at);
+"""
+
+
+def mask_key(api_key: Optional[str]) -> str:
+    """API 密钥脱敏：只保留前 3 位和后 4 位"""
+    if not api_key:
+        return ""
+    if len(api_key) <= 8:
+        return "*" * len(api_key)
+    return f"{api_key[:3]}...{api_key[-4:]}"
+
+
+@dataclass
+class RequestRecord:
+    """
+    api_requests 表中的一行（评分字段由用户事后补充，不在这里）
+    """
+    api_name: str
+    model: str
+    prompt: str
+    response: str = ""
+    prompt_category: Optional[str] = None
+    user_id: Optional[int] = None
+    api_key: str = ""
+    is_platform: bool = False
+    input_tokens: int = 0
+    thinking_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+    input_cost: float = 0.0
+    thinking_cost: float = 0.0
+    output_cost: float = 0.0
+    total_cost: float = 0.0
+    response_time: int = 0  # 毫秒
+    status: str = "success"
+    error_message: Optional[str] = None
+    balance_before: Optional[float] = None
+    balance_after: Optional[float] = None
+    created_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_result(
+        cls,
+        result: "ModelResult",
+        prompt: str,
+        category: Optional[str] = None,
+        api_key: Optional[str] = None,
+        user_id: Optional[int] = None,
+    ) -> "RequestRecord":
+        """
+        由 ModelResult 生成日志记录
+
+        Args:
+            result: 并发引擎返回的单个模型结果
+            prompt: 用户提示词
+            category: 提示词分类
+            api_key: 本次使用的 API 密钥（写入前脱敏）
+            user_id: 用户 ID
+
+        Returns:
+            RequestRecord
+        """
+        usage = result.usage or {}
+        if result.ok:
+            status = "success"
+        else:
+            status = "timeout" if result.timed_out else "failed"
+        input_tokens = usage.get("prompt_tokens", 0)
+        # completion_tokens 含推理部分，拆开后分别落到 thinking_* 和 output_* 列
+        thinking_tokens = usage.get("reasoning_tokens", 0)
+        output_tokens = usage.get("completion_tokens", 0) - thinking_tokens
+        input_cost = thinking_cost = output_cost = 0.0
+        price = price_for(result.model)
+        if price is not None:
+            input_cost, output_cost = price.cost(input_tokens, output_tokens)
+            thinking_cost = price.cost(0, thinking_tokens)[1]
+        return cls(
+            api_name=result.provider,
+            model=result.model,
+            prompt=prompt,
+            response=result.text,
+            prompt_category=category,
+            user_id=user_id,
+            api_key=mask_key(api_key),
+            input_tokens=input_tokens,
+            thinking_tokens=thinking_tokens,
+            output_tokens=output_tokens,
+            total_tokens=usage.get("total_tokens", 0),
+            input_cost=input_cost,
+            thinking_cost=thinking_cost,
+            output_cost=output_cost,
+            total_cost=input_cost + thinking_cost + output_cost,
+            response_time=int(result.duration * 1000),
+            status=status,
+            error_message=result.error,
+        )
+
+
+COLUMNS = tuple(f.name for f in fields(RequestRecord))
+_INSERT = f"INSERT INTO api_requests ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+_STOP = object()
+
+
+class RequestLogWriter:
+    """
+    后台批量写入 api_requests 的日志器
+
+    log() / alog() 先尝试一次非阻塞入队；后台线程攒够 batch_size 条或距本批第一条超过 flush_interval 秒时提交一次事务。
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        block_timeout: Optional[float] = 0.0,
+        listeners: Iterable[Callable[[List[RequestRecord]], None]] = (),
+    ):
+        """
+        初始化日志器（不会立即启动后台线程，见 start()）
+
+        Args:
+            path: SQLite 数据库路径
+            batch_size: 单个事务最多写入的记录数
+            flush_interval: 一条记录最多在内存中停留的时间（秒）
+            max_queue: 队列容量，超过后触发背压
+            block_timeout: 队列满时 log() / alog() 最多等待的秒数；0 表示立即丢弃，None 表示一直等待
+            listeners: 每批记录提交后在后台线程中调用的回调（例如 RankingEngine.observe_batch），
+                不占用请求路径上的时间
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size 必须大于 0")
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.listeners = list(listeners)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self) -> "RequestLogWriter":
+        """启动后台写入线程；进程退出时会自动 close()"""
+        if self._thread is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = self._connect()  # 在调用方线程里建表，路径或权限错误立即抛出
+            conn.close()
+            self._thread = threading.Thread(target=self._run, name="evalai-requestlog", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL 下 NORMAL 不会损坏数据库，只可能丢失最后一批
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def log(self, record: RequestRecord) -> bool:
+        """
+        提交一条记录
+
+        Args:
+            record: 日志记录
+
+        Returns:
+            是否入队成功；队列满且等待超时时返回 False 并计入 dropped
+        """
+        self._ensure_started()
+        return self._put_nowait(record) or self._put_wait(record)
+
+    async def alog(self, record: RequestRecord) -> bool:
+        """
+        在事件循环中提交一条记录
+
+        队列未满时与 log() 相同；队列满且 block_timeout 不为 0 时在线程中等待，不阻塞事件循环。
+
+        Args:
+            record: 日志记录
+
+        Returns:
+            是否入队成功；队列满且等待超时时返回 False 并计入 dropped
+        """
+        self._ensure_started()
+        if self._put_nowait(record):
+            return True
+        if self.block_timeout == 0:
+            return self._put_wait(record)
+        return await asyncio.to_thread(self._put_wait, record)
+
+    def _ensure_started(self):
+        if self._closed:
+            raise RuntimeError("RequestLogWriter 已关闭")
+        if self._thread is None:
+            self.start()
+
+    def _put_nowait(self, record: RequestRecord) -> bool:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            return False
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def _put_wait(self, record: RequestRecord) -> bool:
+        # 非阻塞入队失败后调用：按 block_timeout 等待，仍然满就丢弃并计数
+        if self.block_timeout != 0:
+            try:
+                self._queue.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                pass
+            else:
+                self.max_depth = self._queue.maxsize
+                return True
+        if not self.dropped:
+            warnings.warn(f"请求日志队列已满（{self._queue.maxsize}），开始丢弃记录")
+        self.dropped += 1
+        return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待此前提交的记录全部写入磁盘
+
+        Args:
+            timeout: 最长等待时间（秒），None 表示一直等待
+
+        Returns:
+            是否在超时前完成
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """写完队列中剩余的记录并停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """写入统计"""
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "pending": self._queue.qsize(),
+            "max_depth": self.max_depth,
+        }
+
+    def _run(self):
+        conn = self._connect()
+        get = self._queue.get
+        batch: List[RequestRecord] = []
+        waiters: List[threading.Event] = []
+        deadline = 0.0
+        stopping = False
+        try:
+            while not stopping:
+                try:
+                    item = get(timeout=max(deadline - time.monotonic(), 0.0) if batch else None)
+                except queue.Empty:
+                    item = None
+                # 把已经排队的记录一次取完，减少线程唤醒次数
+                while item is not None:
+                    if item is _STOP:
+                        stopping = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        if not batch:
+                            deadline = time.monotonic() + self.flush_interval
+                        batch.append(item)
+                        if len(batch) >= self.batch_size:
+                            self._commit(conn, batch)
+                            batch = []
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        item = None
+                if batch and (stopping or waiters or time.monotonic() >= deadline):
+                    self._commit(conn, batch)
+                    batch = []
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[RequestRecord]):
+        rows = [tuple(getattr(record, name) for name in COLUMNS) for record in batch]
+        try:
+            with conn:
+                conn.executemany(_INSERT, rows)
+        except sqlite3.Error as e:
+            self.errors += 1
+            warnings.warn(f"写入 api_requests 失败，丢弃 {len(rows)} 条记录: {e}")
+            return
+        self.written += len(rows)
+        self.batches += 1
+        for listener in self.listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                warnings.warn(f"请求日志回调 {listener!r} 出错: {e}")
@@ -0,0 +1,418 @@
+"""
+智能路由（系统设计.md 中的「智能路由：根据任务类型自动选择性价比最高的模型」）
+
+给定 prompt、分类和约束（单次费用上限、首 token 时间上限、最低评分），从候选厂商中选出最合适的一个；
+首选失败或在首 token 之前卡住时，在同一次调用里自动切换到下一个候选。
+
+路由时不查询历史记录，只读预先维护好的统计：
+    首 token 时间、成功率、输出长度   每个 (厂商/模型, 分类) 一个指数滑动平均，每个请求结束时 O(1) 更新
+    评分                              RankingEngine.stats()，一次字典查询
+    熔断状态                          HealthMonitor 的熔断器，熔断中的厂商不参与路由
+    费用                              estimate.PRICES 单价 × 预估的输入 token 数和平均输出 token 数
+决策耗时只和候选数量有关。某个分类还没有数据时退回到该厂商不分类的统计。
+
+排序方式（prefer）：
+    balanced  评分、首 token 时间、费用、成功率在候选之间归一化后加权（BALANCED_WEIGHTS）
+    latency   首 token 时间最短优先
+    cost      预估费用最低优先
+    rating    评分最高优先
+
+用法：
+    async with Router(["qwen", "kimi", "deepseek-chat"], ranking=ranking, health=health) as router:
+        routed = await router.run(prompt, category="编程", constraints=RouteConstraints(max_cost=0.01, max_ttft=3))
+        print(routed.result.provider, routed.result.text)
+    python -m evalai.router "讲一下什么是Spring Boot" -m qwen kimi deepseek-chat --category 编程 --max-ttft 3
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Union
+
+from evalai.estimate import DEFAULT_OUTPUT_TOKENS, estimate_prompt_tokens, price_for
+from evalai.fanout import FanOutEngine, ModelResult
+from evalai.health import OPEN, HealthMonitor
+from evalai.providers import ProviderSpec, get_provider
+from evalai.ranking import ALL, RankingEngine
+from evalai.ratelimit import RateLimiter
+from evalai.requestlog import RequestLogWriter
+from evalai.transport import registry
+
+PREFERENCES = ("balanced", "latency", "cost", "rating")
+BALANCED_WEIGHTS: Dict[str, float] = {"rating": 0.4, "ttft": 0.3, "cost": 0.2, "reliability": 0.1}
+_LOWER_IS_BETTER = {"ttft", "cost"}
+
+
+class RouterError(Exception):
+    """路由相关异常"""
+    pass
+
+
+@dataclass
+class RouteConstraints:
+    """
+    路由约束，None 表示不限制
+
+    Attributes:
+        max_cost: 单次请求的预估费用上限（元）；单价未知的模型不满足该约束
+        max_ttft: 首 token 时间上限（秒）；同时作为实际请求的首 token 等待上限，超过即切换下一个候选
+        min_rating: 最低评分（0 到 RankingEngine.rating_scale）；没有评分的模型不满足该约束
+        max_output: 预估费用时输出 token 数的上限
+        prefer: 候选排序方式，见 PREFERENCES
+    """
+    max_cost: Optional[float] = None
+    max_ttft: Optional[float] = None
+    min_rating: Optional[float] = None
+    max_output: Optional[int] = None
+    prefer: str = "balanced"
+
+
+@dataclass
+class Candidate:
+    """
+    一个候选厂商及路由时使用的指标
+
+    Attributes:
+        spec: 厂商配置
+        ttft: 首 token 时间滑动平均（秒），没有数据时为 None
+        cost: 本次请求的预估费用（元），单价未知时为 None
+        rating: 评分均值（0 到 rating_scale）
+        reliability: 成功率滑动平均
+        score: 排序得分（balanced 方式下的加权得分，0-1）
+    """
+    spec: ProviderSpec
+    ttft: Optional[float] = None
+    cost: Optional[float] = None
+    rating: Optional[float] = None
+    reliability: Optional[float] = None
+    score: float = 0.0
+
+
+@dataclass
+class RouteResult:
+    """
+    一次路由调用的结果
+
+    Attributes:
+        result: 最终采用的结果（全部候选都失败时为最后一次尝试）
+        attempts: 依次尝试的全部结果
+        candidates: 路由时的候选顺序
+    """
+    result: ModelResult
+    attempts: List[ModelResult] = field(default_factory=list)
+    candidates: List[Candidate] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.result.ok
+
+    @property
+    def fallbacks(self) -> int:
+        return len(self.attempts) - 1
+
+
+class _Cell:
+    """单个 (厂商/模型, 分类) 的滑动统计"""
+
+    __slots__ = ("requests", "ttft", "success", "output_tokens")
+
+    def __init__(self):
+        self.requests = 0
+        self.ttft: Optional[float] = None
+        self.success: Optional[float] = None
+        self.output_tokens: Optional[float] = None
+
+    def update(self, alpha: float, ok: bool, ttft: Optional[float], output_tokens: Optional[int]):
+        self.requests += 1
+        self.success = float(ok) if self.success is None else self.success + alpha * (ok - self.success)
+        if ttft is not None:
+            self.ttft = ttft if self.ttft is None else self.ttft + alpha * (ttft - self.ttft)
+        if output_tokens:
+            if self.output_tokens is None:
+                self.output_tokens = float(output_tokens)
+            else:
+                self.output_tokens += alpha * (output_tokens - self.output_tokens)
+
+
+class Router:
+    """
+    按约束和实时统计选择厂商，失败或首 token 超时时自动切换
+    """
+
+    def __init__(
+        self,
+        providers: Iterable[Union[str, ProviderSpec]],
+        ranking: Optional[RankingEngine] = None,
+        health: Optional[HealthMonitor] = None,
+        alpha: float = 0.2,
+        max_attempts: int = 3,
+        timeout: Optional[float] = None,
+        request_log: Optional[RequestLogWriter] = None,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        """
+        Args:
+            providers: 候选厂商名称（支持 "厂商:模型"）或 ProviderSpec 列表
+            ranking: 提供评分的排名引擎，None 时不使用评分
+            health: 健康监控，熔断中的厂商不参与路由
+            alpha: 滑动平均的权重，越大越偏向最近的请求
+            max_attempts: 一次调用最多尝试的候选数
+            timeout: 单次尝试的总超时时间（秒）
+            request_log: api_requests 日志器
+            limiter: 速率限制器
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha 必须在 (0, 1] 之间")
+        if max_attempts < 1:
+            raise ValueError("max_attempts 必须大于 0")
+        self.specs = [p if isinstance(p, ProviderSpec) else get_provider(p) for p in providers]
+        if not self.specs:
+            raise RouterError("至少需要一个候选厂商")
+        self.ranking = ranking
+        self.health = health
+        self.alpha = alpha
+        self.max_attempts = max_attempts
+        self.engine = FanOutEngine(
+            self.specs, concurrency=1, timeout=timeout, request_log=request_log, limiter=limiter, health=health,
+        )
+        self._cells: Dict[tuple, _Cell] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.engine.aclose()
+
+    # ------------- 统计 -------------
+    def observe(self, result: ModelResult, category: Optional[str] = None):
+        """
+        计入一次请求结果（Router.run 会自动调用；fan_out 等其它入口的结果也可以传进来）
+
+        Args:
+            result: ModelResult
+            category: 提示词分类
+        """
+        if result.cached:
+            return
+        output = result.usage["completion_tokens"] if result.usage else None
+        ttft = result.ttft
+        if ttft is None and result.timed_out:
+            ttft = result.duration  # 首 token 没有到达：至少等了这么久
+        for key in {(result.provider, result.model, category), (result.provider, result.model, ALL)}:
+            cell = self._cells.get(key)
+            if cell is None:
+                cell = self._cells[key] = _Cell()
+            cell.update(self.alpha, result.ok, ttft, output)
+
+    def _cell(self, spec: ProviderSpec, category: Optional[str]) -> Optional[_Cell]:
+        cell = self._cells.get((spec.name, spec.model, category))
+        if cell is None and category is not ALL:
+            cell = self._cells.get((spec.name, spec.model, ALL))
+        return cell
+
+    def _rating(self, spec: ProviderSpec, category: Optional[str]) -> Optional[float]:
+        if self.ranking is None:
+            return None
+        stats = self.ranking.stats(spec.model, category)
+        if (stats is None or stats["rating"] is None) and category is not ALL:
+            stats = self.ranking.stats(spec.model, ALL)
+        if stats is None or stats["rating"] is None:
+            return None
+        return stats["rating"] * self.ranking.rating_scale
+
+    # ------------- 路由 -------------
+    def candidates(
+        self,
+        prompt: str,
+        category: Optional[str] = None,
+        constraints: Optional[RouteConstraints] = None,
+        system: Optional[str] = None,
+    ) -> List[Candidate]:
+        """
+        满足约束的候选，按 constraints.prefer 排好序
+
+        Args:
+            prompt: 用户提示词（用于预估输入 token 数）
+            category: 提示词分类
+            constraints: 路由约束
+            system: 系统消息
+
+        Returns:
+            Candidate 列表，第一个为首选；没有满足约束的候选时为空列表
+        """
+        constraints = constraints or RouteConstraints()
+        if constraints.prefer not in PREFERENCES:
+            raise RouterError(f"未知的排序方式 {constraints.prefer}，可选: {', '.join(PREFERENCES)}")
+        result = []
+        for spec in self.specs:
+            breaker = self.health.breaker(spec) if self.health is not None else None
+            if breaker is not None and breaker.state == OPEN and breaker.retry_after() > 0:
+                continue
+            cell = self._cell(spec, category)
+            candidate = Candidate(
+                spec,
+                ttft=cell.ttft if cell else None,
+                reliability=cell.success if cell else None,
+                rating=self._rating(spec, category),
+            )
+            price = price_for(spec.model)
+            if price is not None:
+                output = cell.output_tokens if cell and cell.output_tokens else DEFAULT_OUTPUT_TOKENS
+                if constraints.max_output is not None:
+                    output = min(output, constraints.max_output)
+                messages = [{"role": "system", "content": system or spec.system}, {"role": "user", "content": prompt}]
+                prompt_tokens = estimate_prompt_tokens(messages, spec.name)
+                candidate.cost = sum(price.cost(prompt_tokens, output))
+            if constraints.max_cost is not None and (candidate.cost is None or candidate.cost > constraints.max_cost):
+                continue
+            # 没有首 token 数据的候选先放行，实际请求时由 max_ttft 兜底
+            if constraints.max_ttft is not None and candidate.ttft is not None and candidate.ttft > constraints.max_ttft:
+                continue
+            if constraints.min_rating is not None and (candidate.rating is None or candidate.rating < constraints.min_rating):
+                continue
+            result.append(candidate)
+
+        self._score(result)
+        prefer = constraints.prefer
+        if prefer == "latency":
+            result.sort(key=lambda c: (c.ttft is None, c.ttft or 0.0, -c.score))
+        elif prefer == "cost":
+            result.sort(key=lambda c: (c.cost is None, c.cost or 0.0, -c.score))
+        elif prefer == "rating":
+            result.sort(key=lambda c: (c.rating is None, -(c.rating or 0.0), -c.score))
+        else:
+            result.sort(key=lambda c: -c.score)
+        return result
+
+    def _score(self, candidates: List[Candidate]):
+        scale = self.ranking.rating_scale if self.ranking is not None else 1.0
+        values = [
+            {
+                "rating": c.rating / scale if c.rating is not None else None,
+                "ttft": c.ttft,
+                "cost": c.cost,
+                "reliability": c.reliability,
+            }
+            for c in candidates
+        ]
+        bounds = {}
+        for name in ("ttft", "cost"):
+            present = [v[name] for v in values if v[name] is not None]
+            if present:
+                bounds[name] = (min(present), max(present))
+        for candidate, metrics in zip(candidates, values):
+            total = weight_sum = 0.0
+            for name, weight in BALANCED_WEIGHTS.items():
+                value = metrics[name]
+                if value is None:
+                    continue  # 缺少的维度不参与加权
+                if name in _LOWER_IS_BETTER:
+                    low, high = bounds[name]
+                    value = 1.0 if high == low else (high - value) / (high - low)
+                total += weight * value
+                weight_sum += weight
+            candidate.score = total / weight_sum if weight_sum else 0.0
+
+    async def run(
+        self,
+        prompt: str,
+        category: Optional[str] = None,
+        constraints: Optional[RouteConstraints] = None,
+        system: Optional[str] = None,
+        **extra,
+    ) -> RouteResult:
+        """
+        路由并执行一次请求；首选在输出任何内容之前失败或超过 max_ttft 时依次尝试下一个候选
+
+        Args:
+            prompt: 用户提示词
+            category: 提示词分类
+            constraints: 路由约束
+            system: 系统消息
+            **extra: 额外请求参数
+
+        Returns:
+            RouteResult；已经输出部分内容后失败的请求不会切换（输出不能撤回），直接返回该结果
+        """
+        constraints = constraints or RouteConstraints()
+        candidates = self.candidates(prompt, category, constraints, system)
+        if not candidates:
+            raise RouterError("没有满足约束的候选厂商")
+        attempts = []
+        for candidate in candidates[:self.max_attempts]:
+            result = await self.engine.run_one(
+                candidate.spec, prompt, system, first_token_timeout=constraints.max_ttft, **extra
+            )
+            attempts.append(result)
+            self.observe(result, category)
+            if result.ok or result.text or result.reasoning:
+                break
+        return RouteResult(attempts[-1], attempts, candidates)
+
+
+def route(
+    prompt: str,
+    providers: Iterable[Union[str, ProviderSpec]],
+    category: Optional[str] = None,
+    constraints: Optional[RouteConstraints] = None,
+    ranking: Optional[RankingEngine] = None,
+    health: Optional[HealthMonitor] = None,
+    system: Optional[str] = None,
+    **extra,
+) -> RouteResult:
+    """
+    同步入口：路由并执行一次请求
+
+    Args:
+        prompt: 用户提示词
+        providers: 候选厂商
+        category: 提示词分类
+        constraints: 路由约束
+        ranking: 提供评分的排名引擎
+        health: 健康监控
+        system: 系统消息
+        **extra: 额外请求参数
+
+    Returns:
+        RouteResult
+    """
+    async def _main():
+        try:
+            async with Router(providers, ranking=ranking, health=health) as router:
+                return await router.run(prompt, category, constraints, system, **extra)
+        finally:
+            await registry.aclose()
+
+    return asyncio.run(_main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="智能路由：按约束选择模型，失败或首 token 超时自动切换")
+    parser.add_argument("prompt", help="提示词")
+    parser.add_argument("-m", "--models", nargs="+", required=True, help="候选厂商，可写成 厂商:模型")
+    parser.add_argument("--category", default=None, help="提示词分类")
+    parser.add_argument("--max-cost", type=float, default=None, help="单次预估费用上限（元）")
+    parser.add_argument("--max-ttft", type=float, default=None, help="首 token 时间上限（秒）")
+    parser.add_argument("--min-rating", type=float, default=None, help="最低评分（1-10，日志中 1-5 分的评分已按比例换算）")
+    parser.add_argument("--prefer", choices=PREFERENCES, default="balanced", help="候选排序方式")
+    parser.add_argument("--log-db", metavar="PATH", default=None, help="从该 SQLite 库的 api_requests 表读取评分")
+    args = parser.parse_args()
+
+    ranking = None
+    if args.log_db:
+        ranking = RankingEngine()
+        ranking.replay(args.log_db)
+    constraints = RouteConstraints(
+        max_cost=args.max_cost, max_ttft=args.max_ttft, min_rating=args.min_rating, prefer=args.prefer,
+    )
+    try:
+        routed = route(args.prompt, args.models, args.category, constraints, ranking=ranking)
+    except RouterError as e:
+        parser.error(str(e))
+    for attempt in routed.attempts:
+        status = "✓" if attempt.ok else f"✗ {attempt.error}"
+        print(f"[{attempt.provider} ({attempt.model})] {status}")
+    print(routed.result.text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""
+回答相似度与差异高亮（系统设计.md 中的「语义相似度分析」「差异高亮」）
+
+各模型的流式输出边到达边分词，token 编号和字符位置追加到各自的数组中；
+相似度所需的特征按批增量更新，不会在每个流结束后对全文重新计算 N² 次：
+    MinHash 签名   k-gram shingle 经 num_perm 个哈希函数取最小值，估计 shingle 集合的 Jaccard 相似度
+    n-gram 向量    1-gram 和 2-gram 哈希到固定维度的词频向量，计算余弦相似度
+相似度矩阵只重算有新内容的模型所在的行和列。
+
+差异高亮在所有回答结束后批量计算：全部回答的 k-gram 哈希拼在一起用 numpy 统计出现在几个回答中，
+只出现在一个回答里的 k-gram 覆盖的 token 就是该回答独有的内容；两两对比用 difflib 在 token 编号序列上做。
+
+中日韩文字按单字切分，其它文字按单词切分并转成小写，标点和空白不参与比较。
+
+用法：
+    engine = SimilarityEngine(["qwen", "kimi", "deepseek-chat"])
+    fan_out(prompt, providers, on_event=lambda spec, event: engine.feed_event(spec.name, event))
+    print(engine.format_matrix())
+    for name, spans in engine.highlights().items():
+        print(highlight(engine.text(name), spans))
+"""
+import difflib
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError as e:  # pragma: no cover
+    raise ImportError("相似度分析需要安装 numpy（pip install numpy）") from e
+
+from evalai.events import TEXT, USAGE, StreamEvent
+
+METHODS = ("minhash", "cosine")
+HIGHLIGHT = "\x1b[7m"  # 反色
+RESET = "\x1b[0m"
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN = re.compile(rf"[{_CJK}]|[^\W_{_CJK}]+")
+_CJK_CHAR = re.compile(rf"[{_CJK}]")
+_PRIME = np.uint64((1 << 32) - 5)  # 小于 2^32 的最大素数：a、h 都小于 2^32，a * h 不会溢出 uint64
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_SEED = np.uint64(0x243F6A8885A308D3)  # 初值非零，全 0 编号组成的 shingle 也有正常的哈希
+_FMIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_FMIX2 = np.uint64(0x94D049BB133111EB)
+_FLUSH_TOKENS = 64  # 每积累这么多新 token 才更新一次特征，摊薄 numpy 调用的开销
+
+Span = Tuple[int, int]
+
+
+def tokenize(text: str) -> Iterable["re.Match"]:
+    """切分出参与比较的 token（中日韩单字、其它文字的单词）"""
+    return _TOKEN.finditer(text)
+
+
+def _shingle_hashes(ids: np.ndarray, k: int) -> np.ndarray:
+    """ids 中所有连续 k 个 token 的 32 位哈希"""
+    if len(ids) < k:
+        return np.empty(0, dtype=np.uint64)
+    ids = ids.astype(np.uint64)
+    h = np.full(len(ids) - k + 1, _SEED, dtype=np.uint64)
+    for j in range(k):
+        h = (h + ids[j:len(ids) - k + 1 + j]) * _MIX  # uint64 溢出即取模
+    # splitmix64 的末尾混合，让每一位都依赖全部输入，再取高 32 位
+    h ^= h >> np.uint64(30)
+    h *= _FMIX1
+    h ^= h >> np.uint64(27)
+    h *= _FMIX2
+    h ^= h >> np.uint64(31)
+    return h >> np.uint64(32)
+
+
+class _Stream:
+    """单个模型的增量状态：token 数组和尚未计入特征的位置"""
+
+    __slots__ = ("parts", "pending", "offset", "ids", "starts", "ends", "flushed", "shingles")
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.pending = ""  # 末尾可能被分片截断的单词，等下一个分片再切分
+        self.offset = 0    # pending 在全文中的起始位置
+        self.ids = array("i")
+        self.starts = array("l")
+        self.ends = array("l")
+        self.flushed = 0   # 已计入特征的 token 数
+        self.shingles = 0  # 已计入 MinHash 的 shingle 数
+
+
+class SimilarityEngine:
+    """
+    多个流式回答之间的增量相似度
+    """
+
+    def __init__(
+        self,
+        names: Iterable[str] = (),
+        shingle_size: int = 3,
+        num_perm: int = 128,
+        dim: int = 1 << 14,
+        seed: int = 1,
+    ):
+        """
+        Args:
+            names: 预先登记的模型名称（决定矩阵的行顺序），也可以在 feed 时自动登记
+            shingle_size: MinHash 使用的 k-gram 长度
+            num_perm: MinHash 哈希函数个数，估计误差约为 1/sqrt(num_perm)
+            dim: n-gram 向量的维度
+            seed: MinHash 哈希参数的随机种子
+        """
+        if shingle_size < 1 or num_perm < 1 or dim < 1:
+            raise ValueError("shingle_size、num_perm、dim 必须大于 0")
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.dim = dim
+        rng = np.random.default_rng(seed)
+        # (a * h + b) mod p，a、b 在整个域 [0, p) 上均匀选取，各哈希函数之间才近似独立
+        self._a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)
+        self._vocab: Dict[str, int] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self._index: Dict[str, int] = {}
+        self._signatures = np.empty((0, num_perm), dtype=np.uint64)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._matrices = {method: np.empty((0, 0)) for method in METHODS}
+        self._dirty = set()
+        for name in names:
+            self._add(name)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._streams)
+
+    def _add(self, name: str) -> _Stream:
+        stream = self._streams[name] = _Stream()
+        self._index[name] = len(self._index)
+        self._signatures = np.vstack([self._signatures, np.full((1, self.num_perm), _PRIME, dtype=np.uint64)])
+        self._vectors = np.vstack([self._vectors, np.zeros((1, self.dim), dtype=np.float32)])
+        for method in METHODS:
+            old = self._matrices[method]
+            n = len(old) + 1
+            grown = np.eye(n)
+            grown[:n - 1, :n - 1] = old
+            self._matrices[method] = grown
+        self._dirty.add(name)
+        return stream
+
+    def feed(self, name: str, text: str):
+        """
+        追加一个模型的文本增量（只做分词，特征在积累足够 token 或读取矩阵时更新）
+
+        Args:
+            name: 模型名称
+            text: 文本增量
+        """
+        stream = self._streams.get(name)
+        if stream is None:
+            stream = self._add(name)
+        if not text:
+            return
+        stream.parts.append(text)
+        self._append(stream, stream.pending + text, complete=False)
+        if len(stream.ids) - stream.flushed >= _FLUSH_TOKENS:
+            self._flush(name, stream)
+        else:
+            self._dirty.add(name)
+
+    def _append(self, stream: _Stream, text: str, complete: bool):
+        vocab = self._vocab
+        end = 0
+        for m in tokenize(text):
+            if not complete and m.end() == len(text) and not _CJK_CHAR.match(m.group()):
+                break  # 单词可能还没结束
+            token = m.group().lower()
+            token_id = vocab.get(token)
+            if token_id is None:
+                token_id = vocab[token] = len(vocab)
+            stream.ids.append(token_id)
+            stream.starts.append(stream.offset + m.start())
+            stream.ends.append(stream.offset + m.end())
+            end = m.end()
+        if complete:
+            end = len(text)
+        stream.pending = text[end:]
+        stream.offset += end
+
+    def feed_event(self, name: str, event: StreamEvent):
+        """FanOutEngine on_event 回调的适配：TEXT 事件追加文本，USAGE 事件表示流结束"""
+        if event.kind == TEXT:
+            self.feed(name, event.text)
+        elif event.kind == USAGE:
+            self.finish(name)
+
+    def finish(self, name: str):
+        """流结束：切分末尾保留的单词并更新特征（直接调用 feed 时需要在流结束后调用）"""
+        stream = self._streams.get(name)
+        if stream is None:
+            stream = self._add(name)
+        if stream.pending:
+            self._append(stream, stream.pending, complete=True)
+        self._flush(name, stream)
+        if not stream.shingles and stream.ids:
+            # 不足 k 个 token 的短回答整体作为一个 shingle
+            ids = np.frombuffer(stream.ids, dtype=np.int32)
+            self._minhash(self._index[name], _shingle_hashes(ids, len(ids)))
+            stream.shingles = 1
+
+    def _flush(self, name: str, stream: _Stream):
+        """把新增 token 计入 MinHash 签名和 n-gram 向量"""
+        self._dirty.add(name)
+        total = len(stream.ids)
+        if total == stream.flushed:
+            return
+        k = self.shingle_size
+        row = self._index[name]
+        # 新 shingle 从已计入部分的最后 k-1 个 token 开始
+        start = max(0, stream.flushed - k + 1)
+        ids = np.frombuffer(stream.ids, dtype=np.int32)[start:]
+        shingles = _shingle_hashes(ids, k)
+        if len(shingles):
+            self._minhash(row, shingles)
+            stream.shingles += len(shingles)
+        # 1-gram 只计新 token，2-gram 从上一个已计入的 token 开始
+        new = ids[stream.flushed - start:].astype(np.uint64)
+        features = [(new * _MIX) >> np.uint64(40)]
+        bigram_start = max(0, stream.flushed - start - 1)
+        if len(ids) - bigram_start >= 2:
+            pair = ids[bigram_start:].astype(np.uint64)
+            features.append(((pair[:-1] * _MIX + pair[1:]) * _MIX) >> np.uint64(40))
+        buckets = np.concatenate(features) % np.uint64(self.dim)
+        self._vectors[row] += np.bincount(buckets.astype(np.intp), minlength=self.dim).astype(np.float32)
+        stream.flushed = total
+
+    def _minhash(self, row: int, shingles: np.ndarray):
+        # h < 2^32、a < p：a * h < 2^64，先取模再加 b 也不会溢出
+        hashed = (shingles[:, None] % _PRIME * self._a % _PRIME + self._b) % _PRIME
+        np.minimum(self._signatures[row], hashed.min(axis=0), out=self._signatures[row])
+
+    def _refresh(self):
+        if not self._dirty:
+            return
+        for name in self._dirty:
+            stream = self._streams[name]
+            if len(stream.ids) != stream.flushed:
+                self._flush(name, stream)
+        rows = np.array(sorted(self._index[name] for name in self._dirty))
+        self._dirty.clear()
+
+        # MinHash：签名相同的位置比例；没有 shingle 的回答只和同样为空的回答相似
+        signatures = self._signatures
+        jaccard = (signatures[rows][:, None, :] == signatures[None, :, :]).mean(axis=2)
+        counts = np.array([self._streams[name].shingles for name in self._streams])
+        empty = counts == 0
+        jaccard[empty[rows][:, None] != empty[None, :]] = 0.0
+        self._store("minhash", rows, jaccard)
+
+        vectors = self._vectors
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        cosine = (vectors[rows] @ vectors.T) / (norms[rows][:, None] * norms[None, :])
+        self._store("cosine", rows, cosine)
+
+    def _store(self, method: str, rows: np.ndarray, values: np.ndarray):
+        matrix = self._matrices[method]
+        matrix[rows, :] = values
+        matrix[:, rows] = values.T
+        matrix[rows, rows] = 1.0
+
+    def matrix(self, method: str = "minhash") -> np.ndarray:
+        """
+        当前的相似度矩阵
+
+        Args:
+            method: minhash（shingle 集合的 Jaccard 估计）或 cosine（n-gram 词频向量余弦）
+
+        Returns:
+            按 names 顺序排列的 N×N 矩阵副本，对角线为 1
+        """
+        if method not in METHODS:
+            raise ValueError(f"未知的相似度方法 {method}，可选: {', '.join(METHODS)}")
+        self._refresh()
+        return self._matrices[method].copy()
+
+    def similarity(self, a: str, b: str, method: str = "minhash") -> float:
+        """两个模型回答的相似度"""
+        self._refresh()
+        return float(self._matrices[method][self._index[a], self._index[b]])
+
+    def pairs(self, method: str = "minhash") -> List[Tuple[str, str, float]]:
+        """所有模型对按相似度从高到低排列"""
+        matrix = self.matrix(method)
+        names = self.names
+        rows, cols = np.triu_indices(len(names), k=1)
+        order = np.argsort(-matrix[rows, cols], kind="stable")
+        return [(names[rows[i]], names[cols[i]], float(matrix[rows[i], cols[i]])) for i in order]
+
+    def format_matrix(self, method: str = "minhash") -> str:
+        """以制表符分隔的表格形式输出相似度矩阵"""
+        matrix = self.matrix(method)
+        names = self.names
+        lines = ["\t".join([method] + names)]
+        for name, row in zip(names, matrix):
+            lines.append("\t".join([name] + [f"{value:.2f}" for value in row]))
+        return "\n".join(lines)
+
+    def text(self, name: str) -> str:
+        """到目前为止收到的完整文本"""
+        return "".join(self._streams[name].parts)
+
+    def _tokens(self, name: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        stream = self._streams[name]
+        return (
+            np.frombuffer(stream.ids, dtype=np.int32),
+            np.frombuffer(stream.starts, dtype=np.int64),
+            np.frombuffer(stream.ends, dtype=np.int64),
+        )
+
+    def highlights(self, names: Optional[Sequence[str]] = None, k: Optional[int] = None) -> Dict[str, List[Span]]:
+        """
+        各回答独有内容的字符区间（所有 k-gram 都没有在其它回答中出现过的 token）
+
+        Args:
+            names: 参与比较的模型，默认全部
+            k: 判断是否共有时使用的 k-gram 长度，默认与 shingle_size 相同
+
+        Returns:
+            {模型名称: [(起始位置, 结束位置), ...]}，位置是 text(name) 中的字符下标
+        """
+        names = list(names) if names is not None else self.names
+        k = k or self.shingle_size
+        tokens = [self._tokens(name) for name in names]
+        hashes = [_shingle_hashes(ids, k) for ids, _, _ in tokens]
+        owners = np.repeat(np.arange(len(names)), [len(h) for h in hashes])
+        if len(owners):
+            all_hashes = np.concatenate(hashes)
+            # 每个 (回答, 哈希) 只算一次，再数每个哈希出现在几个回答里
+            pairs = np.unique(np.stack([all_hashes, owners.astype(np.uint64)], axis=1), axis=0)
+            unique_hashes, counts = np.unique(pairs[:, 0], return_counts=True)
+            shared_hashes = unique_hashes[counts > 1]
+        else:
+            shared_hashes = np.empty(0, dtype=np.uint64)
+
+        result = {}
+        for name, (ids, starts, ends), shingles in zip(names, tokens, hashes):
+            shared = np.zeros(len(ids) + 1, dtype=np.int32)
+            if len(shingles):
+                # 共有 k-gram 覆盖的 token 区间用差分数组标记
+                begin = np.flatnonzero(np.isin(shingles, shared_hashes, assume_unique=False))
+                np.add.at(shared, begin, 1)
+                np.add.at(shared, begin + k, -1)
+            covered = np.cumsum(shared[:-1]) > 0
+            result[name] = _runs(~covered, starts, ends)
+        return result
+
+    def diff(self, a: str, b: str) -> Tuple[List[Span], List[Span]]:
+        """
+        两个回答的 token 级差异
+
+        Returns:
+            (a 中不同部分的字符区间, b 中不同部分的字符区间)
+        """
+        ids_a, starts_a, ends_a = self._tokens(a)
+        ids_b, starts_b, ends_b = self._tokens(b)
+        return _diff_spans(ids_a, starts_a, ends_a, ids_b, starts_b, ends_b)
+
+
+def _runs(mask: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> List[Span]:
+    """mask 为真的连续 token 合并成字符区间"""
+    if not mask.any():
+        return []
+    edges = np.diff(np.concatenate([[False], mask, [False]]).astype(np.int8))
+    first = np.flatnonzero(edges == 1)
+    last = np.flatnonzero(edges == -1) - 1
+    return list(zip(starts[first].tolist(), ends[last].tolist()))
+
+
+def _diff_spans(ids_a, starts_a, ends_a, ids_b, starts_b, ends_b) -> Tuple[List[Span], List[Span]]:
+    matcher = difflib.SequenceMatcher(None, ids_a.tolist(), ids_b.tolist(), autojunk=False)
+    mask_a = np.ones(len(ids_a), dtype=bool)
+    mask_b = np.ones(len(ids_b), dtype=bool)
+    for i, j, size in matcher.get_matching_blocks():
+        mask_a[i:i + size] = False
+        mask_b[j:j + size] = False
+    return _runs(mask_a, starts_a, ends_a), _runs(mask_b, starts_b, ends_b)
+
+
+def _token_arrays(text: str, vocab: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    ids, starts, ends = [], [], []
+    for m in tokenize(text):
+        ids.append(vocab.setdefault(m.group().lower(), len(vocab)))
+        starts.append(m.start())
+        ends.append(m.end())
+    return np.array(ids, dtype=np.int32), np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+
+def diff_spans(a: str, b: str) -> Tuple[List[Span], List[Span]]:
+    """
+    两段完整文本的 token 级差异（不经过 SimilarityEngine 时使用）
+
+    Returns:
+        (a 中不同部分的字符区间, b 中不同部分的字符区间)
+    """
+    vocab: Dict[str, int] = {}
+    return _diff_spans(*_token_arrays(a, vocab), *_token_arrays(b, vocab))
+
+
+def highlight(text: str, spans: Sequence[Span], start: str = HIGHLIGHT, end: str = RESET) -> str:
+    """在 spans 区间两侧插入标记（默认终端反色）"""
+    out = []
+    last = 0
+    for begin, stop in spans:
+        out.append(text[last:begin])
+        out.append(start)
+        out.append(text[begin:stop])
+        out.append(end)
+        last = stop
+    out.append(text[last:])
+    return "".join(out)
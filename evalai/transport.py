@@ -0,0 +1,286 @@
+"""
+进程级共享 HTTP 连接池
+
+各厂商客户端不再各自创建 httpx 连接，而是按 base_url（+ 代理）共享同一个 keep-alive 连接池，
+同一进程内新建多个 bot 也不会重复 TLS 握手。支持按厂商配置代理、可选 HTTP/2、
+在基准测试前预热连接，以及统计连接复用情况（命中 / 新建连接数）。
+
+用法：
+    from evalai.transport import registry
+    client = registry.openai_client(api_key, "https://api.deepseek.com")
+"""
+import asyncio
+import threading
+import warnings
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# 每个 base_url 的连接池上限；对比场景下同一厂商的并发不会很高，保持长一点的空闲存活时间
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+WARM_UP_TIMEOUT = httpx.Timeout(10.0)
+
+
+def _normalize(base_url: Optional[str]) -> str:
+    return (base_url or OPENAI_BASE_URL).rstrip("/")
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PoolStats:
+    """
+    单个连接池的复用统计
+
+    通过响应的 network_stream 扩展识别底层连接：见过的连接记为命中，否则记为新建连接。
+    """
+
+    __slots__ = ("requests", "new_connections", "_seen", "_lock")
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self._seen = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    @property
+    def hits(self) -> int:
+        """复用已有连接的请求数"""
+        return self.requests - self.new_connections
+
+    def record(self, response: httpx.Response):
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            self.requests += 1
+            if stream is None:
+                return
+            try:
+                if stream in self._seen:
+                    return
+                self._seen.add(stream)
+            except TypeError:
+                # 不支持弱引用的连接对象无法识别，保守地按新建连接计
+                pass
+            self.new_connections += 1
+
+    def to_dict(self) -> Dict[str, int]:
+        return {"requests": self.requests, "hits": self.hits, "new_connections": self.new_connections}
+
+
+class TransportRegistry:
+    """
+    按 (base_url, 代理) 共享的 httpx 客户端注册表
+
+    同步客户端全进程共享；异步客户端绑定事件循环，按循环分别维护。
+    """
+
+    def __init__(self, limits: httpx.Limits = DEFAULT_LIMITS, http2: bool = False):
+        """
+        初始化注册表
+
+        Args:
+            limits: 每个连接池的连接数限制
+            http2: 是否默认启用 HTTP/2（需要安装 h2，未安装时回退到 HTTP/1.1）
+        """
+        self.limits = limits
+        self.http2 = http2
+        self._lock = threading.Lock()
+        self._config: Dict[str, Dict] = {}
+        self._sync: Dict[Tuple[str, Optional[str]], httpx.Client] = {}
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = weakref.WeakKeyDictionary()
+        self._stats: Dict[str, PoolStats] = {}
+
+    # ------------- 配置 -------------
+    def configure(self, base_url: Optional[str], proxy: Optional[str] = None, http2: Optional[bool] = None):
+        """
+        为某个 base_url 设置代理或 HTTP/2，只影响之后新建的连接池
+
+        Args:
+            base_url: 厂商接口地址，None 表示 OpenAI 官方地址
+            proxy: 代理地址，例如 "socks5h://localhost:1080"
+            http2: 是否启用 HTTP/2
+        """
+        with self._lock:
+            config = self._config.setdefault(_normalize(base_url), {})
+            if proxy is not None:
+                config["proxy"] = proxy
+            if http2 is not None:
+                config["http2"] = http2
+
+    def _options(self, base_url: str, proxy: Optional[str]) -> Tuple[Optional[str], bool]:
+        config = self._config.get(base_url, {})
+        proxy = proxy if proxy is not None else config.get("proxy")
+        http2 = config.get("http2", self.http2)
+        if http2 and not _http2_available():
+            warnings.warn("未安装 h2，HTTP/2 不可用，回退到 HTTP/1.1（pip install 'httpx[http2]'）")
+            http2 = False
+        return proxy or None, http2
+
+    def _stats_for(self, base_url: str) -> PoolStats:
+        stats = self._stats.get(base_url)
+        if stats is None:
+            stats = self._stats[base_url] = PoolStats()
+        return stats
+
+    # ------------- httpx 客户端 -------------
+    def http_client(self, base_url: Optional[str] = None, proxy: Optional[str] = None) -> httpx.Client:
+        """
+        获取共享的同步 httpx 客户端
+
+        Args:
+            base_url: 厂商接口地址
+            proxy: 代理地址，None 时使用 configure() 中的配置
+
+        Returns:
+            httpx.Client
+        """
+        base_url = _normalize(base_url)
+        with self._lock:
+            proxy, http2 = self._options(base_url, proxy)
+            key = (base_url, proxy)
+            client = self._sync.get(key)
+            if client is None:
+                stats = self._stats_for(base_url)
+                client = httpx.Client(
+                    proxy=proxy,
+                    http2=http2,
+                    limits=self.limits,
+                    event_hooks={"response": [stats.record]},
+                )
+                self._sync[key] = client
+            return client
+
+    def async_http_client(self, base_url: Optional[str] = None, proxy: Optional[str] = None) -> httpx.AsyncClient:
+        """
+        获取当前事件循环内共享的异步 httpx 客户端
+
+        Args:
+            base_url: 厂商接口地址
+            proxy: 代理地址，None 时使用 configure() 中的配置
+
+        Returns:
+            httpx.AsyncClient
+        """
+        base_url = _normalize(base_url)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            proxy, http2 = self._options(base_url, proxy)
+            key = (base_url, proxy)
+            clients = self._async.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                stats = self._stats_for(base_url)
+
+                async def record(response: httpx.Response):
+                    stats.record(response)
+
+                client = httpx.AsyncClient(
+                    proxy=proxy,
+                    http2=http2,
+                    limits=self.limits,
+                    event_hooks={"response": [record]},
+                )
+                clients[key] = client
+            return client
+
+    # ------------- OpenAI 客户端 -------------
+    def openai_client(self, api_key: str, base_url: Optional[str] = None, proxy: Optional[str] = None) -> OpenAI:
+        """
+        创建使用共享连接池的 OpenAI 客户端
+
+        不要对返回的客户端调用 close()，那会关闭共享的连接池。
+        """
+        return OpenAI(api_key=api_key, base_url=_normalize(base_url), http_client=self.http_client(base_url, proxy))
+
+    def async_openai_client(
+        self, api_key: str, base_url: Optional[str] = None, proxy: Optional[str] = None
+    ) -> AsyncOpenAI:
+        """
+        创建使用当前事件循环共享连接池的 AsyncOpenAI 客户端
+
+        不要对返回的客户端调用 close()，那会关闭共享的连接池。
+        """
+        return AsyncOpenAI(
+            api_key=api_key, base_url=_normalize(base_url), http_client=self.async_http_client(base_url, proxy)
+        )
+
+    # ------------- 预热 -------------
+    def warm_up(self, base_url: Optional[str] = None, connections: int = 1, proxy: Optional[str] = None) -> int:
+        """
+        预先建立连接（含 TLS 握手），让首个请求不再承担建连耗时
+
+        对 base_url 并发发送 connections 个 HEAD 请求，响应状态码不重要，连接会留在池中复用。
+
+        Args:
+            base_url: 厂商接口地址
+            connections: 需要预先打开的连接数
+            proxy: 代理地址
+
+        Returns:
+            成功建立的连接数
+        """
+        client = self.http_client(base_url, proxy)
+        url = _normalize(base_url)
+
+        def ping(_):
+            try:
+                client.head(url, timeout=WARM_UP_TIMEOUT)
+                return True
+            except httpx.HTTPError:
+                return False
+
+        if connections <= 1:
+            return int(ping(None))
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            return sum(pool.map(ping, range(connections)))
+
+    async def async_warm_up(
+        self, base_url: Optional[str] = None, connections: int = 1, proxy: Optional[str] = None
+    ) -> int:
+        """warm_up() 的异步版本，预热当前事件循环的连接池"""
+        client = self.async_http_client(base_url, proxy)
+        url = _normalize(base_url)
+
+        async def ping():
+            try:
+                await client.head(url, timeout=WARM_UP_TIMEOUT)
+                return True
+            except httpx.HTTPError:
+                return False
+
+        return sum(await asyncio.gather(*(ping() for _ in range(connections))))
+
+    # ------------- 统计与关闭 -------------
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """各 base_url 的连接复用统计"""
+        with self._lock:
+            return {base_url: stats.to_dict() for base_url, stats in self._stats.items()}
+
+    def close(self):
+        """关闭所有同步连接池"""
+        with self._lock:
+            clients, self._sync = list(self._sync.values()), {}
+        for client in clients:
+            client.close()
+
+    async def aclose(self):
+        """关闭当前事件循环的所有异步连接池"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async.pop(loop, {})
+        for client in clients.values():
+            await client.aclose()
+
+
+# 进程级单例
+registry = TransportRegistry()
@@ -1,18 +1,25 @@
-from google import genai
-from google.genai import types
-
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
 
-response = client.models.generate_content_stream(
-    model="gemini-2.5-flash",
-    config=types.GenerateContentConfig(
-        system_instruction="You are a cat. Your name is Neko."),
-    contents=["Explain how AI works"]
-)
-for chunk in response:
-    print(chunk.text, end="")
\ No newline at end of file
+def main():
+    # google-genai 导入较慢，只在真正调用时导入，导入本模块不会创建客户端
+    from google import genai
+    from google.genai import types
+
+    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+
+    response = client.models.generate_content_stream(
+        model="gemini-2.5-flash",
+        config=types.GenerateContentConfig(
+            system_instruction="You are a cat. Your name is Neko."),
+        contents=["Explain how AI works"]
+    )
+    for chunk in response:
+        print(chunk.text, end="")
+
+
+if __name__ == "__main__":
+    main()
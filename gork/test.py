@@ -1,6 +1,13 @@
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # 直接运行脚本时也能导入 evalai
+from evalai.conversation import Conversation
+from evalai.events import TEXT
+from evalai.transport import registry
+
 load_dotenv()
 
 class ChatApp:
@@ -9,12 +16,16 @@ class ChatApp:
         x_ai_api_key: str,
         base_url: str = "https://api.x.ai/v1",
         system_prompt: str | None = None,
+        context_budget: int = 16000,
     ) -> None:
         self.x_ai_api_key = x_ai_api_key
-        self.grok_client = OpenAI(base_url=base_url, api_key=self.x_ai_api_key)
-        self.messages = []
-        if system_prompt:
-            self.messages.append({"role": "system", "content": system_prompt})
+        self.grok_client = registry.openai_client(self.x_ai_api_key, base_url, proxy=os.getenv("XAI_PROXY"))
+        # 历史超过 context_budget 时按整轮淘汰，前缀在两次淘汰之间保持不变
+        self.conversation = Conversation(system=system_prompt, budget=context_budget)
+
+    @property
+    def messages(self):
+        return self.conversation.messages
 
     def converse(self, model: str = "grok-code-fast"):
         while True:
@@ -24,20 +35,12 @@ class ChatApp:
                 break
 
             print(f"You: {user_input}", flush=True)
-            self.messages.append({"role": "user", "content": user_input})
-
-            model_response = ""
-            stream = self.grok_client.chat.completions.create(
-                model=model, messages=self.messages, stream=True
-            )
 
             print("Grok: ", end="", flush=True)
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    model_response += chunk.choices[0].delta.content
-                    print(chunk.choices[0].delta.content, end="", flush=True)
+            for event in self.conversation.chat(self.grok_client, model, user_input):
+                if event.kind == TEXT:
+                    print(event.text, end="", flush=True)
             print()
-            self.messages.append({"role": "assistant", "content": model_response})
 
 
 SYSTEM_PROMPT = """
@@ -1,16 +1,18 @@
 import os
+import sys
 import datetime
-from openai import OpenAI
+from pathlib import Path
+from typing import Iterator, Optional
 
 # --- (建议) 使用环境变量管理 API Key，更安全 ---
 from dotenv import load_dotenv
 
-load_dotenv()
-
-import httpx
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # 直接运行脚本时也能导入 evalai
+from evalai.events import StreamEvent, TEXT, USAGE, ERROR, iter_responses_events
+from evalai.metrics import StreamMetrics, format_metrics
+from evalai.transport import registry
 
-# 使用代理的 httpx.Client
-http_client_proxy = httpx.Client(proxy="socks5h://localhost:1080")
+load_dotenv()
 
 # --- 配置参数 ---
 prompt = "讲一下什么是ssr，前端的"
@@ -22,7 +24,7 @@ reasoning_effort = "minimal"  # 思考程度：minimal, medium, high
 
 class OpenAIClient:
     def __init__(self, api_key=None, model=None, enable_reasoning=None,
-                 reasoning_effort=None):
+                 reasoning_effort=None, base_url=None):
         """
         初始化OpenAI客户端
 
@@ -31,10 +33,14 @@ class OpenAIClient:
             model: 使用的模型名称，如果为None则使用默认值
             enable_reasoning: 是否启用推理思考，如果为None则使用默认值
             reasoning_effort: 推理思考的程度，如果为None则使用默认值
+            base_url: API基础URL，如果为None则使用 OpenAI 官方地址
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=self.api_key, http_client=http_client_proxy)
-        # self.client = OpenAI(api_key=self.api_key, )
+        # 代理地址，例如 socks5h://localhost:1080；未设置 OPENAI_PROXY 时直连。
+        # 在创建实例时读取，导入本模块后再设置的代理同样生效
+        proxy = os.getenv("OPENAI_PROXY")
+        # 共享连接池，同一进程内的多个实例复用连接
+        self.client = registry.openai_client(self.api_key, base_url, proxy=proxy)
 
 
         # 设置默认值
@@ -55,6 +61,62 @@ class OpenAIClient:
         """
         return f"{base_prompt}，用{word_limit}字完成回复"
     
+    def stream(self, prompt, word_limit=word_limit, instructions=None) -> Iterator[StreamEvent]:
+        """
+        发送流式请求，把 Responses API 事件归一化为 StreamEvent
+        
+        Args:
+            prompt: 用户提示词
+            word_limit: 字数限制
+            instructions: 额外指令
+            
+        Returns:
+            StreamEvent 迭代器；response.completed 对应 USAGE 事件，最终响应对象在其 data 中
+        """
+        # 构建完整的提示词（包含字数限制）
+        full_prompt = self._build_prompt_with_word_limit(prompt, word_limit)
+        
+        # 构建请求参数
+        request_params = {
+            "model": self.model,
+            "input": [
+                {
+                    "role": "user",
+                    "content": full_prompt,
+                },
+            ],
+            "stream": True,
+        }
+        
+        # 根据设置添加推理参数
+        if self.enable_reasoning:
+            request_params["reasoning"] = {"effort": self.reasoning_effort}
+        
+        # 如果有额外指令，添加到请求中
+        if instructions:
+            request_params["instructions"] = instructions
+        
+        metrics = StreamMetrics()
+        response_stream = self.client.responses.create(**request_params)
+        yield from iter_responses_events(response_stream, metrics)
+    
+    def consistency(self, prompt: str, k: int = 5, concurrency: Optional[int] = None, **extra):
+        """
+        一致性测试：同一个 prompt 并发采样 k 次
+
+        Args:
+            prompt: 用户提示词
+            k: 采样次数
+            concurrency: 同时进行的请求数，默认 k
+            **extra: 传给 stream() 的额外参数（例如 temperature）
+
+        Returns:
+            evalai.consistency.ConsistencyReport
+        """
+        from evalai.consistency import sample_stream  # 依赖 numpy，只在用到时导入
+
+        return sample_stream(self, prompt, k, concurrency, provider="gpt", **extra)
+
     def chat_stream(self, prompt, word_limit=word_limit, instructions=None):
         """
         发送流式聊天请求
@@ -69,52 +131,30 @@ class OpenAIClient:
         """
         print("正在向模型发送请求并等待流式响应...")
         
-        # 构建完整的提示词（包含字数限制）
-        full_prompt = self._build_prompt_with_word_limit(prompt, word_limit)
-        
         try:
-            # 构建请求参数
-            request_params = {
-                "model": self.model,
-                "input": [
-                    {
-                        "role": "user",
-                        "content": full_prompt,
-                    },
-                ],
-                "stream": True,
-            }
-            
-            # 根据设置添加推理参数
-            if self.enable_reasoning:
-                request_params["reasoning"] = {"effort": self.reasoning_effort}
-            
-            # 如果有额外指令，添加到请求中
-            if instructions:
-                request_params["instructions"] = instructions
-            
-            response_stream = self.client.responses.create(**request_params)
-            
             # 处理流式响应
-            final_response = None
+            final_response, metrics = None, None
             print("模型输出: ", end="", flush=True)
             
-            for event in response_stream:
-                # 检查事件类型是否为文本增量
-                if event.type == "response.output_text.delta":
-                    # 直接打印出增量内容，不换行
-                    print(event.delta, end="", flush=True)
+            for event in self.stream(prompt, word_limit=word_limit, instructions=instructions):
+                # 文本增量：直接打印出增量内容，不换行
+                if event.kind == TEXT:
+                    print(event.text, end="", flush=True)
+                
+                # 请求完成：保存最终的响应对象以备后用
+                elif event.kind == USAGE:
+                    final_response, metrics = event.data, event.metrics
                 
-                # 检查事件类型是否为请求完成
-                elif event.type == "response.completed":
-                    # 保存最终的响应对象以备后用
-                    final_response = event.response
+                elif event.kind == ERROR:
+                    raise RuntimeError(event.text)
             
             # 循环结束后，打印一个换行符，让格式更美观
             print("\n" + "=" * 50)
             
             # 打印响应元数据
             self._print_response_info(final_response)
+            if metrics is not None:
+                print(format_metrics(metrics))
             
             return final_response
             
@@ -145,7 +185,9 @@ class OpenAIClient:
             print(f"创建时间: {created_time}")
             print("Token 使用情况:")
             print(f"  - 输入 Tokens: {usage_info.input_tokens}")
-            print(f"  - 输出 Tokens: {usage_info.output_tokens}")
+            details = getattr(usage_info, "output_tokens_details", None)
+            reasoning_tokens = getattr(details, "reasoning_tokens", None) or 0
+            print(f"  - 输出 Tokens: {usage_info.output_tokens}（其中推理 {reasoning_tokens}，推理程度 {self.reasoning_effort if self.enable_reasoning else '未开启'}）")
             print(f"  - 总 Tokens: {usage_info.total_tokens}")
         else:
             print("未能获取到最终响应信息。")
@@ -1,8 +1,17 @@
 import os
+import sys
+from pathlib import Path
 from typing import Iterator, Dict, Optional
-from openai import OpenAI, APIError
+from openai import APIError
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # 直接运行脚本时也能导入 evalai
+from evalai.events import StreamEvent, TEXT, USAGE, iter_chat_events
+from evalai.limits import OutputLimits, Truncated, limit_events
+from evalai.metrics import StreamMetrics, format_metrics
+from evalai.estimate import estimate_prompt_tokens
+from evalai.transport import registry
+
 load_dotenv()
 
 # -------------------- 配置区 --------------------
@@ -35,7 +44,7 @@ class KimiStream:
             raise KimiChatError("缺少 MOONSHOT_API_KEY")
 
         base_url = (base_url or "https://api.moonshot.cn/v1").rstrip("/")
-        self.client = OpenAI(api_key=self.api_key, base_url=base_url)
+        self.client = registry.openai_client(self.api_key, base_url)
 
         # 默认值
         self.model = model if model is not None else model_name
@@ -50,8 +59,12 @@ class KimiStream:
         self,
         prompt: str,
         max_tokens: Optional[int] = None,
+        limits: Optional[OutputLimits] = None,
         **extra,
-    ) -> Iterator[str]:
+    ) -> Iterator[StreamEvent]:
+        """
+        yield StreamEvent：文本片段为 TEXT 事件，最后一个为带用量和时延指标的 USAGE 事件
+        """
         if max_tokens is not None:
             prompt = self._build_prompt_with_token_limit(prompt, max_tokens)
 
@@ -60,41 +73,60 @@ class KimiStream:
             {"role": "user", "content": prompt},
         ]
 
+        metrics = StreamMetrics()
+        # 提示词里的 token 要求只是软约束；limits 会同时设置 max_tokens 并在客户端强制截断
+        params = {**limits.request_params(), **extra} if limits is not None else extra
         try:
             resp = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 stream=True,
                 stream_options={"include_usage": True},
-                **extra,
+                **params,
             )
-            for chunk in resp:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                elif chunk.usage:
-                    yield {
-                        "prompt_tokens": chunk.usage.prompt_tokens,
-                        "completion_tokens": chunk.usage.completion_tokens,
-                        "total_tokens": chunk.usage.total_tokens,
-                    }
+            events = iter_chat_events(resp, metrics)
+            if limits is not None:
+                events = limit_events(events, limits, metrics, estimate_prompt_tokens(messages, "kimi"), "kimi")
+            yield from events
         except APIError as e:
             raise KimiChatError(f"API 请求失败: {e}") from e
 
     # ------------- 带打印的便利封装 -------------
-    def chat_stream(self, prompt: str, max_tokens: Optional[int] = None, **extra):
+    def consistency(self, prompt: str, k: int = 5, concurrency: Optional[int] = None, **extra):
+        """
+        一致性测试：同一个 prompt 并发采样 k 次
+
+        Args:
+            prompt: 用户提示词
+            k: 采样次数
+            concurrency: 同时进行的请求数，默认 k
+            **extra: 传给 stream() 的额外参数（例如 temperature）
+
+        Returns:
+            evalai.consistency.ConsistencyReport
+        """
+        from evalai.consistency import sample_stream  # 依赖 numpy，只在用到时导入
+
+        return sample_stream(self, prompt, k, concurrency, provider="kimi", **extra)
+
+    def chat_stream(
+        self, prompt: str, max_tokens: Optional[int] = None, limits: Optional[OutputLimits] = None, **extra
+    ):
         print("正在向 Kimi 发送流式请求...")
         print("模型输出: ", end="", flush=True)
 
-        usage = None
+        usage, metrics = None, None
         try:
-            for seg in self.stream(prompt, max_tokens=max_tokens, **extra):
-                if isinstance(seg, dict):
-                    usage = seg
-                else:
-                    print(seg, end="", flush=True)
+            for event in self.stream(prompt, max_tokens=max_tokens, limits=limits, **extra):
+                if event.kind == TEXT:
+                    print(event.text, end="", flush=True)
+                elif event.kind == USAGE:
+                    usage, metrics = event.usage, event.metrics
+                    if isinstance(event.data, Truncated):
+                        print(f"\n[输出已截断：超过 {event.data.reason}={event.data.limit}]", end="")
 
             print("\n" + "=" * 50)
-            self._print_usage_info(usage)
+            self._print_usage_info(usage, metrics)
             return usage
 
         except Exception as e:
@@ -102,7 +134,7 @@ class KimiStream:
             return None
 
     # ------------- 用量打印 -------------
-    def _print_usage_info(self, usage_info: Optional[Dict]):
+    def _print_usage_info(self, usage_info: Optional[Dict], metrics: Optional[StreamMetrics] = None):
         if usage_info:
             print("请求完成 ✓")
             print("Token 使用情况:")
@@ -111,6 +143,8 @@ class KimiStream:
             print(f"  - 总 Tokens: {usage_info['total_tokens']}")
         else:
             print("未能获取到使用信息。")
+        if metrics is not None:
+            print(format_metrics(metrics))
 
 
 # -------------------- 运行入口 --------------------
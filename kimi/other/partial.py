@@ -9,17 +9,33 @@ Kimi 流式角色扮演测试
 import os
 import sys
 import argparse
-from openai import OpenAI
+from pathlib import Path
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))  # 直接运行脚本时也能导入 evalai
+from evalai.events import TEXT, USAGE, iter_chat_events
+from evalai.limits import OutputLimits, Truncated, limit_events
+from evalai.metrics import StreamMetrics
+from evalai.estimate import estimate_prompt_tokens
+
 # ---------- 0. 加载环境变量 ----------
 load_dotenv()
-API_KEY = os.getenv("MOONSHOT_API_KEY")
-if not API_KEY:
-    sys.exit("❗ 请先设置环境变量 MOONSHOT_API_KEY（支持 .env 文件）")
 
 # ---------- 1. 客户端 ----------
-client = OpenAI(api_key=API_KEY, base_url="https://api.moonshot.cn/v1")
+_client = None
+
+
+def get_client():
+    """第一次调用时才导入 openai 并创建客户端，导入本模块不会检查密钥或建立连接"""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+
+        api_key = os.getenv("MOONSHOT_API_KEY")
+        if not api_key:
+            sys.exit("❗ 请先设置环境变量 MOONSHOT_API_KEY（支持 .env 文件）")
+        _client = OpenAI(api_key=api_key, base_url="https://api.moonshot.cn/v1")
+    return _client
 
 # ---------- 2. 消息模板 ----------
 def build_messages(role: str, friend: str, question: str):
@@ -32,36 +48,45 @@ def build_messages(role: str, friend: str, question: str):
     ]
 
 # ---------- 3. 流式对话 ----------
-def chat_stream(role: str, friend: str, question: str):
+def chat_stream(role: str, friend: str, question: str, limits: OutputLimits):
     messages = build_messages(role, friend, question)
+    client = get_client()
+    # 在发请求前创建：max_seconds 的截止时间和首 token 时间都要包含等待响应头的时间
+    metrics = StreamMetrics()
     stream = client.chat.completions.create(
         model="kimi-k2-0905-preview",
         messages=messages,
         temperature=0.6,
-        max_tokens=65536,
         stream=True,
         stream_options={"include_usage": True},  # 末尾带 usage
+        **limits.request_params(),
     )
+    # 超过 token / 时间上限时立即关闭连接，不再为失控的长输出付费
+    events = limit_events(iter_chat_events(stream, metrics), limits, metrics, estimate_prompt_tokens(messages, "kimi"), "kimi")
 
     print("🟢 Kimi 正在思考…\n")
     print("——— 流式输出开始 ———\n")
 
-    usage = None
-    for chunk in stream:
+    usage, truncated = None, None
+    for event in events:
         # 1. 文本片段
-        if chunk.choices and chunk.choices[0].delta.content is not None:
-            print(chunk.choices[0].delta.content, end="", flush=True)
-        # 2. usage 信息（最后一块）
-        if chunk.usage:
-            usage = chunk.usage
+        if event.kind == TEXT:
+            print(event.text, end="", flush=True)
+        # 2. usage 信息（最后一个事件）
+        elif event.kind == USAGE:
+            usage = event.usage
+            if isinstance(event.data, Truncated):
+                truncated = event.data
 
     print("\n\n——— 流式输出结束 ———")
+    if truncated:
+        print(f"✂️ 输出已截断：超过 {truncated.reason}={truncated.limit}（以下用量为估算）")
     if usage:
         print(
             f"📊 本次调用 token 用量 → "
-            f"prompt: {usage.prompt_tokens}, "
-            f"completion: {usage.completion_tokens}, "
-            f"total: {usage.total_tokens}"
+            f"prompt: {usage['prompt_tokens']}, "
+            f"completion: {usage['completion_tokens']}, "
+            f"total: {usage['total_tokens']}"
         )
 
 # ---------- 4. 命令行入口 ----------
@@ -70,6 +95,8 @@ if __name__ == "__main__":
     parser.add_argument("--role", default="喜羊羊", help="你想让 Kimi 扮演的角色")
     parser.add_argument("--friend", default="懒羊羊", help="该角色的好朋友")
     parser.add_argument("--question", default="你怎么看待懒羊羊？", help="问他们的问题")
+    parser.add_argument("--max-tokens", type=int, default=2048, help="输出 token 上限")
+    parser.add_argument("--max-seconds", type=float, default=120, help="整次调用的耗时上限（秒）")
     args = parser.parse_args()
 
-    chat_stream(args.role, args.friend, args.question)
\ No newline at end of file
+    chat_stream(args.role, args.friend, args.question, OutputLimits(args.max_tokens, args.max_seconds))
\ No newline at end of file
@@ -1,5 +1,202 @@
+import argparse
+import os
+import sys
+import time
+from dataclasses import replace
+
+from evalai.providers import PROVIDERS, ProviderError, get_provider, list_providers
+
+# openai / httpx / numpy 等依赖在 main() 中按需导入，--list-providers 和 --help 不为它们付出导入开销
+
+# --- 配置参数 ---
+prompt = "讲一下什么是Spring Boot"
+default_models = ["qwen", "kimi", "deepseek-chat", "deepseek-reasoner", "gpt"]
+concurrency = 5
+
+
+def _fmt_seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def column_titles(models):
+    """
+    各模型的显示名称；同一个模型出现多次时加上序号，保证并排显示和相似度矩阵中每列都能区分
+
+    Args:
+        models: 命令行中的模型列表
+
+    Returns:
+        与 models 顺序一致的名称列表
+    """
+    totals = {model: models.count(model) for model in models}
+    seen = {}
+    titles = []
+    for model in models:
+        seen[model] = seen.get(model, 0) + 1
+        titles.append(f"{model}#{seen[model]}" if totals[model] > 1 else model)
+    return titles
+
+
+def print_results(results, wall_time, show_text=True):
+    """
+    打印各模型回答和汇总表
+
+    Args:
+        results: ModelResult 列表
+        wall_time: 整次对比的实际耗时（秒）
+        show_text: 是否打印完整回答（并排显示时已经看过，只打印失败信息）
+    """
+    for r in results:
+        if not show_text and r.ok:
+            continue
+        print(f"\n===== {r.provider} ({r.model}) =====")
+        if r.ok:
+            print(r.text)
+        else:
+            print(f"发生错误: {r.error}")
+
+    print("\n" + "=" * 50)
+    print(f"{'厂商':<20}{'首 token':>10}{'完成':>10}{'输出 Tokens':>14}  状态")
+    for r in results:
+        tokens = r.usage["completion_tokens"] if r.usage else "-"
+        status = ("✓" if r.ok else "✗") + ("（缓存）" if r.cached else "")
+        print(f"{r.provider:<20}{_fmt_seconds(r.ttft):>10}{_fmt_seconds(r.duration):>10}{tokens:>14}  {status}")
+    print(f"总耗时: {wall_time:.2f}s（串行合计 {sum(r.duration for r in results):.2f}s）")
+
+
+def print_similarity(engine, max_spans=5):
+    """
+    打印回答相似度矩阵和各回答独有的片段
+
+    Args:
+        engine: 已收到所有回答的 SimilarityEngine
+        max_spans: 每个模型最多列出的独有片段数
+    """
+    for name in engine.names:
+        engine.finish(name)  # 超时或出错的流没有结束事件
+    print("\n回答相似度（MinHash 估计的 Jaccard）:")
+    print(engine.format_matrix())
+    print("\n各回答独有的内容:")
+    for name, spans in engine.highlights().items():
+        text = engine.text(name)
+        fragments = [text[start:end].replace("\n", " ") for start, end in spans[:max_spans]]
+        more = f" 等 {len(spans)} 处" if len(spans) > max_spans else ""
+        print(f"  {name}: {' / '.join(fragments) if fragments else '无'}{more}")
+
+
+def print_providers():
+    """打印所有可用厂商（含插件）以及密钥、SDK 的就绪情况，不导入任何厂商 SDK"""
+    print(f"{'厂商':<20}{'默认模型':<26}{'接口':<11}{'密钥':<6}SDK")
+    for spec in list_providers():
+        key = "✓" if os.getenv(spec.api_key_env) else "✗"
+        missing = spec.missing_sdk()
+        sdk = f"缺少 {', '.join(missing)}" if missing else "✓"
+        print(f"{spec.name:<20}{spec.model:<26}{spec.api:<11}{key:<6}{sdk}")
+
+
 def main():
-    print("Hello from evalai!")
+    parser = argparse.ArgumentParser(description="多模型并发对比")
+    parser.add_argument("prompt", nargs="?", default=prompt, help="发送给所有模型的提示词")
+    parser.add_argument(
+        "-m", "--models", nargs="+", default=default_models,
+        help=f"参与对比的厂商，可写成 厂商:模型（可选: {', '.join(sorted(PROVIDERS))}）",
+    )
+    parser.add_argument("-c", "--concurrency", type=int, default=concurrency, help="同时进行的请求数上限")
+    parser.add_argument("--timeout", type=float, default=None, help="单个模型的超时时间（秒）")
+    parser.add_argument("--system", default=None, help="系统消息")
+    parser.add_argument("--warm-up", action="store_true", help="发送请求前预热连接，首 token 时间不含建连耗时")
+    parser.add_argument("--cache", metavar="PATH", default=None, help="回答缓存的 SQLite 文件，相同请求直接回放")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="缓存有效期（秒），默认永不过期")
+    parser.add_argument("--cache-timing", action="store_true", help="缓存命中时按原始时间间隔回放")
+    parser.add_argument("--log-db", metavar="PATH", default=None, help="把每个请求写入该 SQLite 库的 api_requests 表")
+    parser.add_argument("--hedge-after", type=float, default=None, metavar="SECONDS", help="首 token 超过该秒数时发出对冲请求")
+    parser.add_argument("--live", action="store_true", help="实时并排显示各模型的流式输出")
+    parser.add_argument("--similarity", action="store_true", help="流式计算回答之间的相似度，并列出各回答独有的内容")
+    parser.add_argument("--list-providers", action="store_true", help="列出可用厂商及密钥、SDK 是否就绪后退出")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if args.list_providers:
+        print_providers()
+        return
+
+    try:
+        # 每个位置复制一份 spec，on_event 按对象区分，重复的模型不会合并成一列
+        specs = [replace(get_provider(model)) for model in args.models]
+    except ProviderError as e:
+        parser.error(str(e))
+
+    from evalai.fanout import fan_out
+
+    cache, request_log, hedge = None, None, None
+    if args.cache:
+        from evalai.cache import ResponseCache
+
+        cache = ResponseCache(args.cache, ttl=args.cache_ttl)
+    if args.log_db:
+        from evalai.requestlog import RequestLogWriter
+
+        request_log = RequestLogWriter(args.log_db).start()
+    if args.hedge_after is not None:
+        from evalai.hedge import HedgePolicy
+
+        hedge = HedgePolicy(delay=args.hedge_after)
+
+    titles = column_titles(args.models)
+    columns = {id(spec): index for index, spec in enumerate(specs)}
+    renderer, similarity, callbacks = None, None, []
+    if args.live:
+        if sys.stdout.isatty():
+            from evalai.render import SideBySideRenderer
+
+            renderer = SideBySideRenderer(titles)
+            callbacks.append(renderer.feed)
+        else:
+            print("标准输出不是终端，忽略 --live")
+    if args.similarity:
+        from evalai.similarity import SimilarityEngine  # 依赖 numpy
+
+        similarity = SimilarityEngine(titles)
+        callbacks.append(similarity.feed_event)
+
+    def on_event(spec, event):
+        title = titles[columns[id(spec)]]
+        for callback in callbacks:
+            callback(title, event)
+
+    print(f"正在向 {len(specs)} 个模型并发发送请求...")
+    start = time.perf_counter()
+    if renderer is not None:
+        renderer.start()
+    try:
+        results = fan_out(
+            args.prompt,
+            specs,
+            concurrency=args.concurrency,
+            timeout=args.timeout,
+            system=args.system,
+            warm_up=args.warm_up,
+            cache=cache,
+            cache_timing=args.cache_timing,
+            request_log=request_log,
+            hedge=hedge,
+            on_event=on_event if callbacks else None,
+        )
+    finally:
+        if renderer is not None:
+            renderer.close()
+    print_results(results, time.perf_counter() - start, show_text=renderer is None)
+    if similarity is not None:
+        print_similarity(similarity)
+    if hedge is not None:
+        hedged = [name for name, stats in hedge.stats().items() if stats["hedged"]]
+        print(f"对冲请求: {', '.join(hedged) if hedged else '无'}")
+    if cache is not None:
+        cache.close()
+    if request_log is not None:
+        request_log.close()
 
 
 if __name__ == "__main__":
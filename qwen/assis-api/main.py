@@ -1,55 +1,39 @@
-import json
+import asyncio
 import sys
-from http import HTTPStatus
+from pathlib import Path
 
-from dashscope import Assistants, Messages, Runs, Threads
 from dotenv import load_dotenv
 
-load_dotenv()
-
-def create_assistant():
-    # create assistant with information
-    assistant = Assistants.create(
-        model='qwen-max',  # 此处以qwen-max为例，可按需更换模型名称。模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-        name='smart helper',
-        description='A tool helper.',
-        instructions='You are a helpful assistant.',  # noqa E501
-    )
-
-    return assistant
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))  # 直接运行脚本时也能导入 evalai
+from evalai.assistants import AssistantConfig, AssistantRunner, DashScopeAssistants
+from evalai.metrics import format_metrics
 
+load_dotenv()
 
-def verify_status_code(res):
-    if res.status_code != HTTPStatus.OK:
-        print('Failed: ')
-        print(res)
-        sys.exit(res.status_code)
+# 配置不变时复用已创建的 assistant（ID 缓存在 ~/.evalai/assistants.json），不再每次运行都新建
+CONFIG = AssistantConfig(
+    model='qwen-max',  # 此处以qwen-max为例，可按需更换模型名称。模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
+    name='smart helper',
+    description='A tool helper.',
+    instructions='You are a helpful assistant.',  # noqa E501
+)
+
+
+async def main(prompts):
+    runner = AssistantRunner(DashScopeAssistants())
+    # 所有 run 并发执行，由同一个轮询协程等待完成
+    results = await runner.run_many(CONFIG, prompts)
+    for result in results:
+        print(f"== {result.prompt}  (thread={result.thread_id}, run={result.run_id}, status={result.status})")
+        if result.error:
+            print('Failed: ', result.error)
+            continue
+        print(result.text)
+        print(result.usage, format_metrics(result.metrics))
+    return results
 
 
 if __name__ == '__main__':
-    # create assistant
-    assistant = create_assistant()
-    print(assistant)
-    verify_status_code(assistant)
-
-    # create thread.
-    thread = Threads.create(
-        messages=[{
-            'role': 'user',
-            'content': '如何做出美味的牛肉炖土豆？'
-        }])
-    print(thread)
-    verify_status_code(thread)
-
-    # create run
-    run = Runs.create(thread.id, assistant_id=assistant.id)
-    print(run)
-    verify_status_code(run)
-    # wait for run completed or requires_action
-    run_status = Runs.wait(run.id, thread_id=thread.id)
-    print(run_status)
- 
-    # get the thread messages.
-    msgs = Messages.list(thread.id)
-    print(msgs)
-    print(json.dumps(msgs, ensure_ascii=False, default=lambda o: o.__dict__, sort_keys=True, indent=4))
+    results = asyncio.run(main(sys.argv[1:] or ['如何做出美味的牛肉炖土豆？']))
+    if any(result.error for result in results):
+        sys.exit(1)
@@ -1,8 +1,17 @@
 import os
-from typing import Iterator, Dict, Optional
-from openai import OpenAI, APIError
+import sys
+from pathlib import Path
+from typing import Iterator, Optional
+from openai import APIError
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # 直接运行脚本时也能导入 evalai
+from evalai.events import StreamEvent, TEXT, USAGE, iter_chat_events
+from evalai.limits import OutputLimits, Truncated, limit_events
+from evalai.metrics import StreamMetrics, format_metrics
+from evalai.estimate import estimate_prompt_tokens
+from evalai.transport import registry
+
 load_dotenv()
 
 # --- 配置参数 ---
@@ -12,6 +21,11 @@ model_name = "qwen-plus"
 system_message = "You are a helpful assistant."
 
 
+class QwenChatError(Exception):
+    """Qwen 专属异常"""
+    pass
+
+
 class QwenStream:
     """
     纯流式调用，支持 max_tokens 等全部额外参数
@@ -38,7 +52,7 @@ class QwenStream:
             raise QwenChatError("缺少 DASHSCOPE_API_KEY")
         
         base_url = (base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1").rstrip("/")
-        self.client = OpenAI(api_key=self.api_key, base_url=base_url)
+        self.client = registry.openai_client(self.api_key, base_url)
         
         # 设置默认值
         self.model = model if model is not None else model_name
@@ -61,10 +75,11 @@ class QwenStream:
         self,
         prompt: str,
         max_tokens: Optional[int] = None,
+        limits: Optional[OutputLimits] = None,
         **extra,
-    ) -> Iterator[str]:
+    ) -> Iterator[StreamEvent]:
         """
-        仅 yield 文本片段；最后 yield 一个 dict 带用量
+        yield StreamEvent：文本片段为 TEXT 事件，最后一个为带用量和时延指标的 USAGE 事件
         """
         # 如果指定了max_tokens，将其集成到提示词中
         if max_tokens is not None:
@@ -74,27 +89,44 @@ class QwenStream:
             {"role": "system", "content": self.system},
             {"role": "user", "content": prompt},
         ]
+        metrics = StreamMetrics()
+        # 提示词里的 token 要求只是软约束；limits 会同时设置 max_tokens 并在客户端强制截断
+        params = {**limits.request_params(), **extra} if limits is not None else extra
         try:
             resp = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 stream=True,
                 stream_options={"include_usage": True},
-                **extra,
+                **params,
             )
-            for chunk in resp:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                elif chunk.usage:
-                    yield {
-                        "prompt_tokens": chunk.usage.prompt_tokens,
-                        "completion_tokens": chunk.usage.completion_tokens,
-                        "total_tokens": chunk.usage.total_tokens,
-                    }
+            events = iter_chat_events(resp, metrics)
+            if limits is not None:
+                events = limit_events(events, limits, metrics, estimate_prompt_tokens(messages, "qwen"), "qwen")
+            yield from events
         except APIError as e:
             raise QwenChatError(f"API 请求失败: {e}") from e
     
-    def chat_stream(self, prompt: str, max_tokens: Optional[int] = None, **extra):
+    def consistency(self, prompt: str, k: int = 5, concurrency: Optional[int] = None, **extra):
+        """
+        一致性测试：同一个 prompt 并发采样 k 次
+
+        Args:
+            prompt: 用户提示词
+            k: 采样次数
+            concurrency: 同时进行的请求数，默认 k
+            **extra: 传给 stream() 的额外参数（例如 temperature）
+
+        Returns:
+            evalai.consistency.ConsistencyReport
+        """
+        from evalai.consistency import sample_stream  # 依赖 numpy，只在用到时导入
+
+        return sample_stream(self, prompt, k, concurrency, provider="qwen", **extra)
+
+    def chat_stream(
+        self, prompt: str, max_tokens: Optional[int] = None, limits: Optional[OutputLimits] = None, **extra
+    ):
         """
         发送流式聊天请求并处理输出显示
         
@@ -110,27 +142,30 @@ class QwenStream:
         print("模型输出: ", end="", flush=True)
         
         try:
-            usage = None
-            for seg in self.stream(prompt, max_tokens=max_tokens, **extra):
-                if isinstance(seg, dict):
-                    usage = seg
-                else:
-                    print(seg, end="", flush=True)
+            usage, metrics = None, None
+            for event in self.stream(prompt, max_tokens=max_tokens, limits=limits, **extra):
+                if event.kind == TEXT:
+                    print(event.text, end="", flush=True)
+                elif event.kind == USAGE:
+                    usage, metrics = event.usage, event.metrics
+                    if isinstance(event.data, Truncated):
+                        print(f"\n[输出已截断：超过 {event.data.reason}={event.data.limit}]", end="")
             
             print("\n" + "=" * 50)
-            self._print_usage_info(usage)
+            self._print_usage_info(usage, metrics)
             return usage
             
         except Exception as e:
             print(f"\n发生错误: {e}")
             return None
     
-    def _print_usage_info(self, usage_info):
+    def _print_usage_info(self, usage_info, metrics=None):
         """
         打印使用信息
         
         Args:
             usage_info: 使用信息字典
+            metrics: 时延指标 StreamMetrics
         """
         if usage_info:
             print("请求完成 ✓")
@@ -140,6 +175,8 @@ class QwenStream:
             print(f"  - 总 Tokens: {usage_info['total_tokens']}")
         else:
             print("未能获取到使用信息。")
+        if metrics is not None:
+            print(format_metrics(metrics))
 
 
 # --- 使用示例 ---
@@ -0,0 +1,28 @@
+import contextlib
+import dataclasses
+
+import pytest
+
+from evalai.mock_server import MockConfig, MockServer
+from evalai.providers import ProviderSpec, get_provider
+
+MOCK_KEY_ENV = "EVALAI_MOCK_API_KEY"
+
+
+class LocalMock(MockServer):
+    """在后台线程运行的模拟服务，spec() 返回指向它的厂商配置"""
+
+    def spec(self, name: str = "deepseek-chat") -> ProviderSpec:
+        return dataclasses.replace(get_provider(name), base_url=self.base_url, api_key_env=MOCK_KEY_ENV)
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """mock_server(**MockConfig 字段) 启动一个模拟服务，测试结束时关闭"""
+    monkeypatch.setenv(MOCK_KEY_ENV, "mock")
+    with contextlib.ExitStack() as stack:
+
+        def start(**config) -> LocalMock:
+            return stack.enter_context(LocalMock(MockConfig(**config)).running())
+
+        yield start
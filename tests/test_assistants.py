@@ -0,0 +1,177 @@
+import asyncio
+import sys
+import types
+from types import SimpleNamespace
+
+import httpx
+from openai import NotFoundError
+
+from evalai.assistants import (
+    AssistantConfig, AssistantRunner, AssistantStore, DashScopeAssistants, OpenAIAssistants, RunPoller,
+)
+
+CONFIG = AssistantConfig(model="qwen-max")
+
+
+def _not_found(what):
+    request = httpx.Request("POST", "https://api.example.com")
+    return NotFoundError(f"No {what} found", response=httpx.Response(404, request=request), body=None)
+
+
+def _runner(backend, stale_id):
+    store = AssistantStore(None)
+    runner = AssistantRunner(backend, store)
+    store.put(runner._key(CONFIG), stale_id)
+    return runner
+
+
+# ------------- DashScope -------------
+class FakeDashScope:
+    """内存中的百炼 Assistants API，返回值的形状与 SDK 相同"""
+
+    def __init__(self):
+        self.assistants = set()
+        self.threads = {"thread_1": []}
+        self.runs = {}
+
+    def module(self):
+        api = self
+
+        def ok(**fields):
+            return SimpleNamespace(status_code=200, **fields)
+
+        def missing():
+            return {"status_code": 404, "code": "NotFound", "message": "not found"}
+
+        class Assistants:
+            @staticmethod
+            def create(model, api_key, **kwargs):
+                assistant_id = f"asst_{len(api.assistants) + 1}"
+                api.assistants.add(assistant_id)
+                return ok(id=assistant_id)
+
+            @staticmethod
+            def retrieve(assistant_id, api_key):
+                return ok(id=assistant_id) if assistant_id in api.assistants else missing()
+
+        class Threads:
+            @staticmethod
+            def create(messages, api_key):
+                thread_id = f"thread_{len(api.threads) + 1}"
+                api.threads[thread_id] = [m["content"] for m in messages]
+                return ok(id=thread_id)
+
+        class Messages:
+            @staticmethod
+            def create(thread_id, content, role, api_key):
+                api.threads[thread_id].append(content)
+                return ok(id="msg")
+
+            @staticmethod
+            def list(thread_id, api_key, **kwargs):
+                run_id = max(api.runs)
+                return ok(data=[{"role": "assistant", "run_id": run_id,
+                                 "content": [{"text": {"value": f"answer to {api.threads[thread_id][-1]}"}}]}])
+
+        class Runs:
+            @staticmethod
+            def create(thread_id, assistant_id, api_key, **kwargs):
+                if assistant_id not in api.assistants:
+                    return missing()
+                run_id = f"run_{len(api.runs) + 1}"
+                api.runs[run_id] = thread_id
+                return ok(id=run_id)
+
+            @staticmethod
+            def retrieve(run_id, thread_id, api_key):
+                return ok(id=run_id, status="completed",
+                          usage={"input_tokens": 3, "output_tokens": 2, "total_tokens": 5})
+
+        return types.SimpleNamespace(Assistants=Assistants, Threads=Threads, Messages=Messages, Runs=Runs)
+
+
+def test_dashscope_rebuild_does_not_repost_message(monkeypatch):
+    api = FakeDashScope()
+    monkeypatch.setitem(sys.modules, "dashscope", api.module())
+
+    async def main():
+        backend = DashScopeAssistants(api_key="sk-test")
+        backend._poller = RunPoller(backend._retrieve, min_interval=0.01)
+        return await _runner(backend, "asst_deleted").run(CONFIG, "hello", thread_id="thread_1")
+
+    result = asyncio.run(main())
+    assert result.ok, result.error
+    assert result.text == "answer to hello"
+    assert api.threads["thread_1"] == ["hello"]  # 重建 assistant 后只发了一次
+
+
+# ------------- OpenAI -------------
+class FakeStream:
+    def __init__(self, events):
+        self._events = iter(events)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._events)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+
+def _openai_client(assistants, threads):
+    async def create_assistant(**kwargs):
+        assistant_id = f"asst_{len(assistants) + 1}"
+        assistants.add(assistant_id)
+        return SimpleNamespace(id=assistant_id)
+
+    async def retrieve_assistant(assistant_id):
+        if assistant_id not in assistants:
+            raise _not_found("assistant")
+        return SimpleNamespace(id=assistant_id)
+
+    async def create_run(thread_id, assistant_id, additional_messages, stream, **params):
+        if thread_id not in threads:
+            raise _not_found("thread")
+        if assistant_id not in assistants:
+            raise _not_found("assistant")
+        delta = SimpleNamespace(content=[SimpleNamespace(text=SimpleNamespace(value="hi there"))])
+        done = SimpleNamespace(status="completed", usage={"prompt_tokens": 3, "completion_tokens": 2}, last_error=None)
+        return FakeStream([
+            SimpleNamespace(event="thread.run.created", data=SimpleNamespace(id="run_1")),
+            SimpleNamespace(event="thread.message.delta", data=SimpleNamespace(delta=delta)),
+            SimpleNamespace(event="thread.run.completed", data=done),
+        ])
+
+    return SimpleNamespace(beta=SimpleNamespace(
+        assistants=SimpleNamespace(create=create_assistant, retrieve=retrieve_assistant),
+        threads=SimpleNamespace(runs=SimpleNamespace(create=create_run)),
+    ))
+
+
+def _run_openai(assistants, threads, stale_id, thread_id):
+    async def main():
+        backend = OpenAIAssistants(api_key="sk-test")  # 客户端需要在事件循环中创建
+        backend.client = _openai_client(assistants, threads)
+        async with _runner(backend, stale_id) as runner:
+            return await runner.run(CONFIG, "hello", thread_id=thread_id), runner
+
+    return asyncio.run(main())
+
+
+def test_openai_deleted_assistant_on_existing_thread_is_rebuilt():
+    result, runner = _run_openai(set(), {"thread_1"}, "asst_deleted", "thread_1")
+    assert result.ok, result.error
+    assert result.text == "hi there"
+    assert runner.created == 1
+
+
+def test_openai_missing_thread_is_not_treated_as_missing_assistant():
+    result, runner = _run_openai({"asst_1"}, set(), "asst_1", "thread_gone")
+    assert not result.ok
+    assert "thread" in result.error
+    assert runner.created == 0
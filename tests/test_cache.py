@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from evalai.cache import CachedProvider, ResponseCache
+from evalai.events import TEXT, USAGE, StreamEvent
+from evalai.fanout import fan_out
+
+
+class FakeBot:
+    """按推理强度返回不同回答的厂商类"""
+
+    def __init__(self, reasoning_effort="minimal", base_url="https://api.example.com/v1"):
+        self.model = "fake-model"
+        self.enable_reasoning = True
+        self.reasoning_effort = reasoning_effort
+        self.client = SimpleNamespace(base_url=base_url)
+        self.calls = 0
+
+    def stream(self, prompt, **kwargs):
+        self.calls += 1
+        yield StreamEvent(TEXT, f"{self.reasoning_effort}:{prompt}", ts=1.0)
+        yield StreamEvent(USAGE, ts=2.0, usage={"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2})
+
+
+def _text(provider, prompt="hi"):
+    return "".join(e.text for e in provider.stream(prompt) if e.kind == TEXT)
+
+
+def test_cached_provider_replays_same_config():
+    cache = ResponseCache()
+    bot = FakeBot()
+    provider = CachedProvider(bot, cache)
+    assert _text(provider) == "minimal:hi"
+    assert _text(provider) == "minimal:hi"
+    assert bot.calls == 1
+
+
+def test_cached_provider_key_includes_instance_config():
+    cache = ResponseCache()
+    low, high = FakeBot("minimal"), FakeBot("high")
+    other_host = FakeBot("minimal", base_url="http://127.0.0.1:8000/v1")
+    assert _text(CachedProvider(low, cache)) == "minimal:hi"
+    assert _text(CachedProvider(high, cache)) == "high:hi"
+    assert _text(CachedProvider(other_host, cache)) == "minimal:hi"
+    assert (low.calls, high.calls, other_host.calls) == (1, 1, 1)
+
+
+def test_fan_out_replays_from_cache(mock_server):
+    server = mock_server(ttft=0, chunk_rate=0, chunks=10)
+    cache = ResponseCache()
+    first = fan_out("hi", [server.spec()], cache=cache)[0]
+    second = fan_out("hi", [server.spec()], cache=cache)[0]
+    assert server.requests == 1
+    assert not first.cached and second.cached
+    assert second.text == first.text
+    assert second.usage == first.usage
+    fan_out("another prompt", [server.spec()], cache=cache)
+    assert server.requests == 2
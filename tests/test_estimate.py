@@ -0,0 +1,21 @@
+from evalai.estimate import MESSAGE_OVERHEAD, REQUEST_OVERHEAD, HeuristicCounter, counter_for, project
+from evalai.providers import get_provider
+
+
+def test_heuristic_count_rounds_whole_text_once():
+    counter = HeuristicCounter(0.6, 0.25)
+    assert counter.count("") == 0
+    assert counter.count("好") == 1
+    assert counter.count("好" * 10) == 6
+    assert counter.count("alpha " * 4) == 6
+
+
+def test_project_counts_each_prompt():
+    spec = get_provider("qwen")
+    counter = counter_for(spec.name)
+    prompts = ["你好世界", "hello there", "解释一下 Spring Boot"]
+    estimate = project(spec, prompts, max_output=100)
+    overhead = REQUEST_OVERHEAD + 2 * MESSAGE_OVERHEAD
+    expected = sum(counter.count(p) + counter.count(spec.system) + overhead for p in prompts)
+    assert estimate.input_tokens == expected
+    assert estimate.output_tokens == 300
@@ -0,0 +1,44 @@
+import json
+import sqlite3
+
+import pytest
+
+from evalai.export import ExportError, export_requests
+from evalai.requestlog import RequestLogWriter, RequestRecord
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "requests.sqlite3"
+    with RequestLogWriter(path) as log:
+        for i in range(3):
+            log.log(RequestRecord(api_name="qwen", model="qwen-plus", prompt=f"p{i}", response="r"))
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE api_requests SET rating_score = 4, rating_comment = '不错' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_default_export_includes_table_only_columns(db, tmp_path):
+    output = tmp_path / "history.jsonl"
+    stats = export_requests(db, output, report_interval=0)
+    rows = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert stats.rows == 3
+    assert [row["id"] for row in rows] == [1, 2, 3]
+    assert rows[0]["rating_score"] == 4
+    assert rows[0]["rating_comment"] == "不错"
+    assert rows[1]["rating_score"] is None
+
+
+def test_rating_columns_can_be_selected(db, tmp_path):
+    output = tmp_path / "ratings.csv"
+    export_requests(db, output, columns=["id", "rating_score"], report_interval=0)
+    lines = output.read_text(encoding="utf-8-sig").splitlines()
+    assert lines[0] == "id,rating_score"
+    assert lines[1] == "1,4.0"
+
+
+def test_unknown_column_is_rejected(db, tmp_path):
+    with pytest.raises(ExportError):
+        export_requests(db, tmp_path / "x.csv", columns=["no_such_column"], report_interval=0)
@@ -0,0 +1,59 @@
+from evalai.events import REASONING, TEXT
+from evalai.fanout import fan_out
+from evalai.similarity import SimilarityEngine
+
+
+def test_fan_out_streams_every_spec(mock_server):
+    server = mock_server(ttft=0.01, chunk_rate=0, chunks=20)
+    results = fan_out("hi", [server.spec()] * 3, concurrency=3)
+    assert server.requests == 3
+    assert server.max_active_streams >= 2  # 三个请求同时在流式输出
+    for result in results:
+        assert result.ok
+        assert len(result.text.split()) == 20
+        assert result.ttft is not None and result.ttft >= 0.01
+        assert result.usage["completion_tokens"] == 20
+        assert not result.usage_estimated
+
+
+def test_fan_out_isolates_failures(mock_server):
+    good = mock_server(ttft=0, chunk_rate=0, chunks=5)
+    bad = mock_server(error_rate=1.0, error_status=400)
+    results = fan_out("hi", [good.spec(), bad.spec()])
+    assert results[0].ok and results[0].text
+    assert not results[1].ok
+    assert "400" in results[1].error
+
+
+def test_fan_out_timeout(mock_server):
+    server = mock_server(ttft=0, chunk_rate=20, chunks=50)
+    results = fan_out("hi", [server.spec()], timeout=0.2)
+    assert not results[0].ok
+    assert results[0].timed_out
+
+
+def test_reasoning_model_events(mock_server):
+    server = mock_server(ttft=0, chunk_rate=0, chunks=5, reasoning_chunks=4)
+    events = []
+    results = fan_out("hi", [server.spec("deepseek-reasoner")], on_event=lambda spec, e: events.append(e.kind))
+    result = results[0]
+    assert result.ok
+    assert len(result.reasoning.split()) == 4
+    assert events.count(REASONING) == 4
+    assert events.count(TEXT) == 5
+
+
+def test_similarity_over_live_streams(mock_server):
+    server = mock_server(ttft=0, chunk_rate=0, chunks=30)
+    specs = [server.spec(), server.spec()]
+    names = {id(specs[0]): "a", id(specs[1]): "b"}
+    engine = SimilarityEngine(names.values())
+
+    def on_event(spec, event):
+        engine.feed_event(names[id(spec)], event)
+
+    fan_out("hi", specs, on_event=on_event)
+    engine.finish("a")
+    engine.finish("b")
+    assert engine.text("a") and engine.text("a") == engine.text("b")
+    assert engine.similarity("a", "b") == 1.0
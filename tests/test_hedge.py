@@ -0,0 +1,46 @@
+from evalai.fanout import fan_out
+from evalai.hedge import HedgePolicy, HedgeStats
+from evalai.ratelimit import RateLimiter
+
+
+def test_should_hedge_respects_budget_at_low_volume():
+    policy = HedgePolicy(delay=0.01, max_rate=0.1)
+    stats = HedgeStats()
+    stats.requests = 1
+    assert not policy.should_hedge(stats)  # 第一个请求不能把对冲率拉到 100%
+    stats.requests = 10
+    assert policy.should_hedge(stats)
+    stats.hedged = 1
+    assert not policy.should_hedge(stats)
+
+
+def test_slow_first_token_triggers_hedge(mock_server):
+    server = mock_server(ttft=0.3, chunk_rate=0, chunks=5)
+    policy = HedgePolicy(delay=0.05, max_rate=1.0)
+    results = fan_out("hi", [server.spec()] * 2, hedge=policy)
+    assert all(r.ok for r in results)
+    stats = policy.stats()["deepseek-chat"]
+    assert stats["hedged"] == 2
+    assert stats["extra_tokens"] > 0
+    assert stats["extra_cost"] > 0
+
+
+def test_hedge_rate_stays_within_max_rate(mock_server):
+    server = mock_server(ttft=0.2, chunk_rate=0, chunks=5)
+    policy = HedgePolicy(delay=0.02, max_rate=0.25)
+    results = fan_out("hi", [server.spec()] * 8, concurrency=1, hedge=policy)
+    assert all(r.ok for r in results)
+    stats = policy.stats()["deepseek-chat"]
+    assert stats["requests"] == 8
+    assert stats["hedged"] == 2
+
+
+def test_rate_limit_queueing_does_not_trigger_hedge(mock_server):
+    server = mock_server(ttft=0.0, chunk_rate=0, chunks=5)
+    policy = HedgePolicy(delay=0.1, max_rate=1.0)
+    limiter = RateLimiter(tpm=60_000)  # 桶容量 10000，每秒补充 1000
+    limiter.reserve("deepseek-chat", "mock", 10_000)  # 先用掉全部额度，请求要排队约半秒才能发出
+    results = fan_out("hi", [server.spec()] * 2, concurrency=2, hedge=policy, limiter=limiter)
+    assert all(r.ok for r in results)
+    assert limiter.stats()["deepseek-chat"]["waited"] > 0
+    assert policy.stats()["deepseek-chat"]["hedged"] == 0
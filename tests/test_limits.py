@@ -0,0 +1,48 @@
+from evalai.estimate import HeuristicCounter
+from evalai.events import TEXT, USAGE, StreamEvent
+from evalai.fanout import fan_out
+from evalai.limits import MAX_TOKENS, OutputLimits, Truncated, limit_events
+from evalai.metrics import StreamMetrics
+
+
+def _words(n: int, word: str = "alpha "):
+    for _ in range(n):
+        yield StreamEvent(TEXT, word)
+
+
+def _truncation(events):
+    last = events[-1]
+    assert last.kind == USAGE
+    return last.data if isinstance(last.data, Truncated) else None
+
+
+def test_short_chunks_are_not_rounded_up_one_by_one():
+    # "alpha " 按 0.25 token/字符约 1.5 token；逐个分片向上取整会算成 2，提前截断
+    events = list(limit_events(_words(100), OutputLimits(max_tokens=20), StreamMetrics(), server_capped=False))
+    texts = [e for e in events if e.kind == TEXT]
+    assert _truncation(events).reason == MAX_TOKENS
+    assert len(texts) == 15  # 15 × 1.5 = 22.5 ≥ 20 × 1.1
+    assert events[-1].usage["completion_tokens"] == 23
+
+
+def test_weight_is_unrounded():
+    counter = HeuristicCounter(0.6, 0.25)
+    assert counter.weight("好") == 0.6
+    assert counter.count("好") == 1
+    assert sum(counter.weight("好") for _ in range(10)) == sum([0.6] * 10)
+
+
+def test_server_cap_keeps_vendor_usage(mock_server):
+    # 厂商已按 max_tokens 停止：不应被客户端按估算值抢先截断，用量以厂商返回为准
+    server = mock_server(ttft=0.0, chunk_rate=0, chunks=50)
+    [result] = fan_out("hi", [server.spec()], limits=OutputLimits(max_tokens=5))
+    assert result.ok
+    assert result.truncated is None
+    assert result.usage["completion_tokens"] == 5
+    assert not result.usage_estimated
+
+
+def test_client_side_backstop_when_vendor_ignores_cap():
+    events = list(limit_events(_words(1000), OutputLimits(max_tokens=10), StreamMetrics()))
+    assert _truncation(events).reason == MAX_TOKENS
+    assert len([e for e in events if e.kind == TEXT]) == 14  # 14 × 1.5 = 21 ≥ 10 × 2
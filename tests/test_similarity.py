@@ -0,0 +1,60 @@
+import random
+
+import numpy as np
+import pytest
+
+from evalai.similarity import SimilarityEngine, _shingle_hashes, tokenize
+
+
+def _exact_jaccard(a: str, b: str, k: int) -> float:
+    def shingles(text):
+        tokens = [m.group().lower() for m in tokenize(text)]
+        return {tuple(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+    sa, sb = shingles(a), shingles(b)
+    return len(sa & sb) / len(sa | sb)
+
+
+def _pair(rng: random.Random, length: int = 300, keep: float = 0.6):
+    vocab = [f"w{i}" for i in range(400)]
+    a = [rng.choice(vocab) for _ in range(length)]
+    b = [word if rng.random() < keep else rng.choice(vocab) for word in a]
+    return " ".join(a), " ".join(b)
+
+
+def test_minhash_matches_exact_jaccard():
+    rng = random.Random(7)
+    errors = []
+    for seed in range(20):
+        a, b = _pair(rng, keep=rng.uniform(0.5, 0.95))
+        engine = SimilarityEngine(["a", "b"], seed=seed)
+        for name, text in (("a", a), ("b", b)):
+            # 按流式分片喂入，增量更新与一次性计算应当一致
+            for i in range(0, len(text), 17):
+                engine.feed(name, text[i:i + 17])
+            engine.finish(name)
+        exact = _exact_jaccard(a, b, engine.shingle_size)
+        errors.append(engine.similarity("a", "b") - exact)
+    errors = np.abs(errors)
+    # num_perm=128 时标准差约 0.04
+    assert errors.mean() < 0.05
+    assert errors.max() < 0.2
+
+
+def test_identical_and_disjoint_texts():
+    engine = SimilarityEngine(["a", "b", "c"])
+    text = "the quick brown fox jumps over the lazy dog " * 5
+    engine.feed("a", text)
+    engine.feed("b", text)
+    engine.feed("c", "完全 不同 的 一段 中文 回答 内容")
+    for name in engine.names:
+        engine.finish(name)
+    assert engine.similarity("a", "b") == pytest.approx(1.0)
+    assert engine.similarity("a", "c") < 0.05
+
+
+def test_shingle_hash_of_zero_ids_is_not_zero():
+    hashes = _shingle_hashes(np.zeros(5, dtype=np.int32), 3)
+    assert len(hashes) == 3
+    assert (hashes != 0).all()
+    assert (hashes < (1 << 32)).all()